@@ -8,6 +8,7 @@ from ally.environments.base import (Environment, EnvironmentFeedback,
 from ally.memories.base import Memory
 from ally.runtimes.base import Runtime
 from ally.skills.base import Skill
+from ally.skills.memo import SkillOutputMemo
 from ally.skills.skillset import LinearSkillSet, SkillSet
 from ally.utils.internal_data import InternalDataFrame
 from ally.utils.logs import (highlight_differences, is_running_in_jupyter,
@@ -164,6 +165,27 @@ class Agent(BaseModel, ABC):
 		predictions = self.skills.apply(input, runtime=runtime)
 		return predictions
 
+	async def arun(
+		self,
+		input: InternalDataFrame = None,
+		runtime: Optional[str] = None
+	) -> InternalDataFrame:
+		"""
+		Asynchronously runs the agent on the specified dataset.
+
+		Args:
+			dataset (Union[Dataset, InternalDataFrame]): The dataset to run the agent on.
+			runtime (str, optional): The name of the runtime to use. Defaults to None, use the default runtime.
+
+		Returns:
+			InternalDataFrame: The dataset with the agent's predictions.
+		"""
+		if input is None:
+			input = self.environment.get_data_batch()
+		runtime = self.get_runtime(runtime=runtime)
+		predictions = await self.skills.aapply(input, runtime=runtime)
+		return predictions
+
 	def select_skill_to_train(
 		self, 
 		feedback: EnvironmentFeedback,
@@ -203,6 +225,8 @@ class Agent(BaseModel, ABC):
 		num_feedbacks: Optional[int] = None,
 		runtime: Optional[str] = None,
 		teacher_runtime: Optional[str] = None,
+		memo: Optional[SkillOutputMemo] = None,
+		num_candidates: int = 1,
 	):
 		"""
 		Enables the agent to learn and improve its skills based on interactions with its environment.
@@ -214,10 +238,18 @@ class Agent(BaseModel, ABC):
 			num_feedbacks (int, optional): The number of predictions to request feedback for. Defaults to None.
 			runtime (str, optional): The runtime to be used for the learning process. Defaults to None.
 			teacher_runtime (str, optional): The teacher runtime to be used for the learning process. Defaults to None.
+			memo (SkillOutputMemo, optional): Memo of the skill outputs shared by the iterations, so only the
+				improved skills and the skills depending on their outputs are applied again. Pass one to read
+				the LLM calls it saved with `memo.get_stats()`. Defaults to a new memo.
+			num_candidates (int, optional): Number of candidate instructions generated for a skill at each iteration.
+				With more than one, the candidates are scored against the environment on held-out rows with the
+				runtime, and the best one is kept. Defaults to 1, the new instruction is adopted.
 		"""
 
 		runtime: Runtime = self.get_runtime(runtime=runtime)
 		teacher_runtime: Runtime = self.get_teacher_runtime(runtime=teacher_runtime)
+		if memo is None:
+			memo = SkillOutputMemo()
 
 		for iteration in range(learning_iterations):
 
@@ -225,7 +257,7 @@ class Agent(BaseModel, ABC):
 
 			inputs = self.environment.get_data_batch(batch_size)
 
-			predictions = self.skills.apply(inputs, runtime=runtime)
+			predictions = self.skills.apply(inputs, runtime=runtime, memo=memo)
 
 			feedback = self.environment.get_feedback(self.skills, predictions, num_feedbacks=num_feedbacks)
 			# TODO: this is just pretty printing - remove later for efficiency
@@ -254,14 +286,22 @@ class Agent(BaseModel, ABC):
 					f"Accuracy = {accuracy[skill_output] * 100:0.2f}%",
 					style="bold red",
 				)
-				old_instructions = skill.instructions
+				old_instructions = skill.instruction_template
+				candidate_kwargs = {}
+				if num_candidates > 1:
+					candidate_kwargs = dict(
+						num_candidates=num_candidates,
+						student_runtime=runtime,
+						scorer=lambda candidate_predictions, skill_output=skill_output: self.environment.get_feedback(
+							self.skills, candidate_predictions).get_accuracy()[skill_output],
+					)
 				skill.improve(
-					predictions, skill_output, feedback, runtime=teacher_runtime
+					predictions, skill_output, feedback, runtime=teacher_runtime, **candidate_kwargs
 				)
 				if is_running_in_jupyter():
-					highlight_differences(old_instructions, skill.instructions)
+					highlight_differences(old_instructions, skill.instruction_template)
 				else:
-					print_text(skill.instructions, style="bold green")
+					print_text(skill.instruction_template, style="bold green")
 
 				if skill_name == first_skill_with_errors:
 						break
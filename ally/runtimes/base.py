@@ -1,5 +1,12 @@
+import asyncio
 import enum
-from typing import Any, Dict, List, Optional
+import hashlib
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import (Any, AsyncIterator, Callable, Dict, Iterator, List,
+                    Optional, Tuple)
 
 from langchain.chains.llm import LLMChain
 from langchain.llms.base import BaseLLM
@@ -7,15 +14,91 @@ from langchain.output_parsers import ResponseSchema, StructuredOutputParser
 from langchain.prompts.chat import (ChatPromptTemplate,
                                     HumanMessagePromptTemplate,
                                     SystemMessagePromptTemplate)
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 from tqdm import tqdm
+from tqdm.asyncio import tqdm_asyncio
 
+from ally.runtimes.cache import LRUCache, ResponseCache
+from ally.runtimes.checkpoint import BatchCheckpoint
+from ally.runtimes.coalescing import SingleFlight
+from ally.runtimes.metrics import (CallMetrics, MetricsRecorder,
+                                   current_call_metrics, estimate_cost)
+from ally.runtimes.rate_limit import (RateLimiter, get_rate_limiter,
+                                      is_rate_limit_error)
+from ally.utils.concurrency import apply_concurrently, map_concurrently
 from ally.utils.internal_data import InternalDataFrame
 from ally.utils.logs import print_text
+from ally.utils.output_parsing import extract_json, extract_structured_output
+from ally.utils.retry_parser import NAIVE_COMPLETION_RETRY_WITH_ERROR
+from ally.utils.templates import compile_template
+from ally.utils.tokens import count_tokens
 
 tqdm.pandas()
+
+PACKED_ITEMS_TEMPLATE = '{items}'
+
+PACKED_FORMAT_INSTRUCTIONS = """The input contains several numbered items. Process each item independently.
+The output should be a markdown code snippet containing a JSON list with one object per item, in the same order as the items, formatted in the following schema, including the leading and trailing "```json" and "```":
+
+```json
+[
+	{{
+		"item": int  // the number of the item
+{fields}
+	}},
+	...
+]
+```"""
+
+SAMPLES_FORMAT_INSTRUCTIONS = """Generate {num_samples} different outputs for the input.{prompt_set}
+The output should be a markdown code snippet containing a JSON list of {num_samples} objects, formatted in the following schema, including the leading and trailing "```json" and "```":
+
+```json
+[
+	{{
+		"item": int  // the number of the output, from 1 to {num_samples}
+{fields}
+	}},
+	...
+]
+```"""
+
+SAMPLES_SET_INSTRUCTIONS = """
+This is the set {prompt_number} of {num_prompts}: its outputs must be different from the outputs of the other sets."""
 	
 	
+class RecordStream:
+	"""
+	Async iterator over the tokens of a streamed completion.
+
+	Once the iteration is over, `text` holds the full completion and `output` the record parsed
+	by the output parser, as returned by `Runtime.record_to_record`.
+	"""
+
+	def __init__(self, tokens: AsyncIterator[str], parse: Callable[[str], Dict[str, Any]]):
+		self._tokens = tokens
+		self._parse = parse
+		self.text: Optional[str] = None
+		self.output: Optional[Dict[str, Any]] = None
+
+	def __aiter__(self) -> AsyncIterator[str]:
+		return self._iterate()
+
+	async def _iterate(self) -> AsyncIterator[str]:
+		parts = []
+		async for token in self._tokens:
+			parts.append(token)
+			yield token
+		self.text = ''.join(parts)
+		self.output = self._parse(self.text)
+
+	async def collect(self) -> Dict[str, Any]:
+		"""Consumes the remaining tokens and returns the parsed record."""
+		async for _ in self:
+			pass
+		return self.output
+
+
 class RuntimeModelType(enum.Enum):
 	"""Enumeration for LLM runtime model types."""
 	OpenAI = 'OpenAI'
@@ -28,12 +111,77 @@ class Runtime(BaseModel):
 	Attributes:
 		llm_runtime_type (LLMRuntimeModelType): Type of the LLM runtime. Defaults to OpenAI.
 		llm_params (Dict[str, str]): Parameters for the LLM runtime.
+		max_workers (int): Maximum number of records processed concurrently in `batch_to_batch`
+			and in the async methods. Defaults to 1, which processes the records sequentially.
+		chain_cache_size (int): Maximum number of prepared chains and output parsers kept in memory,
+			keyed by the templates and the LLM parameters. 0 disables the cache. Defaults to 128.
+		response_cache (ResponseCache, optional): Cache of the raw LLM responses keyed by the rendered
+			prompt and the LLM parameters. Calls with temperature > 0 bypass the cache. Defaults to None.
+		records_per_prompt (int): Number of records packed as numbered items into a single prompt
+			by `batch_to_batch`. Records that can't be recovered from the packed response are processed
+			one by one. Defaults to 1, which disables packing.
+		samples_per_prompt (int): Maximum number of outputs requested by a single prompt, as a JSON list,
+			by `record_to_batch`. The prompts of a batch run concurrently, and the outputs that can't be
+			recovered from the responses are generated one by one. Defaults to 10, 1 sends a prompt per output.
+		requests_per_minute (int, optional): Requests budget shared by the runtimes using the same
+			model and credentials. Defaults to None, unlimited.
+		tokens_per_minute (int, optional): Tokens budget shared by the runtimes using the same
+			model and credentials, estimated with tiktoken. Defaults to None, unlimited.
+		max_rate_limit_retries (int): Number of retries of a call failing with a rate-limit error
+			when a budget is set. Defaults to 3.
+		parse_retry_with_llm (bool): Ask the LLM to fix the outputs that neither the output parser nor
+			the local JSON extraction can parse, instead of returning the raw completion. Defaults to False.
+		max_parse_retries (int): Number of LLM calls made to fix an output when `parse_retry_with_llm`
+			is set. Defaults to 1.
+		coalesce_requests (bool): Make a single LLM call for the records rendering the same prompt:
+			duplicates in a batch are processed once, and concurrent calls with a prompt already in flight
+			wait for its parsed output instead of calling the LLM again. Calls with temperature > 0 are not
+			coalesced. Defaults to True.
+		checkpoint_path (str, optional): Append-only file where `batch_to_batch` and `abatch_to_batch` save
+			the outputs of the processed rows, keyed by row index and prompt hash. The rows found in the file
+			are not processed again, so an interrupted job resumes where it stopped. Defaults to None.
+		checkpoint_interval (int): Number of rows processed between two writes to the checkpoint file.
+			Defaults to 100.
+		collect_metrics (bool): Record the metrics of every LLM call: queue wait, LLM latency, parse time,
+			tokens, estimated cost and parse fallbacks, aggregated per skill by `get_metrics`. Defaults to True.
+		track_tokens (bool): Count the prompt and completion tokens of every LLM call with tiktoken, and
+			estimate its cost, in the call metrics. Defaults to False: the tokens and the cost are not
+			recorded, which saves encoding every prompt and completion.
+		metrics_hooks (List[Callable[[CallMetrics], None]]): Functions called with the metrics of every
+			LLM call, e.g. a `MetricsRecorder` shared by several runtimes. Defaults to none.
+		token_prices (Tuple[float, float], optional): USD per 1K prompt and completion tokens used to
+			estimate the cost of the calls. Defaults to None, the OpenAI price of the model if known.
 	"""
 	verbose: bool = False
 	llm_params: Dict[str, str] = {}
+	max_workers: int = 1
+	chain_cache_size: int = 128
+	response_cache: Optional[ResponseCache] = None
+	records_per_prompt: int = 1
+	samples_per_prompt: int = 10
+	requests_per_minute: Optional[int] = None
+	tokens_per_minute: Optional[int] = None
+	max_rate_limit_retries: int = 3
+	parse_retry_with_llm: bool = False
+	max_parse_retries: int = 1
+	coalesce_requests: bool = True
+	checkpoint_path: Optional[str] = None
+	checkpoint_interval: int = 100
+	collect_metrics: bool = True
+	metrics_hooks: List[Callable[[CallMetrics], None]] = []
+	track_tokens: bool = False
+	token_prices: Optional[Tuple[float, float]] = None
 	_llm: BaseLLM
 	_chain: LLMChain
 	_llm_prompt_template: str
+	_semaphore: Optional[asyncio.Semaphore] = None
+	_semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+	_chain_cache: Optional[LRUCache] = None
+	_parse_stats: Dict[str, int] = PrivateAttr(default_factory=dict)
+	_parse_stats_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+	_single_flight: SingleFlight = PrivateAttr(default_factory=SingleFlight)
+	_checkpoint: Optional[BatchCheckpoint] = None
+	_metrics: MetricsRecorder = PrivateAttr(default_factory=MetricsRecorder)
 
 	class Config:
 		arbitrary_types_allowed = True
@@ -55,11 +203,356 @@ class Runtime(BaseModel):
 		# )
 		pass
 	
+	def _get_semaphore(self) -> asyncio.Semaphore:
+		"""Returns the semaphore limiting the number of concurrent async calls on the running event loop."""
+		loop = asyncio.get_running_loop()
+		if self._semaphore is None or self._semaphore_loop is not loop:
+			self._semaphore = asyncio.Semaphore(max(1, self.max_workers))
+			self._semaphore_loop = loop
+		return self._semaphore
+
+	async def aclose(self):
+		"""Releases the resources of the async calls made on the running event loop, e.g. HTTP sessions.
+		Does nothing by default."""
+		pass
+
+	def _verify_input(self, record) -> Dict[str, Any]:
+		if not isinstance(record, dict):
+			record = record.to_dict()
+		else:
+			record = record.copy()
+		verified_input = record
+		# exclude guidance parameter from input
+		if self.verbose:
+			print_text(str(verified_input))
+		return verified_input
+
+	def _count_parse(self, outcome: str):
+		with self._parse_stats_lock:
+			self._parse_stats[outcome] = self._parse_stats.get(outcome, 0) + 1
+
+	def parse_stats(self) -> Dict[str, int]:
+		"""Returns how the structured outputs were parsed.
+
+		Returns:
+			Dict[str, int]: Number of outputs accepted by the output parser (`parsed`), recovered by
+				the local JSON extraction (`fast_path`), sent back to the LLM (`llm_retry`)
+				and returned as raw completions (`raw`).
+		"""
+		with self._parse_stats_lock:
+			return {
+				outcome: self._parse_stats.get(outcome, 0)
+				for outcome in ('parsed', 'fast_path', 'llm_retry', 'raw')
+			}
+
+	def _parse_output(
+		self,
+		result,
+		output_parser=None,
+		chain=None,
+		verified_input: Optional[Dict[str, Any]] = None,
+		skill_name: Optional[str] = None,
+	) -> Dict[str, Any]:
+		if output_parser is None:
+			return {'output': str(result)}
+		start_time = time.perf_counter()
+		outcome, verified_output = self._parse_structured_output(
+			result, output_parser, chain, verified_input, skill_name)
+		self._count_parse(outcome)
+		metrics = self._get_call_metrics()
+		if metrics is not None:
+			metrics.parse_time += time.perf_counter() - start_time
+			metrics.parse_fallback = metrics.parse_fallback or outcome != 'parsed'
+		return verified_output
+
+	def _parse_structured_output(
+		self,
+		result,
+		output_parser,
+		chain=None,
+		verified_input: Optional[Dict[str, Any]] = None,
+		skill_name: Optional[str] = None,
+	) -> Tuple[str, Dict[str, Any]]:
+		"""Returns how the output was parsed (see `parse_stats`) and the parsed output."""
+		try:
+			return 'parsed', output_parser.parse(result)
+		except Exception as e:
+			error = e
+		output_fields = [schema.name for schema in getattr(output_parser, 'response_schemas', [])]
+		verified_output = extract_structured_output(str(result), output_fields) if output_fields else None
+		if verified_output is not None:
+			return 'fast_path', verified_output
+		if self.parse_retry_with_llm and chain is not None and verified_input is not None:
+			# last resort, costs an extra LLM call per attempt, made like the other calls of the runtime
+			retry_chain = self._prepare_parse_retry_chain()
+			prompt = chain.prompt.format(**verified_input)
+			for _ in range(self.max_parse_retries):
+				result = self._call_chain(
+					retry_chain, {'prompt': prompt, 'completion': str(result), 'error': repr(error)}, skill_name)
+				try:
+					return 'llm_retry', output_parser.parse(result)
+				except Exception as e:
+					error = e
+		return 'raw', {'output': str(result)}
+
+	def _get_runtime_name(self) -> str:
+		return self.__class__.__name__
+
+	@contextmanager
+	def _track_call(self, skill_name: Optional[str] = None) -> Iterator[Optional[CallMetrics]]:
+		"""Collects the metrics of the LLM call made in the block and passes them to the hooks."""
+		if not self.collect_metrics and not self.metrics_hooks:
+			yield None
+			return
+		metrics = CallMetrics(runtime_name=self._get_runtime_name(), skill_name=skill_name)
+		token = current_call_metrics.set((self, metrics))
+		try:
+			yield metrics
+		except BaseException as e:
+			metrics.error = type(e).__name__
+			raise
+		finally:
+			current_call_metrics.reset(token)
+			if self.collect_metrics:
+				self._metrics.record(metrics)
+			for hook in self.metrics_hooks:
+				hook(metrics)
+
+	def _get_call_metrics(self) -> Optional[CallMetrics]:
+		"""Returns the metrics of the call this runtime is making in the current thread or task, if any."""
+		current = current_call_metrics.get()
+		if current is None or current[0] is not self:
+			return None
+		return current[1]
+
+	def _record_queue_wait(self, start_time: float):
+		metrics = self._get_call_metrics()
+		if metrics is not None:
+			metrics.queue_wait += time.perf_counter() - start_time
+
+	def _record_llm_call(
+		self,
+		chain,
+		verified_input: Dict[str, Any],
+		result: str,
+		start_time: float,
+		queue_wait: float,
+	):
+		"""Records the latency of a call started at `start_time`, excluding the time spent waiting
+		after `queue_wait` was read, and its tokens and cost if `track_tokens` is set."""
+		metrics = self._get_call_metrics()
+		if metrics is None:
+			return
+		metrics.llm_latency += time.perf_counter() - start_time - (metrics.queue_wait - queue_wait)
+		if not self.track_tokens:
+			return
+		model_name = self.llm_params.get('model_name')
+		metrics.prompt_tokens += self._count_prompt_tokens(chain, verified_input)
+		metrics.completion_tokens += count_tokens(str(result), model_name)
+		metrics.cost = estimate_cost(model_name, metrics.prompt_tokens, metrics.completion_tokens, self.token_prices)
+
+	def get_metrics(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+		"""Returns the metrics of the LLM calls aggregated per runtime and skill, see `MetricsRecorder.to_dict`."""
+		return self._metrics.to_dict()
+
+	def get_metrics_prometheus(self, prefix: str = 'ally') -> str:
+		"""Returns the metrics of the LLM calls in the Prometheus text format, see `MetricsRecorder.to_prometheus`."""
+		return self._metrics.to_prometheus(prefix)
+
+	def _render_messages(self, chain, verified_input: Dict[str, Any]) -> List[Tuple[str, str]]:
+		"""Returns the messages sent to the LLM as (role, content) pairs."""
+		messages = chain.prompt.format_messages(**verified_input)
+		return [(message.type, message.content) for message in messages]
+
+	def _get_response_cache_key(
+		self, chain, verified_input: Dict[str, Any], skill_name: Optional[str] = None) -> Optional[str]:
+		"""Returns the response cache key of the rendered prompt, or None if the call must not be cached."""
+		if self.response_cache is None:
+			return None
+		if float(self.llm_params.get('temperature') or 0.0) > 0:
+			# sampled completions are not reproducible
+			self.response_cache.record_bypass(skill_name)
+			return None
+		return self.response_cache.make_key(
+			self._render_messages(chain, verified_input), self.llm_params)
+
+	def _get_coalescing_key(self, chain, verified_input: Dict[str, Any]) -> Optional[str]:
+		"""Returns the key identifying the prompt of a call, or None if the call must not be coalesced.
+
+		The prompt is rendered from the variables of the chain prompt, so the key hashes their values
+		along with the chain instead of rendering the messages.
+		"""
+		if not self.coalesce_requests or float(self.llm_params.get('temperature') or 0.0) > 0:
+			return None
+		variables = getattr(chain.prompt, 'input_variables', None)
+		if variables is None:
+			return ResponseCache.make_key(self._render_messages(chain, verified_input), self.llm_params)
+		payload = json.dumps(
+			[id(chain), [verified_input.get(variable) for variable in variables]], default=str)
+		return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+	def coalescing_stats(self) -> Dict[str, int]:
+		"""Returns the number of calls made by the records and the number of calls saved by coalescing.
+
+		Returns:
+			Dict[str, int]: The number of calls (`num_calls`) and of records that reused the output
+				of another record with the same prompt (`num_coalesced`).
+		"""
+		return self._single_flight.get_stats()
+
+	def _get_rate_limit_key(self) -> str:
+		"""Returns the key of the rate limiter shared by the runtimes calling the same model with the same credentials."""
+		return f'{self.__class__.__name__}:{self.llm_params.get("model_name")}'
+
+	def _get_rate_limiter(self, key: Optional[str] = None) -> Optional[RateLimiter]:
+		"""Returns the shared rate limiter of the runtime, or None if no budget is set.
+
+		Args:
+			key (str, optional): Limiter key overriding `_get_rate_limit_key()`.
+		"""
+		if not self.requests_per_minute and not self.tokens_per_minute:
+			return None
+		return get_rate_limiter(
+			key or self._get_rate_limit_key(),
+			requests_per_minute=self.requests_per_minute,
+			tokens_per_minute=self.tokens_per_minute,
+			max_concurrency=self.max_workers,
+		)
+
+	def _count_prompt_tokens(self, chain, verified_input: Dict[str, Any]) -> int:
+		model_name = self.llm_params.get('model_name')
+		return sum(
+			count_tokens(content, model_name) for _, content in self._render_messages(chain, verified_input))
+
+	def _estimate_tokens(self, chain, verified_input: Dict[str, Any]) -> int:
+		"""Estimates the prompt tokens plus the completion tokens budget of a call."""
+		return self._count_prompt_tokens(chain, verified_input) + int(self.llm_params.get('max_tokens') or 0)
+
+	def _run_chain(self, chain, verified_input: Dict[str, Any]) -> str:
+		return self._run_rate_limited(chain, verified_input, self._get_rate_limiter())
+
+	async def _arun_chain(self, chain, verified_input: Dict[str, Any]) -> str:
+		return await self._arun_rate_limited(chain, verified_input, self._get_rate_limiter())
+
+	def _run_rate_limited(
+			self, chain, verified_input: Dict[str, Any], rate_limiter: Optional[RateLimiter]) -> str:
+		if rate_limiter is None:
+			return chain.run(verified_input)
+		tokens = self._estimate_tokens(chain, verified_input)
+		for attempt in range(self.max_rate_limit_retries + 1):
+			start_time = time.perf_counter()
+			rate_limiter.acquire(tokens)
+			self._record_queue_wait(start_time)
+			try:
+				result = chain.run(verified_input)
+			except Exception as e:
+				rate_limited = is_rate_limit_error(e)
+				rate_limiter.release(rate_limited=rate_limited)
+				if rate_limited and attempt < self.max_rate_limit_retries:
+					continue
+				raise
+			rate_limiter.release()
+			return result
+
+	async def _arun_rate_limited(
+			self, chain, verified_input: Dict[str, Any], rate_limiter: Optional[RateLimiter]) -> str:
+		if rate_limiter is None:
+			return await chain.arun(verified_input)
+		tokens = self._estimate_tokens(chain, verified_input)
+		for attempt in range(self.max_rate_limit_retries + 1):
+			start_time = time.perf_counter()
+			await rate_limiter.aacquire(tokens)
+			self._record_queue_wait(start_time)
+			try:
+				result = await chain.arun(verified_input)
+			except Exception as e:
+				rate_limited = is_rate_limit_error(e)
+				rate_limiter.release(rate_limited=rate_limited)
+				if rate_limited and attempt < self.max_rate_limit_retries:
+					continue
+				raise
+			rate_limiter.release()
+			return result
+
+	def _call_chain(self, chain, verified_input: Dict[str, Any], skill_name: Optional[str] = None) -> str:
+		cache_key = self._get_response_cache_key(chain, verified_input, skill_name)
+		if cache_key is not None:
+			result = self.response_cache.lookup(cache_key, skill_name)
+			if result is not None:
+				self._record_cache_hit()
+				return result
+		metrics = self._get_call_metrics()
+		queue_wait = metrics.queue_wait if metrics else 0.0
+		start_time = time.perf_counter()
+		result = self._run_chain(chain, verified_input)
+		self._record_llm_call(chain, verified_input, result, start_time, queue_wait)
+		if cache_key is not None:
+			self.response_cache.store(cache_key, result)
+		return result
+
+	async def _acall_chain(self, chain, verified_input: Dict[str, Any], skill_name: Optional[str] = None) -> str:
+		cache_key = self._get_response_cache_key(chain, verified_input, skill_name)
+		if cache_key is not None:
+			result = self.response_cache.lookup(cache_key, skill_name)
+			if result is not None:
+				self._record_cache_hit()
+				return result
+		start_time = time.perf_counter()
+		async with self._get_semaphore():
+			self._record_queue_wait(start_time)
+			metrics = self._get_call_metrics()
+			queue_wait = metrics.queue_wait if metrics else 0.0
+			start_time = time.perf_counter()
+			result = await self._arun_chain(chain, verified_input)
+			self._record_llm_call(chain, verified_input, result, start_time, queue_wait)
+		if cache_key is not None:
+			self.response_cache.store(cache_key, result)
+		return result
+
+	def _record_cache_hit(self):
+		metrics = self._get_call_metrics()
+		if metrics is not None:
+			metrics.cached = True
+
+	async def _astream_chain(self, chain, verified_input: Dict[str, Any]) -> AsyncIterator[str]:
+		"""Yields the tokens of the completion as the LLM of the chain produces them."""
+		messages = chain.prompt.format_messages(**verified_input)
+		async for chunk in chain.llm.astream(messages):
+			yield getattr(chunk, 'content', chunk)
+
+	async def _astream_call_chain(
+			self, chain, verified_input: Dict[str, Any], skill_name: Optional[str] = None) -> AsyncIterator[str]:
+		cache_key = self._get_response_cache_key(chain, verified_input, skill_name)
+		if cache_key is not None:
+			result = self.response_cache.lookup(cache_key, skill_name)
+			if result is not None:
+				yield result
+				return
+		rate_limiter = self._get_rate_limiter()
+		parts = []
+		async with self._get_semaphore():
+			# tokens can't be taken back, so rate-limit errors are not retried once streaming started
+			if rate_limiter is not None:
+				await rate_limiter.aacquire(self._estimate_tokens(chain, verified_input))
+			try:
+				async for token in self._astream_chain(chain, verified_input):
+					parts.append(token)
+					yield token
+			except Exception as e:
+				if rate_limiter is not None:
+					rate_limiter.release(rate_limited=is_rate_limit_error(e))
+				raise
+			if rate_limiter is not None:
+				rate_limiter.release()
+		if cache_key is not None:
+			self.response_cache.store(cache_key, ''.join(parts))
+
 	def _process_record(
 		self,
 		record,
 		chain,
 		output_parser=None,
+		skill_name: Optional[str] = None,
 	) -> Dict[str, Any]:
 		"""
 		Processes a single record using langchain chain
@@ -67,35 +560,73 @@ class Runtime(BaseModel):
 			record (dict or InternalDataFrame): The record to be processed.
 			chain (callable): The langchain chain for processing.
 			output_parser: the output parser
-			outputs (list of str, optional): Specific output fields to extract from the result.
+			skill_name (str, optional): The name of the skill processing the record.
 
 		Returns:
 			dict: Processed output for the record.
 		"""
-		if not isinstance(record, dict):
-			record = record.to_dict()
-		else:
-			record = record.copy()
-		verified_input = record
-		# exclude guidance parameter from input
-		if self.verbose:
-			print_text(str(verified_input))
-		result = chain.run(
-				verified_input
-		)
-		# TODO fix the output parser later
-		if output_parser is None:
-			verified_output = {'output': str(result)}
-		else:
-			try:
-				verified_output = output_parser.parse(result)
-			except Exception as e:
-				verified_output = {'output': str(result)}
-				# retry_parser = RetryWithErrorOutputParser.from_llm(
-				# 	parser=output_parser, llm=self._llm, max_retries=1)
-				# verified_output = retry_parser.parse_with_chat_prompt_template(
-				# 	result, self._llm_prompt_template, verified_input)
-		return verified_output
+		verified_input = self._verify_input(record)
+		key = self._get_coalescing_key(chain, verified_input)
+		if key is None:
+			return self._process_verified_input(verified_input, chain, output_parser, skill_name)
+		output = self._single_flight.do(
+			key, lambda: self._process_verified_input(verified_input, chain, output_parser, skill_name))
+		# the callers sharing the output get their own copy
+		return dict(output)
+
+	def _process_verified_input(
+		self,
+		verified_input: Dict[str, Any],
+		chain,
+		output_parser=None,
+		skill_name: Optional[str] = None,
+	) -> Dict[str, Any]:
+		with self._track_call(skill_name):
+			result = self._call_chain(chain, verified_input, skill_name)
+			return self._parse_output(result, output_parser, chain, verified_input, skill_name)
+
+	async def _aprocess_record(
+		self,
+		record,
+		chain,
+		output_parser=None,
+		skill_name: Optional[str] = None,
+	) -> Dict[str, Any]:
+		"""
+		Asynchronously processes a single record using the async call path of the langchain chain.
+		At most `max_workers` records are processed at the same time on an event loop.
+
+		Args:
+			record (dict or InternalDataFrame): The record to be processed.
+			chain (callable): The langchain chain for processing.
+			output_parser: the output parser
+			skill_name (str, optional): The name of the skill processing the record.
+
+		Returns:
+			dict: Processed output for the record.
+		"""
+		verified_input = self._verify_input(record)
+		key = self._get_coalescing_key(chain, verified_input)
+		if key is None:
+			return await self._aprocess_verified_input(verified_input, chain, output_parser, skill_name)
+		output = await self._single_flight.ado(
+			key, lambda: self._aprocess_verified_input(verified_input, chain, output_parser, skill_name))
+		return dict(output)
+
+	async def _aprocess_verified_input(
+		self,
+		verified_input: Dict[str, Any],
+		chain,
+		output_parser=None,
+		skill_name: Optional[str] = None,
+	) -> Dict[str, Any]:
+		with self._track_call(skill_name):
+			result = await self._acall_chain(chain, verified_input, skill_name)
+			if self.parse_retry_with_llm:
+				# the parse retry calls the LLM synchronously
+				return await asyncio.to_thread(
+					self._parse_output, result, output_parser, chain, verified_input, skill_name)
+			return self._parse_output(result, output_parser)
 	
 	def get_input_prompt(self, input_template: str) -> HumanMessagePromptTemplate:
 		"""Generates an input prompt from the provided template.
@@ -139,8 +670,42 @@ class Runtime(BaseModel):
 		return SystemMessagePromptTemplate.from_template(
 			instruction_template + "\n{format_instructions}")
 	
+	def _validate_batch(self, batch: InternalDataFrame, input_template: str, instruction_template: Optional[str]):
+		"""Checks that the fields of the templates are columns of the batch, before any LLM call."""
+		for template in (input_template, instruction_template):
+			compile_template(template or '').validate(batch.columns)
+
+	def _get_chain_cache(self) -> LRUCache:
+		if self._chain_cache is None:
+			self._chain_cache = LRUCache(max_size=self.chain_cache_size)
+		return self._chain_cache
+
+	def chain_cache_info(self) -> Dict[str, Any]:
+		"""Returns the hit/miss statistics of the prepared chains cache.
+
+		Returns:
+			Dict[str, Any]: The cache statistics, see `LRUCache.info`.
+		"""
+		return self._get_chain_cache().info()
+
 	def _prepare_chain_and_params(
 			self, input_template, output_template, instruction_template):
+		"""Returns the chain and the output parser for the templates, reusing
+		the ones prepared by a previous call with the same templates and LLM parameters."""
+		key = (
+			input_template,
+			json.dumps(output_template, sort_keys=True, default=str),
+			instruction_template,
+			json.dumps(self.llm_params, sort_keys=True, default=str),
+		)
+		return self._get_chain_cache().get_or_create(
+			key,
+			lambda: self._build_chain_and_params(
+				input_template, output_template, instruction_template),
+		)
+
+	def _build_chain_and_params(
+			self, input_template, output_template, instruction_template):
 		output_parser, format_instructions = self.get_output_parser(output_template)
 		input_prompt = self.get_input_prompt(input_template)
 		instruction_prompt = self.get_instruction_prompt(
@@ -154,12 +719,283 @@ class Runtime(BaseModel):
 		self._create_chain()
 		return self._chain, output_parser
 
+	def _prepare_packed_chain(self, output_template, instruction_template):
+		"""Returns the chain processing several numbered records in a single prompt."""
+		key = (
+			PACKED_ITEMS_TEMPLATE,
+			json.dumps(output_template, sort_keys=True, default=str),
+			instruction_template,
+			json.dumps(self.llm_params, sort_keys=True, default=str),
+		)
+		return self._get_chain_cache().get_or_create(
+			key,
+			lambda: self._build_packed_chain(output_template, instruction_template),
+		)
+
+	def _prepare_parse_retry_chain(self):
+		"""Returns the chain asking the LLM to fix a completion that can't be parsed."""
+		key = (NAIVE_COMPLETION_RETRY_WITH_ERROR, json.dumps(self.llm_params, sort_keys=True, default=str))
+		return self._get_chain_cache().get_or_create(key, self._build_parse_retry_chain)
+
+	def _build_parse_retry_chain(self):
+		self._llm_prompt_template = ChatPromptTemplate(
+			messages=[self.get_input_prompt(NAIVE_COMPLETION_RETRY_WITH_ERROR)])
+		self._create_chain()
+		return self._chain
+
+	def _format_item_fields(self, output_template) -> str:
+		return '\n'.join(
+			f'\t\t"{field["name"]}": string  // {field["description"]}' for field in output_template)
+
+	def _build_packed_chain(self, output_template, instruction_template):
+		fields = self._format_item_fields(output_template)
+		self._llm_prompt_template = ChatPromptTemplate(
+			messages=[
+				self.get_input_prompt(PACKED_ITEMS_TEMPLATE),
+				self.get_instruction_prompt(instruction_template),
+			],
+			partial_variables={
+				"format_instructions": PACKED_FORMAT_INSTRUCTIONS.format(fields=fields)
+			}
+		)
+		self._create_chain()
+		return self._chain
+
+	def _prepare_samples_chain(
+			self, input_template, output_template, instruction_template, num_samples: int,
+			prompt_number: int = 1, num_prompts: int = 1):
+		"""Returns the chain generating several numbered outputs for a record in a single prompt.
+		The prompts of a record are numbered so they don't share their cached response."""
+		key = (
+			SAMPLES_FORMAT_INSTRUCTIONS,
+			num_samples,
+			prompt_number,
+			num_prompts,
+			input_template,
+			json.dumps(output_template, sort_keys=True, default=str),
+			instruction_template,
+			json.dumps(self.llm_params, sort_keys=True, default=str),
+		)
+		return self._get_chain_cache().get_or_create(
+			key,
+			lambda: self._build_samples_chain(
+				input_template, output_template, instruction_template, num_samples, prompt_number, num_prompts),
+		)
+
+	def _build_samples_chain(
+			self, input_template, output_template, instruction_template, num_samples: int,
+			prompt_number: int = 1, num_prompts: int = 1):
+		prompt_set = ''
+		if num_prompts > 1:
+			prompt_set = SAMPLES_SET_INSTRUCTIONS.format(prompt_number=prompt_number, num_prompts=num_prompts)
+		self._llm_prompt_template = ChatPromptTemplate(
+			messages=[
+				self.get_input_prompt(input_template),
+				self.get_instruction_prompt(instruction_template),
+			],
+			partial_variables={
+				"format_instructions": SAMPLES_FORMAT_INSTRUCTIONS.format(
+					num_samples=num_samples, prompt_set=prompt_set, fields=self._format_item_fields(output_template))
+			}
+		)
+		self._create_chain()
+		return self._chain
+
+	def _get_sample_counts(self, output_batch_size: int) -> List[int]:
+		"""Splits the outputs to generate into prompts of at most `samples_per_prompt` outputs."""
+		return [
+			min(self.samples_per_prompt, output_batch_size - start)
+			for start in range(0, output_batch_size, self.samples_per_prompt)
+		]
+
+	def _generate_samples(
+		self,
+		prompt: Tuple[Any, int],
+		record: Dict[str, Any],
+		output_fields: List[str],
+		skill_name: Optional[str] = None,
+	) -> List[Optional[Dict[str, Any]]]:
+		chain, num_samples = prompt
+		verified_input = self._verify_input(record)
+		with self._track_call(skill_name) as metrics:
+			result = self._call_chain(chain, verified_input, skill_name)
+			start_time = time.perf_counter()
+			outputs = self._parse_packed_output(result, output_fields, num_samples)
+			if metrics is not None:
+				metrics.parse_time += time.perf_counter() - start_time
+				metrics.parse_fallback = any(output is None for output in outputs)
+		return outputs
+
+	async def _agenerate_samples(
+		self,
+		prompt: Tuple[Any, int],
+		record: Dict[str, Any],
+		output_fields: List[str],
+		skill_name: Optional[str] = None,
+	) -> List[Optional[Dict[str, Any]]]:
+		chain, num_samples = prompt
+		verified_input = self._verify_input(record)
+		with self._track_call(skill_name) as metrics:
+			result = await self._acall_chain(chain, verified_input, skill_name)
+			start_time = time.perf_counter()
+			outputs = self._parse_packed_output(result, output_fields, num_samples)
+			if metrics is not None:
+				metrics.parse_time += time.perf_counter() - start_time
+				metrics.parse_fallback = any(output is None for output in outputs)
+		return outputs
+
+	def _can_sample(self, output_template, output_batch_size: int) -> bool:
+		return output_batch_size > 1 and self.samples_per_prompt > 1 and bool(output_template)
+
+	def _prepare_samples_prompts(
+			self, input_template, output_template, instruction_template, output_batch_size: int) -> List[Tuple[Any, int]]:
+		"""Returns the chain of every prompt generating the outputs of a record, with its number of outputs."""
+		sample_counts = self._get_sample_counts(output_batch_size)
+		return [
+			(
+				self._prepare_samples_chain(
+					input_template, output_template, instruction_template, num_samples,
+					prompt_number=prompt_number, num_prompts=len(sample_counts)),
+				num_samples,
+			)
+			for prompt_number, num_samples in enumerate(sample_counts, start=1)
+		]
+
+	def _get_missing_samples(self, sample_outputs: List[List[Optional[Dict[str, Any]]]]) -> Tuple[List[Optional[Dict[str, Any]]], List[int]]:
+		outputs = [output for outputs in sample_outputs for output in outputs]
+		missing_positions = [position for position, output in enumerate(outputs) if output is None]
+		if missing_positions and self.verbose:
+			print_text(f'{len(missing_positions)} of {len(outputs)} samples failed to parse, generating them one by one')
+		return outputs, missing_positions
+
+	def _can_pack(self, output_template, instruction_template) -> bool:
+		if self.records_per_prompt <= 1 or not output_template:
+			return False
+		# the instruction is shared by all the packed records, so it can't depend on a record
+		return not compile_template(instruction_template or '').fields
+
+	def _parse_packed_output(
+			self, result: str, output_fields: List[str], num_items: int) -> List[Optional[Dict[str, Any]]]:
+		"""Splits the response to a packed prompt into per-record outputs.
+		Items that are missing or lack some output fields are returned as None."""
+		outputs = [None] * num_items
+		items = extract_json(result)
+		if isinstance(items, dict):
+			items = [items]
+		if not isinstance(items, list):
+			return outputs
+		for position, item in enumerate(items):
+			if not isinstance(item, dict):
+				continue
+			try:
+				index = int(item.get('item', position + 1)) - 1
+			except (TypeError, ValueError):
+				continue
+			if 0 <= index < num_items and all(field in item for field in output_fields):
+				outputs[index] = {field: item[field] for field in output_fields}
+		return outputs
+
+	def _process_packed_records(
+		self,
+		records: List[Dict[str, Any]],
+		chain,
+		input_template: str,
+		output_fields: List[str],
+		skill_name: Optional[str] = None,
+	) -> List[Optional[Dict[str, Any]]]:
+		template = compile_template(input_template)
+		items = '\n\n'.join(
+			f'### Item {position + 1}\n{template.render(record)}'
+			for position, record in enumerate(records)
+		)
+		if self.verbose:
+			print_text(items)
+		with self._track_call(skill_name) as metrics:
+			result = self._call_chain(chain, {'items': items}, skill_name)
+			start_time = time.perf_counter()
+			outputs = self._parse_packed_output(result, output_fields, len(records))
+			if metrics is not None:
+				metrics.parse_time += time.perf_counter() - start_time
+				metrics.parse_fallback = any(output is None for output in outputs)
+		return outputs
+
+	def _packed_batch_to_batch(
+		self,
+		batch: InternalDataFrame,
+		input_template: str,
+		output_template: List[Dict],
+		instruction_template: Optional[str] = None,
+		skill_name: Optional[str] = None,
+		on_output: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+	) -> InternalDataFrame:
+		records = batch.to_dict(orient='records')
+		if not records:
+			return InternalDataFrame(index=batch.index)
+		chain = self._prepare_packed_chain(output_template, instruction_template)
+		output_fields = [field['name'] for field in output_template]
+
+		def process_pack(start: int) -> List[Optional[Dict[str, Any]]]:
+			pack_output = self._process_packed_records(
+				records[start:start + self.records_per_prompt],
+				chain=chain,
+				input_template=input_template,
+				output_fields=output_fields,
+				skill_name=skill_name,
+			)
+			if on_output is not None:
+				for offset, output in enumerate(pack_output):
+					if output is not None:
+						on_output(start + offset, output)
+			return pack_output
+
+		pack_outputs = map_concurrently(
+			process_pack,
+			range(0, len(records), self.records_per_prompt),
+			max_workers=self.max_workers,
+			unit='prompt',
+		)
+		outputs = [output for pack_output in pack_outputs for output in pack_output]
+
+		# process the records that were not recovered from the packed responses one by one
+		failed_positions = [position for position, output in enumerate(outputs) if output is None]
+		if failed_positions:
+			if self.verbose:
+				print_text(f'{len(failed_positions)} of {len(records)} packed records failed to parse, retrying them one by one')
+			single_chain, output_parser = self._prepare_chain_and_params(
+				input_template, output_template, instruction_template)
+			single_outputs = self._process_records(
+				records, failed_positions, single_chain, output_parser, skill_name, on_output)
+			for position, output in zip(failed_positions, single_outputs):
+				outputs[position] = output
+		return InternalDataFrame(outputs, index=batch.index)
+
+	def _process_records(
+		self,
+		records: List[Dict[str, Any]],
+		positions: List[int],
+		chain,
+		output_parser,
+		skill_name: Optional[str] = None,
+		on_output: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+	) -> List[Dict[str, Any]]:
+		"""Processes the records at the given positions one by one, calling `on_output` with the position
+		and the output of each record as soon as it is processed."""
+		def process(position: int) -> Dict[str, Any]:
+			output = self._process_record(
+				records[position], chain=chain, output_parser=output_parser, skill_name=skill_name)
+			if on_output is not None:
+				on_output(position, output)
+			return output
+
+		return map_concurrently(process, positions, max_workers=self.max_workers, unit='row')
+
 	def record_to_record(
 		self,
 		record: Dict[str, Any],
 		input_template: str,
 		output_template: Optional[str] = None,
 		instruction_template: Optional[str] = None,
+		skill_name: Optional[str] = None,
 	) -> Dict[str, Any]:
 		"""Processes a record using the provided templates and instructions.
 
@@ -168,6 +1004,7 @@ class Runtime(BaseModel):
 			input_template (str): Template for human message input prompt
 			output_template (str): Template for output parser
 			instructions (str): Instructions for the system message prompt
+			skill_name (str, optional): Name of the skill making the call, used for statistics.
 		Returns:
 				Dict[str, Any]: The processed record.
 		"""
@@ -178,6 +1015,7 @@ class Runtime(BaseModel):
 			record=record,
 			chain=chain,
 			output_parser=output_parser,
+			skill_name=skill_name,
 		)
 		return output
 	
@@ -187,6 +1025,7 @@ class Runtime(BaseModel):
 		input_template: str,
 		output_template: Optional[List[Dict]] = None,
 		instruction_template: Optional[str] = None,
+		skill_name: Optional[str] = None,
 	) -> InternalDataFrame:
 		"""Processes a batch of records using the provided templates 
 		and instructions.
@@ -197,19 +1036,162 @@ class Runtime(BaseModel):
 				output_template (str): Template for output processing.
 				instructions (str): Instructions for guidance.
 				during batch processing.
+				skill_name (str, optional): Name of the skill making the call, used for statistics.
 
 		Returns:
 				InternalDataFrame: The processed batch of records.
 		"""
 		# TODO will fix the output template later		
+		self._validate_batch(batch, input_template, instruction_template)
 		chain, output_parser = self._prepare_chain_and_params(
 			input_template, output_template, instruction_template)
+		if self.checkpoint_path:
+			checkpoint, keys, outputs = self._restore_checkpoint(batch, chain)
+			positions = [position for position, output in enumerate(outputs) if output is None]
+			try:
+				self._coalesced_batch_to_batch(
+					batch.iloc[positions], chain, output_parser,
+					input_template, output_template, instruction_template, skill_name,
+					on_output=self._get_checkpoint_saver(checkpoint, batch, keys, outputs, positions))
+			finally:
+				checkpoint.flush()
+			return InternalDataFrame(outputs, index=batch.index)
+		return self._coalesced_batch_to_batch(
+			batch, chain, output_parser, input_template, output_template, instruction_template, skill_name)
+
+	def _coalesced_batch_to_batch(
+		self,
+		batch: InternalDataFrame,
+		chain,
+		output_parser,
+		input_template: str,
+		output_template: Optional[List[Dict]] = None,
+		instruction_template: Optional[str] = None,
+		skill_name: Optional[str] = None,
+		on_output: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+	) -> InternalDataFrame:
+		first_positions = self._get_first_prompt_positions(batch, chain)
+		if first_positions is None:
+			return self._process_batch(
+				batch, chain, output_parser, input_template, output_template, instruction_template, skill_name,
+				on_output)
+
+		# process each prompt once, then copy the outputs to the records sharing it
+		unique_positions = sorted(set(first_positions))
+		self._single_flight.record_coalesced(len(batch) - len(unique_positions))
+		on_unique_output = None
+		if on_output is not None:
+			sharing_positions = {}
+			for position, first_position in enumerate(first_positions):
+				sharing_positions.setdefault(first_position, []).append(position)
+
+			def on_unique_output(i: int, output: Dict[str, Any]):
+				for position in sharing_positions[unique_positions[i]]:
+					on_output(position, output)
+
+		output = self._process_batch(
+			batch.iloc[unique_positions], chain, output_parser,
+			input_template, output_template, instruction_template, skill_name, on_unique_output)
+		output_positions = {position: i for i, position in enumerate(unique_positions)}
+		output = output.iloc[[output_positions[position] for position in first_positions]]
+		output.index = batch.index
+		return output
+
+	def _get_checkpoint(self) -> BatchCheckpoint:
+		if self._checkpoint is None or self._checkpoint.path != self.checkpoint_path:
+			self._checkpoint = BatchCheckpoint(self.checkpoint_path)
+		self._checkpoint.interval = self.checkpoint_interval
+		return self._checkpoint
+
+	def _restore_checkpoint(
+			self, batch: InternalDataFrame, chain) -> Tuple[BatchCheckpoint, List[str], List[Optional[Dict[str, Any]]]]:
+		"""Returns the checkpoint, the prompt hash of each row, and the outputs of the rows found
+		in the checkpoint, None for the rows to process."""
+		checkpoint = self._get_checkpoint()
+		keys = [
+			ResponseCache.make_key(self._render_messages(chain, record), self.llm_params)
+			for record in batch.to_dict(orient='records')
+		]
+		outputs = [checkpoint.lookup(index, key) for index, key in zip(batch.index, keys)]
+		if self.verbose:
+			num_restored = sum(output is not None for output in outputs)
+			print_text(f'{num_restored} of {len(outputs)} rows restored from {self.checkpoint_path}')
+		return checkpoint, keys, outputs
+
+	def _get_checkpoint_saver(
+		self,
+		checkpoint: BatchCheckpoint,
+		batch: InternalDataFrame,
+		keys: List[str],
+		outputs: List[Optional[Dict[str, Any]]],
+		positions: List[int],
+	) -> Callable[[int, Dict[str, Any]], None]:
+		"""Returns a callback storing the output of the i-th row to process and adding it to the checkpoint,
+		which writes it with the next `checkpoint_interval` outputs."""
+		def save(i: int, output: Dict[str, Any]):
+			position = positions[i]
+			outputs[position] = output
+			checkpoint.add(batch.index[position], keys[position], output)
+
+		return save
+
+	def _get_first_prompt_positions(self, batch: InternalDataFrame, chain) -> Optional[List[int]]:
+		"""Returns, for each record of the batch, the position of the first record with the same prompt,
+		or None if the prompts are not coalesced or are all different."""
+		if not self.coalesce_requests or len(batch) < 2:
+			return None
+		first_positions = []
+		seen = {}
+		for position, record in enumerate(batch.to_dict(orient='records')):
+			key = self._get_coalescing_key(chain, record)
+			if key is None:
+				return None
+			first_positions.append(seen.setdefault(key, position))
+		if len(seen) == len(first_positions):
+			return None
+		return first_positions
+
+	def _process_batch(
+		self,
+		batch: InternalDataFrame,
+		chain,
+		output_parser,
+		input_template: str,
+		output_template: Optional[List[Dict]] = None,
+		instruction_template: Optional[str] = None,
+		skill_name: Optional[str] = None,
+		on_output: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+	) -> InternalDataFrame:
+		if self._can_pack(output_template, instruction_template):
+			return self._packed_batch_to_batch(
+				batch,
+				input_template=input_template,
+				output_template=output_template,
+				instruction_template=instruction_template,
+				skill_name=skill_name,
+				on_output=on_output,
+			)
+		if on_output is not None:
+			outputs = self._process_records(
+				batch.to_dict(orient='records'), list(range(len(batch))), chain, output_parser, skill_name, on_output)
+			return InternalDataFrame(outputs, index=batch.index)
+		if self.max_workers > 1:
+			return apply_concurrently(
+				batch,
+				self._process_record,
+				max_workers=self.max_workers,
+				verbose=self.verbose,
+				chain=chain,
+				output_parser=output_parser,
+				skill_name=skill_name,
+			)
 		output = batch.progress_apply(
 				self._process_record,
 				axis=1,
 				result_type='expand',
 				chain=chain,
 				output_parser=output_parser,
+				skill_name=skill_name,
 		)
 		return output
 
@@ -219,7 +1201,8 @@ class Runtime(BaseModel):
 		input_template: str,
 		output_template: Optional[List[Dict]] = None,
 		instruction_template: Optional[str] = None,
-		output_batch_size: int = 1
+		output_batch_size: int = 1,
+		skill_name: Optional[str] = None,
 	) -> InternalDataFrame:
 		"""
 			Processes a record and return a batch.
@@ -230,17 +1213,221 @@ class Runtime(BaseModel):
 				instructions_template (str): The instructions template.
 				output_template (str): The output template.
 				instruction_template (str): The instruction template.
-				output_batch_size (int): The batch size for the output. Defaults to 1..
+				output_batch_size (int): The number of outputs generated for the record, `samples_per_prompt`
+					at a time by a single prompt. Defaults to 1.
+				skill_name (str, optional): Name of the skill making the call, used for statistics.
 			Returns:
 				InternalDataFrame: The processed batch.
 		"""
-		batch = InternalDataFrame([record] * output_batch_size)
-		return self.batch_to_batch(
-			batch=batch,
-			input_template=input_template,
-			output_template=output_template,
-			instruction_template=instruction_template,
+		if not self._can_sample(output_template, output_batch_size):
+			batch = InternalDataFrame([record] * output_batch_size)
+			return self.batch_to_batch(
+				batch=batch,
+				input_template=input_template,
+				output_template=output_template,
+				instruction_template=instruction_template,
+				skill_name=skill_name,
+			)
+		sample_outputs = map_concurrently(
+			self._generate_samples,
+			self._prepare_samples_prompts(input_template, output_template, instruction_template, output_batch_size),
+			max_workers=self.max_workers,
+			unit='prompt',
+			record=record,
+			output_fields=[field['name'] for field in output_template],
+			skill_name=skill_name,
 		)
+		outputs, missing_positions = self._get_missing_samples(sample_outputs)
+		if missing_positions:
+			missing_outputs = self.batch_to_batch(
+				batch=InternalDataFrame([record] * len(missing_positions)),
+				input_template=input_template,
+				output_template=output_template,
+				instruction_template=instruction_template,
+				skill_name=skill_name,
+			)
+			for position, output in zip(missing_positions, missing_outputs.to_dict(orient='records')):
+				outputs[position] = output
+		return InternalDataFrame(outputs)
 
-			 
-	
+	async def arecord_to_record(
+		self,
+		record: Dict[str, Any],
+		input_template: str,
+		output_template: Optional[str] = None,
+		instruction_template: Optional[str] = None,
+		skill_name: Optional[str] = None,
+	) -> Dict[str, Any]:
+		"""Asynchronously processes a record using the provided templates and instructions.
+
+		Args:
+			record (Dict[str, Any]): The record data to be processed.
+			input_template (str): Template for human message input prompt
+			output_template (str): Template for output parser
+			instructions (str): Instructions for the system message prompt
+			skill_name (str, optional): Name of the skill making the call, used for statistics.
+		Returns:
+				Dict[str, Any]: The processed record.
+		"""
+		chain, output_parser = self._prepare_chain_and_params(
+			input_template, output_template, instruction_template)
+		return await self._aprocess_record(
+			record=record,
+			chain=chain,
+			output_parser=output_parser,
+			skill_name=skill_name,
+		)
+
+	def astream_record_to_record(
+		self,
+		record: Dict[str, Any],
+		input_template: str,
+		output_template: Optional[str] = None,
+		instruction_template: Optional[str] = None,
+		skill_name: Optional[str] = None,
+	) -> RecordStream:
+		"""Processes a record like `arecord_to_record`, streaming the completion tokens as they arrive.
+
+		Args:
+			record (Dict[str, Any]): The record data to be processed.
+			input_template (str): Template for human message input prompt
+			output_template (str): Template for output parser
+			instructions (str): Instructions for the system message prompt
+			skill_name (str, optional): Name of the skill making the call, used for statistics.
+		Returns:
+				RecordStream: Async iterator over the tokens. Its `output` holds the processed record
+					once the iteration is over.
+
+		Examples:
+			>>> stream = runtime.astream_record_to_record(record, '{text}', output_template, instruction)
+			>>> async for token in stream:
+			...     print(token, end='')
+			>>> stream.output
+		"""
+		chain, output_parser = self._prepare_chain_and_params(
+			input_template, output_template, instruction_template)
+		verified_input = self._verify_input(record)
+		return RecordStream(
+			self._astream_call_chain(chain, verified_input, skill_name),
+			lambda text: self._parse_output(text, output_parser, chain, verified_input, skill_name),
+		)
+
+	async def abatch_to_batch(
+		self,
+		batch: InternalDataFrame,
+		input_template: str,
+		output_template: Optional[List[Dict]] = None,
+		instruction_template: Optional[str] = None,
+		skill_name: Optional[str] = None,
+	) -> InternalDataFrame:
+		"""Asynchronously processes a batch of records using the provided templates
+		and instructions. At most `max_workers` records are in flight at the same time.
+
+		Args:
+				batch (InternalDataFrame): The batch of records to be processed.
+				input_template (str): Template for input processing.
+				output_template (str): Template for output processing.
+				instructions (str): Instructions for guidance.
+				skill_name (str, optional): Name of the skill making the call, used for statistics.
+
+		Returns:
+				InternalDataFrame: The processed batch of records, in the original index order.
+		"""
+		self._validate_batch(batch, input_template, instruction_template)
+		chain, output_parser = self._prepare_chain_and_params(
+			input_template, output_template, instruction_template)
+		if self.checkpoint_path:
+			checkpoint, keys, outputs = self._restore_checkpoint(batch, chain)
+			positions = [position for position, output in enumerate(outputs) if output is None]
+			try:
+				await self._abatch_to_batch(
+					batch.iloc[positions], chain, output_parser, skill_name,
+					on_output=self._get_checkpoint_saver(checkpoint, batch, keys, outputs, positions))
+			finally:
+				checkpoint.flush()
+			return InternalDataFrame(outputs, index=batch.index)
+		return await self._abatch_to_batch(batch, chain, output_parser, skill_name)
+
+	async def _abatch_to_batch(
+		self,
+		batch: InternalDataFrame,
+		chain,
+		output_parser,
+		skill_name: Optional[str] = None,
+		on_output: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+	) -> InternalDataFrame:
+		records = batch.to_dict(orient='records')
+		if not records:
+			return InternalDataFrame(index=batch.index)
+
+		async def process(position: int) -> Dict[str, Any]:
+			output = await self._aprocess_record(
+				record=records[position],
+				chain=chain,
+				output_parser=output_parser,
+				skill_name=skill_name,
+			)
+			if on_output is not None:
+				on_output(position, output)
+			return output
+
+		tasks = [asyncio.ensure_future(process(position)) for position in range(len(records))]
+		try:
+			outputs = await tqdm_asyncio.gather(*tasks, unit='row')
+		except BaseException:
+			# don't leave the other records running after a failure, as map_concurrently does
+			for task in tasks:
+				task.cancel()
+			raise
+		return InternalDataFrame(outputs, index=batch.index)
+
+	async def arecord_to_batch(
+		self,
+		record: Dict[str, Any],
+		input_template: str,
+		output_template: Optional[List[Dict]] = None,
+		instruction_template: Optional[str] = None,
+		output_batch_size: int = 1,
+		skill_name: Optional[str] = None,
+	) -> InternalDataFrame:
+		"""
+			Asynchronously processes a record and return a batch.
+
+			Args:
+				record (Dict[str, str]): The record to process.
+				input_template (str): The input template.
+				output_template (str): The output template.
+				instruction_template (str): The instruction template.
+				output_batch_size (int): The number of outputs generated for the record, `samples_per_prompt`
+					at a time by a single prompt. Defaults to 1.
+				skill_name (str, optional): Name of the skill making the call, used for statistics.
+			Returns:
+				InternalDataFrame: The processed batch.
+		"""
+		if not self._can_sample(output_template, output_batch_size):
+			batch = InternalDataFrame([record] * output_batch_size)
+			return await self.abatch_to_batch(
+				batch=batch,
+				input_template=input_template,
+				output_template=output_template,
+				instruction_template=instruction_template,
+				skill_name=skill_name,
+			)
+		prompts = self._prepare_samples_prompts(input_template, output_template, instruction_template, output_batch_size)
+		output_fields = [field['name'] for field in output_template]
+		sample_outputs = await asyncio.gather(*[
+			self._agenerate_samples(prompt, record, output_fields, skill_name)
+			for prompt in prompts
+		])
+		outputs, missing_positions = self._get_missing_samples(sample_outputs)
+		if missing_positions:
+			missing_outputs = await self.abatch_to_batch(
+				batch=InternalDataFrame([record] * len(missing_positions)),
+				input_template=input_template,
+				output_template=output_template,
+				instruction_template=instruction_template,
+				skill_name=skill_name,
+			)
+			for position, output in zip(missing_positions, missing_outputs.to_dict(orient='records')):
+				outputs[position] = output
+		return InternalDataFrame(outputs)
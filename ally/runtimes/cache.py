@@ -0,0 +1,284 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from pydantic import BaseModel, PrivateAttr
+
+
+class LRUCache:
+	"""
+	Thread-safe, size-bounded mapping that evicts the least recently used entries.
+
+	Hits and misses are counted so the efficiency of the cache can be monitored,
+	and the time spent creating missing values is accumulated in `build_seconds`.
+
+	Attributes:
+		max_size (int): Maximum number of entries. 0 disables caching.
+	"""
+
+	def __init__(self, max_size: int = 128):
+		self.max_size = max_size
+		self.hits = 0
+		self.misses = 0
+		self.build_seconds = 0.0
+		self._data: OrderedDict = OrderedDict()
+		self._lock = threading.RLock()
+
+	def __len__(self) -> int:
+		return len(self._data)
+
+	def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+		"""
+		Returns the cached value for the key, creating and storing it with `factory` on a miss.
+
+		Args:
+			key (Hashable): The cache key.
+			factory (Callable[[], Any]): Function creating the value when the key is missing.
+
+		Returns:
+			Any: The cached or newly created value.
+		"""
+		with self._lock:
+			if key in self._data:
+				self.hits += 1
+				self._data.move_to_end(key)
+				return self._data[key]
+			self.misses += 1
+			start_time = time.perf_counter()
+			value = factory()
+			self.build_seconds += time.perf_counter() - start_time
+			if self.max_size > 0:
+				self._data[key] = value
+				while len(self._data) > self.max_size:
+					self._data.popitem(last=False)
+			return value
+
+	def clear(self):
+		"""Removes all the entries and resets the counters."""
+		with self._lock:
+			self._data.clear()
+			self.hits = 0
+			self.misses = 0
+			self.build_seconds = 0.0
+
+	def info(self) -> Dict[str, Any]:
+		"""
+		Returns the cache statistics.
+
+		Returns:
+			Dict[str, Any]: hits, misses, current size, maximum size and the total/average time
+			spent creating values. `average_build_seconds * hits` estimates the time saved.
+		"""
+		with self._lock:
+			return {
+				'hits': self.hits,
+				'misses': self.misses,
+				'size': len(self._data),
+				'max_size': self.max_size,
+				'build_seconds': self.build_seconds,
+				'average_build_seconds': self.build_seconds / self.misses if self.misses else 0.0,
+			}
+
+
+class ResponseCache(BaseModel, ABC):
+	"""
+	Base class for LLM response caches.
+
+	Responses are stored by a key computed from the fully rendered prompt and the model parameters.
+	Entries older than `ttl` seconds are considered expired, and at most `max_size` entries are kept.
+	Hits, misses and bypasses (calls that are not cacheable, e.g. with temperature > 0)
+	are counted per skill.
+
+	Attributes:
+		ttl (float, optional): Time to live of the entries in seconds. Defaults to None, entries never expire.
+		max_size (int, optional): Maximum number of entries. Defaults to None, the size is unbounded.
+	"""
+	ttl: Optional[float] = None
+	max_size: Optional[int] = None
+	_stats: Dict[str, Dict[str, int]] = PrivateAttr(default_factory=dict)
+	_stats_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+	@staticmethod
+	def make_key(messages: List[Tuple[str, str]], llm_params: Dict[str, Any]) -> str:
+		"""
+		Computes the cache key of a request.
+
+		Args:
+			messages (List[Tuple[str, str]]): The rendered messages as (role, content) pairs.
+			llm_params (Dict[str, Any]): The model parameters. Parameters holding API keys are ignored.
+
+		Returns:
+			str: The SHA-256 hex digest identifying the request.
+		"""
+		params = {k: v for k, v in llm_params.items() if 'api_key' not in k}
+		payload = json.dumps([messages, params], sort_keys=True, default=str)
+		return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+	def lookup(self, key: str, skill_name: Optional[str] = None) -> Optional[str]:
+		"""
+		Returns the cached response for the key, or None if it is missing or expired.
+
+		Args:
+			key (str): The cache key.
+			skill_name (str, optional): The name of the skill making the request, used for statistics.
+
+		Returns:
+			Optional[str]: The cached response.
+		"""
+		value = self._get(key)
+		self._count(skill_name, 'hits' if value is not None else 'misses')
+		return value
+
+	def store(self, key: str, value: str):
+		"""
+		Stores a response.
+
+		Args:
+			key (str): The cache key.
+			value (str): The raw LLM response.
+		"""
+		self._set(key, value)
+
+	def record_bypass(self, skill_name: Optional[str] = None):
+		"""Counts a request that was not eligible for caching."""
+		self._count(skill_name, 'bypasses')
+
+	def get_stats(self) -> Dict[str, Dict[str, float]]:
+		"""
+		Returns the cache statistics per skill.
+
+		Returns:
+			Dict[str, Dict[str, float]]: hits, misses, bypasses and hit rate per skill name.
+		"""
+		with self._stats_lock:
+			stats = {}
+			for skill_name, counters in self._stats.items():
+				lookups = counters['hits'] + counters['misses']
+				stats[skill_name] = {
+					**counters,
+					'hit_rate': counters['hits'] / lookups if lookups else 0.0,
+				}
+			return stats
+
+	def _count(self, skill_name: Optional[str], counter: str):
+		with self._stats_lock:
+			counters = self._stats.setdefault(
+				skill_name or 'default', {'hits': 0, 'misses': 0, 'bypasses': 0})
+			counters[counter] += 1
+
+	def _is_expired(self, created_at: float) -> bool:
+		return self.ttl is not None and time.time() - created_at > self.ttl
+
+	@abstractmethod
+	def _get(self, key: str) -> Optional[str]:
+		"""
+		Base method for reading a non-expired entry.
+		"""
+
+	@abstractmethod
+	def _set(self, key: str, value: str):
+		"""
+		Base method for writing an entry and evicting the ones over the size limit.
+		"""
+
+	@abstractmethod
+	def clear(self):
+		"""
+		Base method for removing all the entries.
+		"""
+
+
+class InMemoryResponseCache(ResponseCache):
+	"""
+	Response cache keeping the entries in process memory, evicting the least recently used ones.
+	"""
+	_data: OrderedDict = PrivateAttr(default_factory=OrderedDict)
+	_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+	def _get(self, key: str) -> Optional[str]:
+		with self._lock:
+			entry = self._data.get(key)
+			if entry is None:
+				return None
+			created_at, value = entry
+			if self._is_expired(created_at):
+				del self._data[key]
+				return None
+			self._data.move_to_end(key)
+			return value
+
+	def _set(self, key: str, value: str):
+		with self._lock:
+			self._data[key] = (time.time(), value)
+			self._data.move_to_end(key)
+			if self.max_size is not None:
+				while len(self._data) > self.max_size:
+					self._data.popitem(last=False)
+
+	def clear(self):
+		with self._lock:
+			self._data.clear()
+
+
+class SQLiteResponseCache(ResponseCache):
+	"""
+	Response cache persisted in a SQLite database, so that the responses survive process restarts
+	and can be shared by the runs of the same learning loop or benchmark.
+
+	Attributes:
+		path (str): Path of the SQLite database file.
+	"""
+	path: str
+	_connection: Optional[sqlite3.Connection] = PrivateAttr(default=None)
+	_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+	def _get_connection(self) -> sqlite3.Connection:
+		if self._connection is None:
+			self._connection = sqlite3.connect(self.path, check_same_thread=False)
+			self._connection.execute(
+				'CREATE TABLE IF NOT EXISTS responses ('
+				'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+				'created_at REAL NOT NULL, accessed_at REAL NOT NULL)')
+			self._connection.commit()
+		return self._connection
+
+	def _get(self, key: str) -> Optional[str]:
+		with self._lock:
+			connection = self._get_connection()
+			row = connection.execute(
+				'SELECT value, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+			if row is None:
+				return None
+			value, created_at = row
+			if self._is_expired(created_at):
+				connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+				connection.commit()
+				return None
+			connection.execute(
+				'UPDATE responses SET accessed_at = ? WHERE key = ?', (time.time(), key))
+			connection.commit()
+			return value
+
+	def _set(self, key: str, value: str):
+		with self._lock:
+			connection = self._get_connection()
+			now = time.time()
+			connection.execute(
+				'INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) '
+				'VALUES (?, ?, ?, ?)', (key, value, now, now))
+			if self.max_size is not None:
+				connection.execute(
+					'DELETE FROM responses WHERE key NOT IN ('
+					'SELECT key FROM responses ORDER BY accessed_at DESC LIMIT ?)', (self.max_size,))
+			connection.commit()
+
+	def clear(self):
+		with self._lock:
+			connection = self._get_connection()
+			connection.execute('DELETE FROM responses')
+			connection.commit()
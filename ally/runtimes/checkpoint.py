@@ -0,0 +1,104 @@
+import json
+import os
+import threading
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+
+class BatchCheckpoint:
+	"""
+	Append-only JSON lines file holding the outputs of the processed rows, keyed by the row index
+	and the hash of the row prompt.
+
+	Each line is `{"index": ..., "key": ..., "output": {...}}`. A line torn by a crash is ignored
+	when the file is loaded, so the row is processed again. A row whose prompt changed, e.g. after
+	the skill instruction was updated, doesn't match its old line.
+
+	Attributes:
+		path (str): Path of the checkpoint file, created on the first write.
+		interval (int): Number of outputs buffered by `add` before they are written. Defaults to 100.
+		num_restored (int): Number of outputs looked up from the file.
+	"""
+
+	def __init__(self, path: str, interval: int = 100):
+		self.path = path
+		self.interval = interval
+		self.num_restored = 0
+		self._outputs: Dict[Tuple[str, str], Dict[str, Any]] = {}
+		self._buffer: List[Tuple[Hashable, str, Dict[str, Any]]] = []
+		self._lock = threading.Lock()
+		self._torn = False
+		self._load()
+
+	def __len__(self) -> int:
+		return len(self._outputs)
+
+	def _load(self):
+		if not os.path.exists(self.path):
+			return
+		with open(self.path, 'r', encoding='utf-8') as f:
+			for line in f:
+				self._torn = not line.endswith('\n')
+				try:
+					entry = json.loads(line)
+					self._outputs[(str(entry['index']), entry['key'])] = entry['output']
+				except (ValueError, KeyError, TypeError):
+					continue
+
+	def lookup(self, index: Hashable, key: str) -> Optional[Dict[str, Any]]:
+		"""
+		Returns the output of a processed row, or None if the row was not processed with this prompt.
+
+		Args:
+			index (Hashable): The row index.
+			key (str): The hash of the row prompt.
+		"""
+		output = self._outputs.get((str(index), key))
+		if output is not None:
+			self.num_restored += 1
+		return output
+
+	def append(self, entries: Iterable[Tuple[Hashable, str, Dict[str, Any]]]):
+		"""
+		Writes the outputs of processed rows to the file and flushes it to the disk.
+
+		Args:
+			entries (Iterable[Tuple[Hashable, str, Dict[str, Any]]]): (row index, prompt hash, output) triples.
+		"""
+		lines = []
+		with self._lock:
+			for index, key, output in entries:
+				self._outputs[(str(index), key)] = output
+				lines.append(json.dumps({'index': index, 'key': key, 'output': output}, default=str) + '\n')
+			if not lines:
+				return
+			if self._torn:
+				# ends the torn line, so it doesn't swallow the first new line
+				lines.insert(0, '\n')
+				self._torn = False
+			with open(self.path, 'a', encoding='utf-8') as f:
+				f.writelines(lines)
+				f.flush()
+				os.fsync(f.fileno())
+
+	def add(self, index: Hashable, key: str, output: Dict[str, Any]):
+		"""
+		Buffers the output of a processed row, writing the buffer once it holds `interval` outputs.
+		Call `flush` to write the remaining outputs.
+
+		Args:
+			index (Hashable): The row index.
+			key (str): The hash of the row prompt.
+			output (Dict[str, Any]): The output of the row.
+		"""
+		with self._lock:
+			self._buffer.append((index, key, output))
+			if len(self._buffer) < max(1, self.interval):
+				return
+			entries, self._buffer = self._buffer, []
+		self.append(entries)
+
+	def flush(self):
+		"""Writes the buffered outputs."""
+		with self._lock:
+			entries, self._buffer = self._buffer, []
+		self.append(entries)
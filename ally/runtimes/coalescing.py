@@ -0,0 +1,109 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class SingleFlight:
+	"""
+	Runs at most one call per key at a time: the callers arriving while a call with the same key
+	is in flight wait for it and share its result (or its error) instead of making their own call.
+
+	Threads and coroutines are coalesced separately, the coroutines per event loop.
+	"""
+
+	def __init__(self):
+		self.num_calls = 0
+		self.num_coalesced = 0
+		self._lock = threading.Lock()
+		self._calls: Dict[str, Future] = {}
+		self._acalls: Dict[Tuple[int, str], asyncio.Future] = {}
+
+	def do(self, key: str, func: Callable[[], Any]) -> Any:
+		"""
+		Calls `func`, unless a call with the same key is in flight in another thread.
+
+		Args:
+			key (str): The call key, e.g. the hash of the prompt.
+			func (Callable): The call.
+
+		Returns:
+			Any: The result of the call.
+		"""
+		leader = False
+		with self._lock:
+			future = self._calls.get(key)
+			if future is not None:
+				self.num_coalesced += 1
+			else:
+				self.num_calls += 1
+				future = self._calls[key] = Future()
+				future.set_running_or_notify_cancel()
+				leader = True
+		if not leader:
+			return future.result()
+		try:
+			result = func()
+		except BaseException as e:
+			future.set_exception(e)
+			raise
+		else:
+			future.set_result(result)
+			return result
+		finally:
+			with self._lock:
+				del self._calls[key]
+
+	async def ado(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+		"""
+		Awaits `func()`, unless a call with the same key is in flight on the running event loop.
+
+		Args:
+			key (str): The call key, e.g. the hash of the prompt.
+			func (Callable): Function returning the awaitable call.
+
+		Returns:
+			Any: The result of the call.
+		"""
+		loop_key = (id(asyncio.get_running_loop()), key)
+		future = self._acalls.get(loop_key)
+		if future is not None:
+			self.record_coalesced()
+			try:
+				# shielded, so a cancelled waiter doesn't cancel the call of the others
+				return await asyncio.shield(future)
+			except asyncio.CancelledError:
+				if not future.cancelled():
+					raise
+			# the caller making the call was cancelled, the next waiter makes it
+			return await self.ado(key, func)
+		with self._lock:
+			self.num_calls += 1
+		future = self._acalls[loop_key] = asyncio.get_running_loop().create_future()
+		try:
+			result = await func()
+		except asyncio.CancelledError:
+			future.cancel()
+			raise
+		except BaseException as e:
+			future.set_exception(e)
+			# retrieved here so an error without waiters is not reported as never retrieved
+			future.exception()
+			raise
+		else:
+			future.set_result(result)
+			return result
+		finally:
+			del self._acalls[loop_key]
+
+	def record_coalesced(self, count: int = 1):
+		"""Counts calls saved by coalescing outside of `do` and `ado`, e.g. duplicates dropped from a batch."""
+		with self._lock:
+			self.num_coalesced += count
+
+	def get_stats(self) -> Dict[str, int]:
+		"""
+		Returns the number of calls made and the number of calls saved by coalescing.
+		"""
+		with self._lock:
+			return {'num_calls': self.num_calls, 'num_coalesced': self.num_coalesced}
@@ -0,0 +1,243 @@
+import asyncio
+import enum
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from pydantic import PrivateAttr
+
+from ally.runtimes.base import Runtime
+
+OutputGenerator = Callable[[Dict[str, Any], List[str], random.Random], Dict[str, Any]]
+
+
+class LatencyDistribution(enum.Enum):
+	"""Enumeration for the distributions of the simulated call latencies."""
+	Constant = 'constant'  # always `latency`
+	Uniform = 'uniform'  # between `latency - jitter` and `latency + jitter`
+	Normal = 'normal'  # mean `latency`, standard deviation `jitter`
+	LogNormal = 'lognormal'  # median `latency`, shape `jitter`, long tail
+	Exponential = 'exponential'  # mean `latency`
+
+
+class FakeLLMError(Exception):
+	"""Error raised by the simulated calls of `FakeRuntime`."""
+
+	def __init__(self, message: str, status_code: int = 500):
+		super().__init__(message)
+		self.status_code = status_code
+
+
+def default_output_generator(
+		inputs: Dict[str, Any], output_fields: List[str], rng: random.Random) -> Dict[str, Any]:
+	"""Generates a label per output field, drawn from `rng`."""
+	return {field: f'{field}_{rng.randrange(10)}' for field in output_fields}
+
+
+class FakeChain:
+	"""
+	Chain simulating an LLM: it sleeps for a sampled latency, may fail, and answers with the outputs
+	generated for the rendered prompt. Everything is drawn from a random generator seeded
+	with the runtime seed and the prompt, so the results do not depend on the scheduling of the calls.
+	"""
+
+	def __init__(
+		self, prompt, runtime: 'FakeRuntime', output_fields: List[str], packed: bool = False, num_samples: int = 1):
+		self.prompt = prompt
+		self.runtime = runtime
+		self.output_fields = output_fields
+		self.packed = packed
+		self.num_samples = num_samples
+		self.llm = None
+
+	def _simulate(self, inputs: Dict[str, Any]):
+		"""Returns the latency, the error to raise if any, and the completion of a call."""
+		messages = self.prompt.format_messages(**inputs)
+		prompt = '\n'.join(message.content for message in messages)
+		prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+		rng = self.runtime._get_call_rng(prompt_hash)
+		latency = self.runtime._sample_latency(rng)
+		draw = rng.random()
+		error = None
+		if draw < self.runtime.rate_limit_rate:
+			error = FakeLLMError('Simulated rate limit', status_code=429)
+		elif draw < self.runtime.rate_limit_rate + self.runtime.error_rate:
+			error = FakeLLMError('Simulated server error')
+		if error is not None:
+			self.runtime._record_failure(prompt_hash)
+			return latency, error, None
+		return latency, None, self._complete(inputs, rng)
+
+	def _complete(self, inputs: Dict[str, Any], rng: random.Random) -> str:
+		generator = self.runtime.output_generator or default_output_generator
+		if self.packed:
+			items = re.findall(r'### Item (\d+)\n(.*?)(?=\n\n### Item |\Z)', inputs['items'], re.DOTALL)
+			outputs = [
+				{'item': int(number), **generator({'item': text}, self.output_fields, rng)}
+				for number, text in items
+			]
+		elif self.num_samples > 1:
+			outputs = [
+				{'item': number + 1, **generator(inputs, self.output_fields, rng)}
+				for number in range(self.num_samples)
+			]
+		else:
+			outputs = generator(inputs, self.output_fields, rng)
+		draw = rng.random()
+		if draw < self.runtime.truncated_rate:
+			return '```json\n' + json.dumps(outputs)[:-1]
+		if draw < self.runtime.truncated_rate + self.runtime.unfenced_rate:
+			return 'Sure, here is the answer: ' + json.dumps(outputs) + '. Let me know if you need anything else.'
+		return '```json\n' + json.dumps(outputs) + '\n```'
+
+	def run(self, inputs: Dict[str, Any]) -> str:
+		latency, error, completion = self._simulate(inputs)
+		if latency > 0:
+			time.sleep(latency)
+		self.runtime._record_call(latency, error)
+		if error is not None:
+			raise error
+		return completion
+
+	async def arun(self, inputs: Dict[str, Any]) -> str:
+		latency, error, completion = self._simulate(inputs)
+		await asyncio.sleep(latency)
+		self.runtime._record_call(latency, error)
+		if error is not None:
+			raise error
+		return completion
+
+	async def astream(self, inputs: Dict[str, Any]) -> AsyncIterator[str]:
+		"""Yields the completion word by word, spreading the latency evenly over the words."""
+		latency, error, completion = self._simulate(inputs)
+		if error is not None:
+			await asyncio.sleep(latency)
+			self.runtime._record_call(latency, error)
+			raise error
+		tokens = re.findall(r'\S+\s*|\s+', completion) or [completion]
+		for token in tokens:
+			await asyncio.sleep(latency / len(tokens))
+			yield token
+		self.runtime._record_call(latency, None)
+
+
+class FakeRuntime(Runtime):
+	"""
+	Runtime backed by a local fake model, to benchmark the pipelines offline without API costs.
+
+	The latencies, errors and outputs of the simulated calls are deterministic for a given seed
+	and prompt, so runs are reproducible regardless of `max_workers` or the async scheduling.
+	Retried calls draw new outcomes.
+
+	Attributes:
+		latency (float): Typical latency of a call, in seconds. Defaults to 0.
+		jitter (float): Spread of the latency, see LatencyDistribution. Defaults to 0.
+		latency_distribution (LatencyDistribution): Distribution of the latencies. Defaults to Constant.
+		error_rate (float): Probability that a call fails with a server error. Defaults to 0.
+		rate_limit_rate (float): Probability that a call fails with a rate-limit (429) error. Defaults to 0.
+		unfenced_rate (float): Probability that a completion is JSON without code fences surrounded
+			by text, which only the output parsing fast path recovers. Defaults to 0.
+		truncated_rate (float): Probability that a completion is truncated JSON, which can't be parsed.
+			Defaults to 0.
+		output_generator (Callable, optional): Function taking the chain inputs, the output fields
+			and a seeded `random.Random`, and returning the output fields. Defaults to
+			`default_output_generator`.
+		seed (int): Seed of the simulation. Defaults to 0.
+	"""
+
+	latency: float = 0.0
+	jitter: float = 0.0
+	latency_distribution: LatencyDistribution = LatencyDistribution.Constant
+	error_rate: float = 0.0
+	rate_limit_rate: float = 0.0
+	unfenced_rate: float = 0.0
+	truncated_rate: float = 0.0
+	output_generator: Optional[OutputGenerator] = None
+	seed: int = 0
+	_output_fields: List[str] = PrivateAttr(default_factory=list)
+	_failures: Dict[str, int] = PrivateAttr(default_factory=dict)
+	_stats: Dict[str, float] = PrivateAttr(default_factory=dict)
+	_stats_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+	def __init__(self, **kwargs):
+		super().__init__(**kwargs)
+		if not self.llm_params:
+			self.llm_params = {'model_name': 'fake'}
+
+	def _get_call_rng(self, prompt_hash: str) -> random.Random:
+		"""Returns the random generator of the next call with this prompt."""
+		with self._stats_lock:
+			num_failures = self._failures.get(prompt_hash, 0)
+		return random.Random(f'{self.seed}:{prompt_hash}:{num_failures}')
+
+	def _record_failure(self, prompt_hash: str):
+		with self._stats_lock:
+			self._failures[prompt_hash] = self._failures.get(prompt_hash, 0) + 1
+
+	def _sample_latency(self, rng: random.Random) -> float:
+		distribution = self.latency_distribution
+		if distribution == LatencyDistribution.Uniform:
+			latency = rng.uniform(self.latency - self.jitter, self.latency + self.jitter)
+		elif distribution == LatencyDistribution.Normal:
+			latency = rng.gauss(self.latency, self.jitter)
+		elif distribution == LatencyDistribution.LogNormal:
+			latency = rng.lognormvariate(math.log(self.latency), self.jitter) if self.latency > 0 else 0.0
+		elif distribution == LatencyDistribution.Exponential:
+			latency = rng.expovariate(1 / self.latency) if self.latency > 0 else 0.0
+		else:
+			latency = self.latency
+		return max(0.0, latency)
+
+	def _record_call(self, latency: float, error: Optional[Exception]):
+		with self._stats_lock:
+			self._stats['num_calls'] = self._stats.get('num_calls', 0) + 1
+			self._stats['total_latency'] = self._stats.get('total_latency', 0.0) + latency
+			if error is not None:
+				self._stats['num_errors'] = self._stats.get('num_errors', 0) + 1
+
+	def get_stats(self) -> Dict[str, float]:
+		"""
+		Returns the statistics of the simulated calls.
+
+		Returns:
+			Dict[str, float]: The number of calls, the number of failed calls,
+				and the total simulated latency in seconds.
+		"""
+		with self._stats_lock:
+			return {
+				'num_calls': self._stats.get('num_calls', 0),
+				'num_errors': self._stats.get('num_errors', 0),
+				'total_latency': self._stats.get('total_latency', 0.0),
+			}
+
+	def _build_chain_and_params(self, input_template, output_template, instruction_template):
+		self._output_fields = [field['name'] for field in output_template or []]
+		return super()._build_chain_and_params(input_template, output_template, instruction_template)
+
+	def _build_packed_chain(self, output_template, instruction_template):
+		self._output_fields = [field['name'] for field in output_template]
+		chain = super()._build_packed_chain(output_template, instruction_template)
+		chain.packed = True
+		return chain
+
+	def _build_samples_chain(self, input_template, output_template, instruction_template, num_samples: int, *args):
+		self._output_fields = [field['name'] for field in output_template]
+		chain = super()._build_samples_chain(input_template, output_template, instruction_template, num_samples, *args)
+		chain.num_samples = num_samples
+		return chain
+
+	async def _astream_chain(self, chain, verified_input: Dict[str, Any]) -> AsyncIterator[str]:
+		async for token in chain.astream(verified_input):
+			yield token
+
+	def _create_chain(self):
+		self._chain = FakeChain(
+			prompt=self._llm_prompt_template,
+			runtime=self,
+			output_fields=self._output_fields,
+		)
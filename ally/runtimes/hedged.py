@@ -0,0 +1,264 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from pydantic import PrivateAttr
+
+from ally.runtimes.base import Runtime
+from ally.runtimes.latency import LatencyTracker
+
+
+class HedgedChain:
+	"""
+	Chain sending the same prompt to several runtimes, each with its own chain.
+
+	The first runtime is called first. The next one is called when the latency threshold of the
+	last called runtime is crossed without an answer (hedging), or when a call fails (failover).
+	The first answer wins.
+	"""
+
+	def __init__(self, runtime: 'HedgedRuntime', chains: List[Tuple[str, Any]]):
+		self.runtime = runtime
+		self.chains = chains
+		self.prompt = chains[0][1].prompt
+		self.llm = None
+
+	def _call(self, name: str, chain, inputs: Dict[str, Any]) -> str:
+		start_time = time.perf_counter()
+		result = self.runtime.runtimes[name]._call_chain(chain, inputs)
+		self.runtime._latency_trackers[name].record(time.perf_counter() - start_time)
+		return result
+
+	async def _acall(self, name: str, chain, inputs: Dict[str, Any]) -> str:
+		start_time = time.perf_counter()
+		result = await self.runtime.runtimes[name]._acall_chain(chain, inputs)
+		self.runtime._latency_trackers[name].record(time.perf_counter() - start_time)
+		return result
+
+	def _get_timeout(self, position: int, launched_at: float) -> Optional[float]:
+		"""Returns how long to wait for an answer before calling the runtime after `position`."""
+		if position == len(self.chains) - 1:
+			return None
+		delay = self.runtime._get_hedge_delay(self.chains[position][0])
+		if delay is None:
+			return None
+		return max(0.0, launched_at + delay - time.perf_counter())
+
+	def run(self, inputs: Dict[str, Any]) -> str:
+		executor = self.runtime._get_executor()
+		pending = {}
+		last_error = None
+
+		def launch(position: int, reason: Optional[str] = None) -> float:
+			name, chain = self.chains[position]
+			if reason is not None:
+				self.runtime._count(name, reason)
+			pending[executor.submit(self._call, name, chain, inputs)] = name
+			return time.perf_counter()
+
+		position = 0
+		launched_at = launch(position)
+		while pending:
+			done, _ = wait(
+				pending, timeout=self._get_timeout(position, launched_at), return_when=FIRST_COMPLETED)
+			if not done:
+				position += 1
+				launched_at = launch(position, 'num_hedges')
+				continue
+			for future in done:
+				name = pending.pop(future)
+				try:
+					result = future.result()
+				except Exception as e:
+					self.runtime._count(name, 'num_errors')
+					last_error = e
+					continue
+				self.runtime._count(name, 'num_wins')
+				return result
+			if position < len(self.chains) - 1:
+				position += 1
+				launched_at = launch(position, 'num_failovers')
+		raise last_error
+
+	async def arun(self, inputs: Dict[str, Any]) -> str:
+		pending = {}
+		last_error = None
+
+		def launch(position: int, reason: Optional[str] = None) -> float:
+			name, chain = self.chains[position]
+			if reason is not None:
+				self.runtime._count(name, reason)
+			pending[asyncio.ensure_future(self._acall(name, chain, inputs))] = name
+			return time.perf_counter()
+
+		try:
+			position = 0
+			launched_at = launch(position)
+			while pending:
+				done, _ = await asyncio.wait(
+					pending, timeout=self._get_timeout(position, launched_at), return_when=asyncio.FIRST_COMPLETED)
+				if not done:
+					position += 1
+					launched_at = launch(position, 'num_hedges')
+					continue
+				for task in done:
+					name = pending.pop(task)
+					if task.exception() is not None:
+						self.runtime._count(name, 'num_errors')
+						last_error = task.exception()
+						continue
+					self.runtime._count(name, 'num_wins')
+					return task.result()
+				if position < len(self.chains) - 1:
+					position += 1
+					launched_at = launch(position, 'num_failovers')
+			raise last_error
+		finally:
+			# the slower calls are not needed anymore
+			for task in pending:
+				task.cancel()
+
+	async def astream(self, inputs: Dict[str, Any]) -> AsyncIterator[str]:
+		"""Streams the tokens of the first runtime, failing over to the next ones on errors
+		raised before the first token. Streamed calls are not hedged."""
+		for position, (name, chain) in enumerate(self.chains):
+			started = False
+			try:
+				async for token in self.runtime.runtimes[name]._astream_call_chain(chain, inputs):
+					started = True
+					yield token
+				self.runtime._count(name, 'num_wins')
+				return
+			except Exception:
+				self.runtime._count(name, 'num_errors')
+				if started or position == len(self.chains) - 1:
+					raise
+				self.runtime._count(self.chains[position + 1][0], 'num_failovers')
+
+
+class HedgedRuntime(Runtime):
+	"""
+	Composite runtime cutting tail latency by hedging requests across several runtimes.
+
+	Each prompt is sent to the first runtime. If it hasn't answered after the `hedge_percentile`
+	latency of that runtime, the same prompt is also sent to the next runtime, and the first
+	answer is used. Failed calls are retried on the next runtime right away. The latency percentiles
+	are tracked per runtime over the most recent calls, so the hedge threshold follows the
+	observed latencies.
+
+	Attributes:
+		runtimes (Dict[str, Runtime]): The runtimes, in the order they are called.
+		hedge_percentile (float): Percentile of the latencies of a runtime after which the next runtime
+			is called. Defaults to 95.
+		min_latency_samples (int): Number of calls of a runtime needed before its percentile is used.
+			Defaults to 20.
+		initial_hedge_delay (float, optional): Hedge delay, in seconds, used until enough latencies are
+			recorded. Defaults to None, which only fails over on errors during the warm-up.
+		latency_window (int): Number of most recent latencies kept per runtime. Defaults to 1000.
+
+	Examples:
+		>>> runtime = HedgedRuntime(runtimes={
+		...     'gpt-3.5': OpenAIRuntime(gpt_model_name='gpt-3.5-turbo'),
+		...     'gpt-3.5-backup': OpenAIRuntime(gpt_model_name='gpt-3.5-turbo', api_key=backup_key),
+		... })
+	"""
+
+	runtimes: Dict[str, Runtime]
+	hedge_percentile: float = 95.0
+	min_latency_samples: int = 20
+	initial_hedge_delay: Optional[float] = None
+	latency_window: int = 1000
+	_latency_trackers: Dict[str, LatencyTracker] = PrivateAttr(default_factory=dict)
+	_counters: Dict[str, Dict[str, int]] = PrivateAttr(default_factory=dict)
+	_counters_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+	_executor: Optional[ThreadPoolExecutor] = None
+
+	def __init__(self, **kwargs):
+		super().__init__(**kwargs)
+		if not self.runtimes:
+			raise ValueError('HedgedRuntime requires at least one runtime.')
+		self._latency_trackers = {name: LatencyTracker(window=self.latency_window) for name in self.runtimes}
+		self._counters = {name: {} for name in self.runtimes}
+		# any runtime can answer, so the answers are cached and coalesced only if all of them are reproducible
+		temperature = max(float(runtime.llm_params.get('temperature') or 0.0) for runtime in self.runtimes.values())
+		self.llm_params = {'runtimes': ','.join(self.runtimes), 'temperature': str(temperature)}
+
+	def _get_executor(self) -> ThreadPoolExecutor:
+		if self._executor is None:
+			with self._counters_lock:
+				if self._executor is None:
+					self._executor = ThreadPoolExecutor(
+						max_workers=max(4, 2 * self.max_workers * len(self.runtimes)))
+		return self._executor
+
+	def _get_hedge_delay(self, name: str) -> Optional[float]:
+		tracker = self._latency_trackers[name]
+		if tracker.count < self.min_latency_samples:
+			return self.initial_hedge_delay
+		return tracker.percentile(self.hedge_percentile)
+
+	def _count(self, name: str, counter: str):
+		with self._counters_lock:
+			self._counters[name][counter] = self._counters[name].get(counter, 0) + 1
+
+	def get_stats(self) -> Dict[str, Dict[str, Any]]:
+		"""
+		Returns the statistics of the runtimes.
+
+		Returns:
+			Dict[str, Dict[str, Any]]: Per runtime, the number of calls and the p50, p95 and p99
+				latencies of the answered calls, the current hedge delay, and the numbers of answers
+				used (`num_wins`), errors, hedged calls and failover calls.
+		"""
+		stats = {}
+		for name, tracker in self._latency_trackers.items():
+			with self._counters_lock:
+				counters = dict(self._counters[name])
+			stats[name] = {
+				**tracker.get_stats(),
+				'hedge_delay': self._get_hedge_delay(name),
+				**{
+					counter: counters.get(counter, 0)
+					for counter in ('num_wins', 'num_errors', 'num_hedges', 'num_failovers')
+				},
+			}
+		return stats
+
+	async def aclose(self):
+		"""Releases the resources of the async calls of the runtimes."""
+		for runtime in self.runtimes.values():
+			await runtime.aclose()
+
+	def _build_chain_and_params(self, input_template, output_template, instruction_template):
+		chains = []
+		output_parser = None
+		for name, runtime in self.runtimes.items():
+			chain, runtime_output_parser = runtime._prepare_chain_and_params(
+				input_template, output_template, instruction_template)
+			chains.append((name, chain))
+			output_parser = output_parser or runtime_output_parser
+		return HedgedChain(self, chains), output_parser
+
+	def _build_packed_chain(self, output_template, instruction_template):
+		return HedgedChain(self, [
+			(name, runtime._prepare_packed_chain(output_template, instruction_template))
+			for name, runtime in self.runtimes.items()
+		])
+
+	def _build_samples_chain(self, input_template, output_template, instruction_template, num_samples: int, *args):
+		return HedgedChain(self, [
+			(name, runtime._prepare_samples_chain(
+				input_template, output_template, instruction_template, num_samples, *args))
+			for name, runtime in self.runtimes.items()
+		])
+
+	def _build_parse_retry_chain(self):
+		return HedgedChain(self, [
+			(name, runtime._prepare_parse_retry_chain()) for name, runtime in self.runtimes.items()
+		])
+
+	async def _astream_chain(self, chain, verified_input: Dict[str, Any]) -> AsyncIterator[str]:
+		async for token in chain.astream(verified_input):
+			yield token
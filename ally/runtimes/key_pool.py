@@ -0,0 +1,124 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+
+class _KeyStats:
+
+	def __init__(self):
+		self.in_flight = 0
+		self.latency: Optional[float] = None
+		self.ejected_until = 0.0
+		self.num_calls = 0
+		self.num_errors = 0
+
+
+class ApiKeyPool:
+	"""
+	Pool of API keys spreading the calls of a runtime across several accounts.
+
+	Each call goes to the available key with the lowest expected wait, computed from the number
+	of calls in flight, the exponentially weighted average latency observed with the key
+	and its remaining quota. Keys failing with authentication or quota errors are ejected
+	from the pool for `ejection_seconds`.
+
+	Attributes:
+		api_keys (List[str]): The API keys.
+		ejection_seconds (float): How long a failing key is excluded. Defaults to 60.
+		latency_smoothing (float): Weight of the last latency in the average. Defaults to 0.2.
+		remaining_quota (Callable[[str], float], optional): Returns the available fraction
+			of the quota of a key, between 0 and 1. Defaults to None, quotas are ignored.
+	"""
+
+	def __init__(
+		self,
+		api_keys: List[str],
+		ejection_seconds: float = 60.0,
+		latency_smoothing: float = 0.2,
+		remaining_quota: Optional[Callable[[str], float]] = None,
+	):
+		if not api_keys:
+			raise ValueError('The API key pool requires at least one key.')
+		self.api_keys = list(dict.fromkeys(api_keys))
+		self.ejection_seconds = ejection_seconds
+		self.latency_smoothing = latency_smoothing
+		self.remaining_quota = remaining_quota
+		self._stats: Dict[str, _KeyStats] = {api_key: _KeyStats() for api_key in self.api_keys}
+		self._lock = threading.Lock()
+
+	def _score(self, api_key: str, default_latency: float) -> float:
+		stats = self._stats[api_key]
+		latency = stats.latency if stats.latency is not None else default_latency
+		quota = self.remaining_quota(api_key) if self.remaining_quota else 1.0
+		return (stats.in_flight + 1) * latency / max(quota, 0.05)
+
+	def acquire(self, exclude: Optional[List[str]] = None) -> str:
+		"""
+		Selects the key for the next call and counts the call as in flight.
+
+		Args:
+			exclude (List[str], optional): Keys that must not be selected, e.g. already tried for the call.
+
+		Returns:
+			str: The selected API key. If every key is ejected or excluded,
+			the one whose ejection ends first is returned.
+		"""
+		exclude = set(exclude or [])
+		with self._lock:
+			now = time.monotonic()
+			candidates = [
+				api_key for api_key in self.api_keys
+				if api_key not in exclude and self._stats[api_key].ejected_until <= now
+			]
+			if candidates:
+				latencies = [self._stats[api_key].latency for api_key in candidates]
+				known_latencies = [latency for latency in latencies if latency is not None]
+				# unknown keys are assumed to be as fast as the average known one, so they get tried
+				default_latency = sum(known_latencies) / len(known_latencies) if known_latencies else 1.0
+				api_key = min(candidates, key=lambda api_key: self._score(api_key, default_latency))
+			else:
+				api_key = min(self.api_keys, key=lambda api_key: self._stats[api_key].ejected_until)
+			self._stats[api_key].in_flight += 1
+			self._stats[api_key].num_calls += 1
+			return api_key
+
+	def release(self, api_key: str, latency: Optional[float] = None, eject: bool = False):
+		"""
+		Records the end of a call made with `acquire`.
+
+		Args:
+			api_key (str): The key used for the call.
+			latency (float, optional): The latency of a successful call, in seconds.
+			eject (bool): Whether the call failed with an authentication or quota error.
+		"""
+		with self._lock:
+			stats = self._stats[api_key]
+			stats.in_flight -= 1
+			if latency is not None:
+				if stats.latency is None:
+					stats.latency = latency
+				else:
+					stats.latency += self.latency_smoothing * (latency - stats.latency)
+			if eject:
+				stats.num_errors += 1
+				stats.ejected_until = time.monotonic() + self.ejection_seconds
+
+	def get_stats(self) -> Dict[str, Dict[str, float]]:
+		"""
+		Returns the statistics per key, identified by their last 4 characters.
+
+		Returns:
+			Dict[str, Dict[str, float]]: calls, errors, calls in flight, average latency and ejection flag.
+		"""
+		with self._lock:
+			now = time.monotonic()
+			return {
+				f'...{api_key[-4:]}': {
+					'num_calls': stats.num_calls,
+					'num_errors': stats.num_errors,
+					'in_flight': stats.in_flight,
+					'latency': stats.latency,
+					'ejected': stats.ejected_until > now,
+				}
+				for api_key, stats in self._stats.items()
+			}
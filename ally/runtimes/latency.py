@@ -0,0 +1,55 @@
+import math
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+
+class LatencyTracker:
+	"""
+	Keeps the most recent latencies of calls and computes their percentiles.
+
+	Attributes:
+		window (int): Number of most recent latencies kept. Defaults to 1000.
+	"""
+
+	def __init__(self, window: int = 1000):
+		self.window = window
+		self.count = 0
+		self._latencies = deque(maxlen=window)
+		self._lock = threading.Lock()
+
+	def record(self, latency: float):
+		"""
+		Records the latency of a call.
+
+		Args:
+			latency (float): The latency, in seconds.
+		"""
+		with self._lock:
+			self._latencies.append(latency)
+			self.count += 1
+
+	def percentile(self, q: float) -> Optional[float]:
+		"""
+		Returns the `q`-th percentile of the recent latencies (nearest-rank), or None if none were recorded.
+
+		Args:
+			q (float): The percentile, between 0 and 100.
+		"""
+		with self._lock:
+			latencies = sorted(self._latencies)
+		if not latencies:
+			return None
+		rank = max(1, math.ceil(q / 100 * len(latencies)))
+		return latencies[min(rank, len(latencies)) - 1]
+
+	def get_stats(self) -> Dict[str, Optional[float]]:
+		"""
+		Returns the number of recorded calls and the p50, p95 and p99 latencies in seconds.
+		"""
+		return {
+			'count': self.count,
+			'p50': self.percentile(50),
+			'p95': self.percentile(95),
+			'p99': self.percentile(99),
+		}
@@ -0,0 +1,205 @@
+import bisect
+import threading
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from ally.runtimes.latency import LatencyTracker
+
+# USD per 1K prompt tokens and per 1K completion tokens, matched by the longest model name prefix
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+	'gpt-4-1106-preview': (0.01, 0.03),
+	'gpt-4-32k': (0.06, 0.12),
+	'gpt-4': (0.03, 0.06),
+	'gpt-3.5-turbo-1106': (0.001, 0.002),
+	'gpt-3.5-turbo-16k': (0.003, 0.004),
+	'gpt-3.5-turbo-instruct': (0.0015, 0.002),
+	'gpt-3.5-turbo': (0.0015, 0.002),
+}
+
+# upper bounds of the histogram buckets of the durations, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+DURATIONS = ('queue_wait', 'llm_latency', 'parse_time')
+
+COUNTERS = ('num_calls', 'num_errors', 'num_cached', 'num_parse_fallbacks', 'prompt_tokens', 'completion_tokens', 'cost')
+
+
+def estimate_cost(
+	model_name: Optional[str],
+	prompt_tokens: int,
+	completion_tokens: int,
+	prices: Optional[Tuple[float, float]] = None,
+) -> Optional[float]:
+	"""
+	Estimates the cost of a call in USD.
+
+	Args:
+		model_name (str, optional): The name of the model.
+		prompt_tokens (int): The number of prompt tokens.
+		completion_tokens (int): The number of completion tokens.
+		prices (Tuple[float, float], optional): USD per 1K prompt and completion tokens.
+			Defaults to the price of the model in `MODEL_PRICES`.
+
+	Returns:
+		Optional[float]: The cost, or None if the price of the model is unknown.
+	"""
+	if prices is None:
+		matches = [name for name in MODEL_PRICES if model_name and model_name.startswith(name)]
+		if not matches:
+			return None
+		prices = MODEL_PRICES[max(matches, key=len)]
+	return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1000
+
+
+@dataclass
+class CallMetrics:
+	"""
+	Metrics of a single LLM call, passed to the metrics hooks of the runtime once the call is over.
+
+	Durations are in seconds. `queue_wait` is the time spent waiting for a concurrency slot or for
+	the rate limiter before calling the LLM. Calls answered by the response cache are `cached`, with
+	no LLM latency nor tokens. `parse_fallback` is set when the output parser rejected the completion.
+	"""
+	runtime_name: str
+	skill_name: Optional[str] = None
+	queue_wait: float = 0.0
+	llm_latency: float = 0.0
+	parse_time: float = 0.0
+	prompt_tokens: int = 0
+	completion_tokens: int = 0
+	cost: Optional[float] = None
+	parse_fallback: bool = False
+	cached: bool = False
+	error: Optional[str] = None
+
+	def to_dict(self) -> Dict[str, Any]:
+		return asdict(self)
+
+
+# metrics of the call in progress in the current thread or task
+current_call_metrics: ContextVar[Optional[Tuple[Any, CallMetrics]]] = ContextVar('current_call_metrics', default=None)
+
+
+class _Distribution:
+	"""Histogram and recent percentiles of a duration."""
+
+	def __init__(self, window: int):
+		self.sum = 0.0
+		self.bucket_counts = [0] * (len(DURATION_BUCKETS) + 1)
+		self.tracker = LatencyTracker(window=window)
+
+	def record(self, value: float):
+		self.sum += value
+		self.bucket_counts[bisect.bisect_left(DURATION_BUCKETS, value)] += 1
+		self.tracker.record(value)
+
+	def get_stats(self) -> Dict[str, Any]:
+		return {**self.tracker.get_stats(), 'sum': self.sum}
+
+
+class MetricsRecorder:
+	"""
+	Aggregates the metrics of the calls per runtime and skill. Recorders are metrics hooks,
+	so one recorder can aggregate the calls of several runtimes.
+
+	Attributes:
+		window (int): Number of most recent calls used to compute the percentiles. Defaults to 1000.
+	"""
+
+	def __init__(self, window: int = 1000):
+		self.window = window
+		self._counters: Dict[Tuple[str, str], Dict[str, float]] = {}
+		self._distributions: Dict[Tuple[str, str], Dict[str, _Distribution]] = {}
+		self._lock = threading.Lock()
+
+	def __call__(self, metrics: CallMetrics):
+		self.record(metrics)
+
+	def record(self, metrics: CallMetrics):
+		"""
+		Adds the metrics of a call to the aggregates.
+
+		Args:
+			metrics (CallMetrics): The metrics of the call.
+		"""
+		key = (metrics.runtime_name, metrics.skill_name or '')
+		with self._lock:
+			if key not in self._counters:
+				self._counters[key] = dict.fromkeys(COUNTERS, 0)
+				self._distributions[key] = {name: _Distribution(self.window) for name in DURATIONS}
+			counters = self._counters[key]
+			counters['num_calls'] += 1
+			counters['num_errors'] += metrics.error is not None
+			counters['num_cached'] += metrics.cached
+			counters['num_parse_fallbacks'] += metrics.parse_fallback
+			counters['prompt_tokens'] += metrics.prompt_tokens
+			counters['completion_tokens'] += metrics.completion_tokens
+			counters['cost'] += metrics.cost or 0.0
+			for name, distribution in self._distributions[key].items():
+				distribution.record(getattr(metrics, name))
+
+	def reset(self):
+		"""Removes all the recorded metrics."""
+		with self._lock:
+			self._counters.clear()
+			self._distributions.clear()
+
+	def to_dict(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+		"""
+		Returns the aggregated metrics.
+
+		Returns:
+			Dict[str, Dict[str, Dict[str, Any]]]: Per runtime name and skill name (empty for calls made
+				outside of a skill), the counters and, for each duration, the number of calls,
+				the p50, p95 and p99 of the recent calls, and the total.
+		"""
+		metrics = {}
+		with self._lock:
+			for (runtime_name, skill_name), counters in self._counters.items():
+				metrics.setdefault(runtime_name, {})[skill_name] = {
+					**counters,
+					**{
+						name: distribution.get_stats()
+						for name, distribution in self._distributions[(runtime_name, skill_name)].items()
+					},
+				}
+		return metrics
+
+	def to_prometheus(self, prefix: str = 'ally') -> str:
+		"""
+		Returns the aggregated metrics in the Prometheus text exposition format: the counters as
+		counters and the durations as histograms, labelled by runtime and skill.
+
+		Args:
+			prefix (str): Prefix of the metric names. Defaults to 'ally'.
+		"""
+		lines: List[str] = []
+		with self._lock:
+			keys = sorted(self._counters)
+			for counter in COUNTERS:
+				name = f'{prefix}_{counter}_total'
+				lines.append(f'# TYPE {name} counter')
+				for key in keys:
+					lines.append(f'{name}{{{_labels(key)}}} {_format(self._counters[key][counter])}')
+			for duration in DURATIONS:
+				name = f'{prefix}_{duration}_seconds'
+				lines.append(f'# TYPE {name} histogram')
+				for key in keys:
+					distribution = self._distributions[key][duration]
+					cumulative = 0
+					for bound, count in zip(DURATION_BUCKETS + ('+Inf',), distribution.bucket_counts):
+						cumulative += count
+						lines.append(f'{name}_bucket{{{_labels(key)},le="{bound}"}} {cumulative}')
+					lines.append(f'{name}_sum{{{_labels(key)}}} {_format(distribution.sum)}')
+					lines.append(f'{name}_count{{{_labels(key)}}} {cumulative}')
+		return '\n'.join(lines) + '\n'
+
+
+def _labels(key: Tuple[str, str]) -> str:
+	runtime_name, skill_name = (value.replace('\\', '\\\\').replace('"', '\\"') for value in key)
+	return f'runtime="{runtime_name}",skill="{skill_name}"'
+
+
+def _format(value: float) -> str:
+	return repr(float(value)) if isinstance(value, float) else str(value)
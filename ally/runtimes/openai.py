@@ -1,5 +1,10 @@
+import enum
+import hashlib
 import os
-from typing import Optional
+import threading
+import time
+import warnings
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 import openai
 from langchain.chains.llm import LLMChain
@@ -7,7 +12,70 @@ from langchain.chat_models import ChatOpenAI
 from langchain.embeddings.openai import OpenAIEmbeddings
 
 from ally.runtimes.base import Runtime
-from ally.utils.logs import print_error
+from ally.runtimes.cache import LRUCache
+from ally.runtimes.key_pool import ApiKeyPool
+from ally.utils.logs import print_error, print_text
+
+# How long the list of models available for an API key is reused, in seconds
+MODELS_CACHE_TTL = 600.0
+
+_models_cache: Dict[str, Tuple[float, Set[str]]] = {}
+_models_cache_lock = threading.Lock()
+
+
+def get_available_models(api_key: str, ttl: float = MODELS_CACHE_TTL) -> Set[str]:
+	"""
+	Returns the ids of the models available for the API key.
+
+	The list is fetched with `openai.Model.list` and shared by all the runtimes of the process
+	for `ttl` seconds, so constructing a runtime does not require a network round-trip.
+
+	Args:
+		api_key (str): The OpenAI API key.
+		ttl (float): How long a fetched list is reused, in seconds. Defaults to MODELS_CACHE_TTL.
+
+	Returns:
+		Set[str]: The available model ids.
+	"""
+	cache_key = hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+	with _models_cache_lock:
+		entry = _models_cache.get(cache_key)
+		if entry is not None and time.monotonic() - entry[0] < ttl:
+			return entry[1]
+	models = openai.Model.list(api_key=api_key)
+	models = set(model['id'] for model in models['data'])
+	with _models_cache_lock:
+		_models_cache[cache_key] = (time.monotonic(), models)
+	return models
+
+
+def clear_available_models_cache():
+	"""Forgets the model lists fetched by `get_available_models`."""
+	with _models_cache_lock:
+		_models_cache.clear()
+
+
+def is_api_key_error(error: Exception) -> bool:
+	"""
+	Checks whether an OpenAI error is caused by the API key itself (invalid key,
+	missing permission or exhausted quota) rather than by the request.
+
+	Args:
+		error (Exception): The exception raised by the call.
+
+	Returns:
+		bool: True if the key should not be used for a while.
+	"""
+	if isinstance(error, (openai.error.AuthenticationError, openai.error.PermissionError)):
+		return True
+	return isinstance(error, openai.error.RateLimitError) and 'quota' in str(error).lower()
+
+
+class ModelValidation(enum.Enum):
+	"""Enumeration for the moments the model availability is checked."""
+	Eager = 'eager'  # when the runtime is constructed
+	Deferred = 'deferred'  # when the first chain is created
+	Skip = 'skip'  # never
 
 
 class OpenAIRuntime(Runtime):
@@ -23,21 +91,40 @@ class OpenAIRuntime(Runtime):
 		temperature (float): Sampling temperature for the GPT model's output. 
 													A higher value makes output more random, while a lower value makes it more deterministic.
 													Defaults to 0.0.
+		availability_check (ModelValidation): When to check that the model is available for the API key.
+													The list of available models is cached per API key for MODELS_CACHE_TTL seconds.
+													Defaults to ModelValidation.Eager. `model_validation` is a deprecated alias.
+		api_keys (List[str], optional): Pool of API keys to spread the calls across, by remaining quota
+													and observed latency. Keys failing with authentication or quota errors
+													are ejected for `key_ejection_seconds`. Defaults to None, only `api_key` is used.
+		key_ejection_seconds (float): How long a failing key of the pool is not used. Defaults to 60.
 	"""
 		
 	api_key: Optional[str] = None
 	gpt_model_name: Optional[str]
 	temperature: Optional[float] = 0.0
 	max_tokens: Optional[int] = 256
+	availability_check: ModelValidation = ModelValidation.Eager
+	api_keys: Optional[List[str]] = None
+	key_ejection_seconds: float = 60.0
+	_model_validated: bool = False
+	_key_pool: Optional[ApiKeyPool] = None
+	_key_chains: Optional[LRUCache] = None
+	_key_llms: Optional[Dict[str, ChatOpenAI]] = None
 
 	def __init__(
 		self,
-		api_key: str,
-		gpt_model_name: str,
+		api_key: Optional[str] = None,
+		gpt_model_name: Optional[str] = None,
 		temperature: float = 0.0,
 		max_tokens: int = 256,
+		model_validation: Optional[ModelValidation] = None,
 		**kwargs,
 	):
+		if model_validation is not None:
+			warnings.warn(
+				'model_validation is deprecated, use availability_check instead', DeprecationWarning, stacklevel=2)
+			kwargs.setdefault('availability_check', model_validation)
 		super().__init__(
 			api_key=api_key,
 			gpt_model_name=gpt_model_name,
@@ -46,17 +133,114 @@ class OpenAIRuntime(Runtime):
 			**kwargs,
 		)
 		self._check_api_key()
-		self._check_model_availability()
+		if self.availability_check == ModelValidation.Eager:
+			self._check_model_availability()
 		self.llm_params = {
 			'model_name': self.gpt_model_name,
 			'temperature': self.temperature,
 			'openai_api_key': self.api_key,
 			'max_tokens': self.max_tokens,
 		}
+		if self.requests_per_minute or self.tokens_per_minute:
+			# let the rate limiter see the rate-limit errors instead of retrying them in the client
+			self.llm_params['max_retries'] = 1
+		if self.api_keys:
+			self._key_pool = ApiKeyPool(
+				self.api_keys,
+				ejection_seconds=self.key_ejection_seconds,
+				remaining_quota=self._get_remaining_quota,
+			)
+			self._key_chains = LRUCache(max_size=self.chain_cache_size * len(self._key_pool.api_keys))
+			self._key_llms = {}
+
+	def _get_rate_limit_key(self, api_key: Optional[str] = None) -> str:
+		api_key_hash = hashlib.sha256((api_key or self.api_key or '').encode('utf-8')).hexdigest()[:16]
+		return f'openai:{api_key_hash}:{self.gpt_model_name}'
+
+	def _get_remaining_quota(self, api_key: str) -> float:
+		rate_limiter = self._get_rate_limiter(self._get_rate_limit_key(api_key))
+		return rate_limiter.remaining_quota() if rate_limiter else 1.0
+
+	def _get_chain_for_key(self, chain: LLMChain, api_key: str) -> LLMChain:
+		"""Returns a chain with the same prompt as `chain`, calling the model with another API key."""
+		if api_key == self.llm_params['openai_api_key']:
+			return chain
+
+		def create_chain():
+			if api_key not in self._key_llms:
+				self._key_llms[api_key] = ChatOpenAI(**{**self.llm_params, 'openai_api_key': api_key})
+			return chain, LLMChain(llm=self._key_llms[api_key], prompt=chain.prompt)
+
+		# the cached entry holds a reference to `chain`, so its id can't be reused while cached
+		return self._key_chains.get_or_create((id(chain), api_key), create_chain)[1]
+
+	def _run_chain(self, chain, verified_input: Dict[str, Any]) -> str:
+		if self._key_pool is None:
+			return super()._run_chain(chain, verified_input)
+		tried_api_keys = []
+		while True:
+			api_key = self._key_pool.acquire(exclude=tried_api_keys)
+			start_time = time.perf_counter()
+			try:
+				result = self._run_rate_limited(
+					self._get_chain_for_key(chain, api_key),
+					verified_input,
+					self._get_rate_limiter(self._get_rate_limit_key(api_key)),
+				)
+			except Exception as e:
+				eject = is_api_key_error(e)
+				self._key_pool.release(api_key, eject=eject)
+				tried_api_keys.append(api_key)
+				if eject and len(tried_api_keys) < len(self._key_pool.api_keys):
+					continue
+				raise
+			self._key_pool.release(api_key, latency=time.perf_counter() - start_time)
+			return result
+
+	async def _arun_chain(self, chain, verified_input: Dict[str, Any]) -> str:
+		if self._key_pool is None:
+			return await super()._arun_chain(chain, verified_input)
+		tried_api_keys = []
+		while True:
+			api_key = self._key_pool.acquire(exclude=tried_api_keys)
+			start_time = time.perf_counter()
+			try:
+				result = await self._arun_rate_limited(
+					self._get_chain_for_key(chain, api_key),
+					verified_input,
+					self._get_rate_limiter(self._get_rate_limit_key(api_key)),
+				)
+			except Exception as e:
+				eject = is_api_key_error(e)
+				self._key_pool.release(api_key, eject=eject)
+				tried_api_keys.append(api_key)
+				if eject and len(tried_api_keys) < len(self._key_pool.api_keys):
+					continue
+				raise
+			self._key_pool.release(api_key, latency=time.perf_counter() - start_time)
+			return result
+
+	def get_key_pool_stats(self) -> Dict[str, Dict[str, float]]:
+		"""Returns the usage statistics of the API key pool, see `ApiKeyPool.get_stats`."""
+		return self._key_pool.get_stats() if self._key_pool else {}
+
+	@property
+	def model_validation(self) -> ModelValidation:
+		"""Deprecated alias of `availability_check`."""
+		warnings.warn('model_validation is deprecated, use availability_check instead', DeprecationWarning, stacklevel=2)
+		return self.availability_check
+
+	@model_validation.setter
+	def model_validation(self, value: ModelValidation):
+		warnings.warn('model_validation is deprecated, use availability_check instead', DeprecationWarning, stacklevel=2)
+		self.availability_check = value
 
 	def _check_api_key(self):
 		if self.api_key:
 			return
+		if self.api_keys:
+			self.api_key = self.api_keys[0]
+			return
 		self.api_key = os.getenv('OPENAI_API_KEY')
 		if not self.api_key:
 			print_error(
@@ -68,8 +252,10 @@ class OpenAIRuntime(Runtime):
 			raise ValueError('OpenAI API key is not provided.')
 
 	def _check_model_availability(self):
-		models = openai.Model.list(api_key=self.api_key)
-		models = set(model['id'] for model in models['data'])
+		start_time = time.perf_counter()
+		models = get_available_models(self.api_key)
+		if self.verbose:
+			print_text(f'Model availability checked in {time.perf_counter() - start_time:.3f}s')
 		if self.gpt_model_name not in models:
 			print_error(
 				f'Requested model "{self.gpt_model_name}" is not available in your OpenAI account. '
@@ -77,8 +263,11 @@ class OpenAIRuntime(Runtime):
 				f'Try to change the runtime settings for {self.__class__.__name__}, for example:\n\n'
 				f'{self.__class__.__name__}(..., model="gpt-3.5-turbo")\n\n')
 			raise ValueError(f'Requested model {self.gpt_model_name} is not available in your OpenAI account.')
+		self._model_validated = True
 		
 	def _create_chain(self):
+		if self.availability_check == ModelValidation.Deferred and not self._model_validated:
+			self._check_model_availability()
 		self._llm = ChatOpenAI(
 			**self.llm_params
 		)
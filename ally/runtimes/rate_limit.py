@@ -0,0 +1,221 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+
+
+class TokenBucket:
+	"""
+	Token bucket refilled continuously at `capacity` tokens per minute.
+
+	Reservations are granted immediately and may drive the bucket negative;
+	the caller is told how long to wait before its reservation is covered,
+	which keeps the bucket usable from both threads and coroutines.
+
+	Attributes:
+		capacity (float): Number of tokens per minute, also the maximum burst.
+	"""
+
+	def __init__(self, capacity: float):
+		self.capacity = float(capacity)
+		self._tokens = float(capacity)
+		self._updated_at = time.monotonic()
+		self._lock = threading.Lock()
+
+	def _refill(self):
+		now = time.monotonic()
+		self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.capacity / 60.0)
+		self._updated_at = now
+
+	def available(self) -> float:
+		"""
+		Returns the fraction of the capacity currently available, between 0 and 1.
+		"""
+		with self._lock:
+			self._refill()
+			return max(0.0, self._tokens / self.capacity)
+
+	def reserve(self, amount: float) -> float:
+		"""
+		Reserves tokens.
+
+		Args:
+			amount (float): Number of tokens to reserve. Clamped to the bucket capacity.
+
+		Returns:
+			float: Number of seconds to wait before using the reserved tokens.
+		"""
+		amount = min(float(amount), self.capacity)
+		with self._lock:
+			self._refill()
+			self._tokens -= amount
+			if self._tokens >= 0:
+				return 0.0
+			return -self._tokens / (self.capacity / 60.0)
+
+
+class RateLimiter:
+	"""
+	Caller-side limiter of the requests sent with one API key to one model.
+
+	It enforces requests-per-minute and tokens-per-minute budgets with token buckets,
+	and adapts the number of requests in flight with AIMD: the concurrency window grows
+	by 1/window after each successful request and is halved, with an exponential pause,
+	after each rate-limit error. This keeps the throughput near the quota without error storms.
+
+	Attributes:
+		requests_per_minute (int, optional): Requests budget. Defaults to None, unlimited.
+		tokens_per_minute (int, optional): Tokens budget. Defaults to None, unlimited.
+		max_concurrency (int): Upper bound of the concurrency window. Defaults to 16.
+		min_concurrency (int): Lower bound of the concurrency window. Defaults to 1.
+		max_backoff (float): Maximum pause after rate-limit errors, in seconds. Defaults to 60.
+	"""
+
+	def __init__(
+		self,
+		requests_per_minute: Optional[int] = None,
+		tokens_per_minute: Optional[int] = None,
+		max_concurrency: int = 16,
+		min_concurrency: int = 1,
+		max_backoff: float = 60.0,
+	):
+		self.requests_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+		self.tokens_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+		self.max_concurrency = max(1, max_concurrency)
+		self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+		self.max_backoff = max_backoff
+		self.concurrency_limit = float(self.max_concurrency)
+		self.in_flight = 0
+		self.num_rate_limited = 0
+		self._consecutive_errors = 0
+		self._paused_until = 0.0
+		self._condition = threading.Condition()
+
+	def remaining_quota(self) -> float:
+		"""
+		Returns the fraction of the most depleted budget currently available, between 0 and 1.
+		"""
+		buckets = [bucket for bucket in (self.requests_bucket, self.tokens_bucket) if bucket is not None]
+		return min([bucket.available() for bucket in buckets], default=1.0)
+
+	def _try_enter(self) -> Optional[float]:
+		"""Takes a concurrency slot if possible, otherwise returns how long to wait."""
+		with self._condition:
+			pause = self._paused_until - time.monotonic()
+			if pause > 0:
+				return pause
+			if self.in_flight >= int(self.concurrency_limit):
+				return None
+			self.in_flight += 1
+			return 0.0
+
+	def _reserve(self, tokens: int) -> float:
+		wait = 0.0
+		if self.requests_bucket is not None:
+			wait = max(wait, self.requests_bucket.reserve(1))
+		if self.tokens_bucket is not None:
+			wait = max(wait, self.tokens_bucket.reserve(tokens))
+		return wait
+
+	def acquire(self, tokens: int = 0):
+		"""
+		Blocks until a request estimated at `tokens` tokens can be sent.
+
+		Args:
+			tokens (int): Estimated number of prompt and completion tokens of the request.
+		"""
+		while True:
+			wait = self._try_enter()
+			if wait == 0.0:
+				break
+			with self._condition:
+				self._condition.wait(timeout=wait if wait is not None else 0.1)
+		time.sleep(self._reserve(tokens))
+
+	async def aacquire(self, tokens: int = 0):
+		"""
+		Waits without blocking the event loop until a request estimated at `tokens` tokens can be sent.
+
+		Args:
+			tokens (int): Estimated number of prompt and completion tokens of the request.
+		"""
+		while True:
+			wait = self._try_enter()
+			if wait == 0.0:
+				break
+			await asyncio.sleep(wait if wait is not None else 0.01)
+		await asyncio.sleep(self._reserve(tokens))
+
+	def release(self, rate_limited: bool = False):
+		"""
+		Releases the slot taken by `acquire` and adapts the concurrency window.
+
+		Args:
+			rate_limited (bool): Whether the request failed with a rate-limit error.
+		"""
+		with self._condition:
+			self.in_flight -= 1
+			if rate_limited:
+				self.num_rate_limited += 1
+				self._consecutive_errors += 1
+				self.concurrency_limit = max(float(self.min_concurrency), self.concurrency_limit / 2)
+				backoff = min(self.max_backoff, 2 ** (self._consecutive_errors - 1))
+				self._paused_until = max(self._paused_until, time.monotonic() + backoff)
+			else:
+				self._consecutive_errors = 0
+				self.concurrency_limit = min(
+					float(self.max_concurrency), self.concurrency_limit + 1 / self.concurrency_limit)
+			self._condition.notify_all()
+
+
+_rate_limiters: Dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(
+	key: str,
+	requests_per_minute: Optional[int] = None,
+	tokens_per_minute: Optional[int] = None,
+	max_concurrency: int = 16,
+) -> RateLimiter:
+	"""
+	Returns the rate limiter shared by all the runtimes of the process using the same key
+	(e.g. the same API key and model). The limits of the first call creating the limiter are used.
+
+	Args:
+		key (str): The limiter key.
+		requests_per_minute (int, optional): Requests budget.
+		tokens_per_minute (int, optional): Tokens budget.
+		max_concurrency (int): Upper bound of the concurrency window.
+
+	Returns:
+		RateLimiter: The shared rate limiter.
+	"""
+	with _rate_limiters_lock:
+		if key not in _rate_limiters:
+			_rate_limiters[key] = RateLimiter(
+				requests_per_minute=requests_per_minute,
+				tokens_per_minute=tokens_per_minute,
+				max_concurrency=max_concurrency,
+			)
+		return _rate_limiters[key]
+
+
+def clear_rate_limiters():
+	"""Forgets the rate limiters created by `get_rate_limiter`."""
+	with _rate_limiters_lock:
+		_rate_limiters.clear()
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+	"""
+	Checks whether an exception raised by an LLM call is a rate-limit (HTTP 429) error.
+
+	Args:
+		error (Exception): The exception.
+
+	Returns:
+		bool: True for rate-limit errors.
+	"""
+	status = getattr(error, 'http_status', None) or getattr(error, 'status_code', None)
+	return status == 429 or 'RateLimit' in type(error).__name__
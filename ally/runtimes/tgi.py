@@ -0,0 +1,220 @@
+import asyncio
+import enum
+import json
+import threading
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import aiohttp
+import requests
+from pydantic import PrivateAttr
+from requests.adapters import HTTPAdapter
+
+from ally.runtimes.base import Runtime
+
+# roles of the langchain message types in the OpenAI chat completions API
+OPENAI_ROLES = {'system': 'system', 'human': 'user', 'ai': 'assistant'}
+
+
+class TGIApiType(enum.Enum):
+	"""Enumeration for the HTTP APIs of the text generation servers."""
+	Generate = 'generate'  # Text Generation Inference `/generate` API
+	OpenAI = 'openai'  # OpenAI-compatible `/v1/chat/completions` API (TGI >= 1.4, vLLM, ...)
+
+
+class TGIError(Exception):
+	"""Error returned by a text generation server."""
+
+	def __init__(self, message: str, status_code: int):
+		super().__init__(f'{status_code}: {message}')
+		self.status_code = status_code
+
+
+class TGIChain:
+	"""Chain rendering the prompt and calling the text generation server of the runtime."""
+
+	def __init__(self, prompt, runtime: 'TGIRuntime'):
+		self.prompt = prompt
+		self.runtime = runtime
+		self.llm = None
+
+	def _render(self, inputs: Dict[str, Any]) -> List[Tuple[str, str]]:
+		return [(message.type, message.content) for message in self.prompt.format_messages(**inputs)]
+
+	def run(self, inputs: Dict[str, Any]) -> str:
+		return self.runtime._generate(self._render(inputs))
+
+	async def arun(self, inputs: Dict[str, Any]) -> str:
+		return await self.runtime._agenerate(self._render(inputs))
+
+	async def astream(self, inputs: Dict[str, Any]) -> AsyncIterator[str]:
+		async for token in self.runtime._astream_generate(self._render(inputs)):
+			yield token
+
+
+class TGIRuntime(Runtime):
+	"""
+	Runtime calling a Text Generation Inference (TGI) server, e.g. the one deployed by `ally/modal/tgi.py`,
+	or any server with an OpenAI-compatible chat completions API.
+
+	The server batches the requests in flight continuously, so throughput grows with the number
+	of concurrent calls: set `max_workers` to the number of requests to keep in flight. HTTP connections
+	are kept alive and pooled, up to `max_workers` connections for the sync and the async calls.
+
+	Attributes:
+		endpoint_url (str): Base URL of the server, e.g. 'http://127.0.0.1:8080'.
+		api_type (TGIApiType): HTTP API of the server. Defaults to TGIApiType.Generate.
+		model_name (str, optional): Model name sent to OpenAI-compatible servers. Defaults to 'tgi'.
+		api_key (str, optional): Bearer token of the server. Defaults to None.
+		max_new_tokens (int): Maximum number of generated tokens. Defaults to 256.
+		temperature (float): Sampling temperature, 0 for greedy decoding. Defaults to 0.
+		stop_sequences (List[str]): Sequences stopping the generation. Defaults to none.
+		timeout (float): Timeout of a request, in seconds. Defaults to 120.
+	"""
+
+	endpoint_url: str
+	api_type: TGIApiType = TGIApiType.Generate
+	model_name: Optional[str] = 'tgi'
+	api_key: Optional[str] = None
+	max_new_tokens: int = 256
+	temperature: float = 0.0
+	stop_sequences: List[str] = []
+	timeout: float = 120.0
+	_session: Optional[requests.Session] = None
+	_session_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+	_async_session: Optional[aiohttp.ClientSession] = None
+	_async_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+	def __init__(self, **kwargs):
+		super().__init__(**kwargs)
+		self.endpoint_url = self.endpoint_url.rstrip('/')
+		self.llm_params = {
+			'model_name': self.model_name,
+			'endpoint_url': self.endpoint_url,
+			'max_tokens': self.max_new_tokens,
+			'temperature': self.temperature,
+			'stop': self.stop_sequences,
+		}
+
+	def _create_chain(self):
+		self._chain = TGIChain(prompt=self._llm_prompt_template, runtime=self)
+
+	def _get_headers(self) -> Dict[str, str]:
+		headers = {'Content-Type': 'application/json'}
+		if self.api_key:
+			headers['Authorization'] = f'Bearer {self.api_key}'
+		return headers
+
+	def _get_session(self) -> requests.Session:
+		"""Returns the HTTP session keeping up to `max_workers` connections alive."""
+		with self._session_lock:
+			if self._session is None:
+				self._session = requests.Session()
+				adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, self.max_workers))
+				self._session.mount('http://', adapter)
+				self._session.mount('https://', adapter)
+				self._session.headers.update(self._get_headers())
+		return self._session
+
+	def _get_async_session(self) -> aiohttp.ClientSession:
+		"""Returns the HTTP session of the running event loop, keeping up to `max_workers` connections alive."""
+		loop = asyncio.get_running_loop()
+		if self._async_session is None or self._async_session_loop is not loop or self._async_session.closed:
+			self._close_replaced_async_session()
+			self._async_session = aiohttp.ClientSession(
+				connector=aiohttp.TCPConnector(limit=max(1, self.max_workers)),
+				headers=self._get_headers(),
+				timeout=aiohttp.ClientTimeout(total=self.timeout),
+			)
+			self._async_session_loop = loop
+		return self._async_session
+
+	def _close_replaced_async_session(self):
+		"""Closes the session of another event loop before it is replaced, so its connections are not leaked.
+		The session of an event loop that is not running anymore can't be closed: call `aclose` before
+		the event loop ends."""
+		session, loop = self._async_session, self._async_session_loop
+		self._async_session = None
+		if session is not None and not session.closed and loop.is_running():
+			# the event loop runs in another thread
+			asyncio.run_coroutine_threadsafe(session.close(), loop)
+
+	async def aclose(self):
+		"""Closes the connections of the async calls made on the running event loop."""
+		if self._async_session is not None and self._async_session_loop is asyncio.get_running_loop():
+			await self._async_session.close()
+			self._async_session = None
+
+	def _get_request(self, messages: List[Tuple[str, str]], stream: bool = False) -> Tuple[str, Dict[str, Any]]:
+		"""Returns the URL and the JSON payload of a generation request."""
+		if self.api_type == TGIApiType.OpenAI:
+			payload = {
+				'model': self.model_name,
+				'messages': [
+					{'role': OPENAI_ROLES.get(message_type, 'user'), 'content': content}
+					for message_type, content in messages
+				],
+				'max_tokens': self.max_new_tokens,
+				'temperature': self.temperature,
+				'stream': stream,
+			}
+			if self.stop_sequences:
+				payload['stop'] = self.stop_sequences
+			return f'{self.endpoint_url}/v1/chat/completions', payload
+
+		parameters = {'max_new_tokens': self.max_new_tokens, 'stop': self.stop_sequences}
+		if self.temperature > 0:
+			parameters.update(do_sample=True, temperature=self.temperature)
+		payload = {'inputs': '\n\n'.join(content for _, content in messages), 'parameters': parameters}
+		return f'{self.endpoint_url}/{"generate_stream" if stream else "generate"}', payload
+
+	def _parse_response(self, response: Dict[str, Any]) -> str:
+		if self.api_type == TGIApiType.OpenAI:
+			return response['choices'][0]['message']['content']
+		return response['generated_text']
+
+	def _parse_stream_event(self, event: Dict[str, Any]) -> str:
+		if self.api_type == TGIApiType.OpenAI:
+			return event['choices'][0].get('delta', {}).get('content') or ''
+		token = event.get('token') or {}
+		return '' if token.get('special') else token.get('text', '')
+
+	def _strip_stop_sequences(self, text: str) -> str:
+		"""TGI returns the stop sequence that ended the generation, OpenAI-compatible servers don't."""
+		for stop_sequence in self.stop_sequences:
+			if text.endswith(stop_sequence):
+				return text[:-len(stop_sequence)]
+		return text
+
+	def _generate(self, messages: List[Tuple[str, str]]) -> str:
+		url, payload = self._get_request(messages)
+		response = self._get_session().post(url, json=payload, timeout=self.timeout)
+		if response.status_code >= 400:
+			raise TGIError(response.text, response.status_code)
+		return self._strip_stop_sequences(self._parse_response(response.json()))
+
+	async def _agenerate(self, messages: List[Tuple[str, str]]) -> str:
+		url, payload = self._get_request(messages)
+		async with self._get_async_session().post(url, json=payload) as response:
+			if response.status >= 400:
+				raise TGIError(await response.text(), response.status)
+			return self._strip_stop_sequences(self._parse_response(await response.json()))
+
+	async def _astream_generate(self, messages: List[Tuple[str, str]]) -> AsyncIterator[str]:
+		url, payload = self._get_request(messages, stream=True)
+		async with self._get_async_session().post(url, json=payload) as response:
+			if response.status >= 400:
+				raise TGIError(await response.text(), response.status)
+			async for line in response.content:
+				line = line.decode('utf-8').strip()
+				if not line.startswith('data:'):
+					continue
+				data = line[len('data:'):].strip()
+				if data == '[DONE]':
+					break
+				token = self._parse_stream_event(json.loads(data))
+				if token:
+					yield token
+
+	async def _astream_chain(self, chain, verified_input: Dict[str, Any]) -> AsyncIterator[str]:
+		async for token in chain.astream(verified_input):
+			yield token
@@ -1,15 +1,25 @@
 
 
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional, Union
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Union
 
+import pandas as pd
 from pydantic import BaseModel, Field
 
-from ally.runtimes.base import Runtime
-from ally.utils.internal_data import InternalDataFrame, InternalSeries
-from ally.utils.logs import print_dataframe
+from ally.runtimes.base import RecordStream, Runtime
+from ally.utils.concurrency import map_concurrently
+from ally.utils.internal_data import (ColumnarContext, InternalDataFrame,
+                                      InternalSeries)
+from ally.utils.logs import print_dataframe, print_text
+from ally.utils.templates import compile_template
+from ally.utils.tokens import chunk_by_tokens
 from ally.vector_store.base import AllyVectorStore
 
+# Number of rows formatted at once by the map-reduce analysis
+ROWS_PER_RENDER = 1000
+
 
 class Skill(BaseModel, ABC):
 	"""
@@ -75,6 +85,20 @@ class Skill(BaseModel, ABC):
 			List[str]: A list of output fields.
 		"""
 		return [field['name'] for field in self.output_template]
+
+	def get_input_fields(self) -> List[str]:
+		"""
+		Retrieves the fields of the records used by the input and instruction templates.
+
+		Returns:
+			List[str]: A list of input fields, in order of appearance.
+		"""
+		fields = []
+		for template in (self.input_template, self.instruction_template):
+			for field_name in compile_template(template or '').fields:
+				if field_name not in fields:
+					fields.append(field_name)
+		return fields
 	
 	@abstractmethod
 	def improve(self, predictions, train_skill_output, feedback, runtime):
@@ -108,6 +132,104 @@ class TransformSkill(Skill):
 			input_template=self.input_template,
 			output_template=self.output_template,
 			instruction_template=self.instruction_template,
+			skill_name=self.name,
+		)
+
+	async def aapply(
+		self,
+		input: InternalDataFrame,
+		runtime: Runtime,
+	) -> InternalDataFrame:
+		"""
+		Asynchronously applies the skill to a dataframe and returns another dataframe.
+
+		Args:
+			input (InternalDataFrame): The input data to be processed.
+			runtime (Runtime): The runtime instance to be used for processing.
+
+		Returns:
+			InternalDataFrame: The transformed data.
+		"""
+
+		return await runtime.abatch_to_batch(
+			input,
+			input_template=self.input_template,
+			output_template=self.output_template,
+			instruction_template=self.instruction_template,
+			skill_name=self.name,
+		)
+
+	def apply_record(
+		self,
+		input: Dict,
+		runtime: Runtime,
+	) -> Dict:
+		"""
+		Applies the skill to a single record.
+
+		Args:
+			input (Dict): The record to be processed.
+			runtime (Runtime): The runtime instance to be used for processing.
+
+		Returns:
+			Dict: The output fields of the record.
+		"""
+
+		return runtime.record_to_record(
+			input,
+			input_template=self.input_template,
+			output_template=self.output_template,
+			instruction_template=self.instruction_template,
+			skill_name=self.name,
+		)
+
+	async def aapply_record(
+		self,
+		input: Dict,
+		runtime: Runtime,
+	) -> Dict:
+		"""
+		Asynchronously applies the skill to a single record.
+
+		Args:
+			input (Dict): The record to be processed.
+			runtime (Runtime): The runtime instance to be used for processing.
+
+		Returns:
+			Dict: The output fields of the record.
+		"""
+
+		return await runtime.arecord_to_record(
+			input,
+			input_template=self.input_template,
+			output_template=self.output_template,
+			instruction_template=self.instruction_template,
+			skill_name=self.name,
+		)
+
+	async def astream(
+		self,
+		input: Dict,
+		runtime: Runtime,
+	) -> RecordStream:
+		"""
+		Applies the skill to a single record, streaming the completion tokens.
+
+		Args:
+			input (Dict): The record to be processed.
+			runtime (Runtime): The runtime instance to be used for processing.
+
+		Returns:
+			RecordStream: The tokens of the completion. Its `output` holds the transformed record
+				once the iteration is over.
+		"""
+
+		return runtime.astream_record_to_record(
+			input,
+			input_template=self.input_template,
+			output_template=self.output_template,
+			instruction_template=self.instruction_template,
+			skill_name=self.name,
 		)
 	
 	def improve(
@@ -116,6 +238,10 @@ class TransformSkill(Skill):
 		train_skill_output: str,
 		feedback,
 		runtime: Runtime,
+		num_candidates: int = 1,
+		student_runtime: Optional[Runtime] = None,
+		scorer: Optional[Callable[[InternalDataFrame], float]] = None,
+		validation_size: int = 20,
 	):
 		"""
 		Improves the skill.
@@ -124,9 +250,23 @@ class TransformSkill(Skill):
 			predictions (InternalDataFrame): The predictions made by the skill.
 			train_skill_output (str): The name of the output field of the skill.
 			feedback (InternalDataFrame): The feedback provided by the user.
-			runtime (Runtime):
-
+			runtime (Runtime): The teacher runtime.
+			num_candidates (int, optional): Number of new instructions generated concurrently by the teacher.
+				With more than one candidate, `student_runtime` and `scorer` are required: some rows with feedback
+				are held out from the examples, the candidates are applied to them concurrently and the best
+				scoring one is kept, unless the current instruction, scored with the existing predictions,
+				is better. Defaults to 1, the new instruction is adopted.
+			student_runtime (Runtime, optional): The runtime applying the candidates to the held-out rows.
+			scorer (Callable[[InternalDataFrame], float], optional): Returns the score of the predictions
+				of the held-out rows, e.g. their accuracy.
+			validation_size (int, optional): Maximum number of held-out rows, at most half of the rows with
+				feedback. Defaults to 20.
+
+		Raises:
+			ValueError: If `num_candidates` is more than 1 without `student_runtime` or `scorer`.
 		"""
+		if num_candidates > 1 and (student_runtime is None or scorer is None):
+			raise ValueError("Scoring several candidate instructions requires a student_runtime and a scorer")
 		output_template_str = " ".join([field['description'] + ": " "{" + field['name'] + "}" for field in self.output_template])
 		if (
 			feedback.match[train_skill_output].all()
@@ -140,20 +280,31 @@ class TransformSkill(Skill):
 		)
 		analyzed_df = fb.merge(predictions, left_index=True, right_index=True)
 
-		examples = []
-
-		for i, row in enumerate(analyzed_df.to_dict(orient="records")):
-			# if fb marked as NaN, skip
-			if not row[f"{train_skill_output}__fb"]:
-				continue
-			examples.append(
-				f"### Example #{i}\n\n"
-				f"{self.input_template.format(**row)}\n\n"
-				f"{output_template_str.format(**row)}\n\n"
-				f'User feedback: {row[f"{train_skill_output}__fb"]}\n\n'
+		heldout_index = []
+		if num_candidates > 1:
+			labeled = analyzed_df[analyzed_df[f"{train_skill_output}__fb"].notnull()]
+			heldout_index = labeled.sample(n=min(validation_size, len(labeled) // 2), random_state=0).index
+			if not len(heldout_index):
+				# no row to score the candidates on, a single one is generated
+				num_candidates = 1
+
+		examples_df = analyzed_df.drop(index=heldout_index)
+		# if fb marked as NaN, skip
+		has_feedback = examples_df[f"{train_skill_output}__fb"].map(bool)
+		numbers = [i for i, keep in enumerate(has_feedback) if keep]
+		examples_df = examples_df[has_feedback]
+		examples = "\n".join(
+			f"### Example #{i}\n\n"
+			f"{input_text}\n\n"
+			f"{output_text}\n\n"
+			f'User feedback: {fb_text}\n\n'
+			for i, input_text, output_text, fb_text in zip(
+				numbers,
+				compile_template(self.input_template).render_batch(examples_df),
+				compile_template(output_template_str).render_batch(examples_df),
+				examples_df[f"{train_skill_output}__fb"],
 			)
-
-		examples = "\n".join(examples)
+		)
 
 		teacher_instruction_template = """
 		You are a helpful assistant
@@ -202,12 +353,36 @@ class TransformSkill(Skill):
 			output_template=[{
 				"name": "reasoning",
 				"description": "reasoning from the assistant"
-			}]
+			}],
+			skill_name=self.name,
 		)['reasoning']
 
+		candidates = map_concurrently(
+			self._generate_instruction,
+			range(num_candidates),
+			max_workers=num_candidates,
+			unit='candidate',
+			reasoning=reasoning,
+			num_candidates=num_candidates,
+			runtime=runtime,
+		)
+		if num_candidates > 1:
+			new_prompt = self._select_instruction(candidates, predictions.loc[heldout_index], student_runtime, scorer)
+		else:
+			new_prompt = candidates[0]
+		self.instruction_template = new_prompt
+		return new_prompt, reasoning
+
+	def _generate_instruction(self, candidate: int, reasoning: str, num_candidates: int, runtime: Runtime) -> str:
+		"""Asks the teacher for a new instruction following its reasoning."""
 		teacher_instruction_template = f"""
 		{reasoning}
 		"""
+		variant = ''
+		if num_candidates > 1:
+			variant = f"""
+
+			4. This is candidate #{candidate + 1} of {num_candidates}: address the issues in a different way than the other candidates."""
 
 		message = f"""
 			Now please carefully review your reasoning in Step 1 and help with Step 2: refining the prompt.
@@ -223,24 +398,62 @@ class TransformSkill(Skill):
 					- Current prompt: "The model should generate a summary of the input text."
 					- New prompt: "The model should generate a summary of the input text. Pay attention to the original style."
 
-			3. Reply only with the new prompt. Do not include input and output templates in the prompt."""
-		new_prompt = runtime.record_to_record(
+			3. Reply only with the new prompt. Do not include input and output templates in the prompt.{variant}"""
+		return runtime.record_to_record(
 			record={'input': message},
 			instruction_template=teacher_instruction_template,
 			input_template="{input}",
 			output_template=[{
 				"name": "output",
 				"description": "new prompt"
-			}]
+			}],
+			skill_name=self.name,
 		)['output']
-		self.instruction_template = new_prompt
-		return new_prompt, reasoning
+
+	def _select_instruction(
+		self,
+		candidates: List[str],
+		heldout: InternalDataFrame,
+		runtime: Runtime,
+		scorer: Callable[[InternalDataFrame], float],
+	) -> str:
+		"""Returns the best scoring instruction on the held-out rows, keeping the current one if it is better."""
+		# the current instruction is scored with its existing predictions
+		current_score = scorer(heldout)
+		candidates = [candidate for candidate in dict.fromkeys(candidates) if candidate != self.instruction_template]
+		if not candidates:
+			return self.instruction_template
+
+		def score(candidate: str) -> float:
+			output = runtime.batch_to_batch(
+				heldout,
+				input_template=self.input_template,
+				output_template=self.output_template,
+				instruction_template=candidate,
+				skill_name=self.name,
+			)
+			candidate_score = scorer(ColumnarContext(heldout).add_columns(output).to_frame())
+			return float('-inf') if pd.isna(candidate_score) else candidate_score
+
+		scores = map_concurrently(score, candidates, max_workers=len(candidates), unit='candidate')
+		best = max(range(len(candidates)), key=lambda position: scores[position])
+		print_text(
+			f'Scores of the candidate instructions on {len(heldout)} held-out rows: '
+			f'{", ".join(f"{candidate_score:.2f}" for candidate_score in scores)} (current: {current_score:.2f})')
+		if not pd.isna(current_score) and scores[best] < current_score:
+			return self.instruction_template
+		return candidates[best]
 
 class SynthesisSkill(Skill):
 	"""
 	Synthesis skill that synthesize a dataframe from a record (e.g. for dataset generation purposes).
 	See base class Skill for more information about the attributes.
+
+	Attributes:
+		num_samples (int): Number of rows synthesized from the record. The runtime requests up to
+			`runtime.samples_per_prompt` rows in a single call. Defaults to 1.
 	"""
+	num_samples: int = 1
 
 	def apply(
 		self,
@@ -264,6 +477,34 @@ class SynthesisSkill(Skill):
 			input_template=self.input_template,
 			output_template=self.output_template,
 			instruction_template=self.instruction_template,
+			output_batch_size=self.num_samples,
+			skill_name=self.name,
+		)
+
+	async def aapply(
+		self,
+		input: Union[Dict, InternalSeries],
+		runtime: Runtime,
+	) -> InternalDataFrame:
+		"""
+		Asynchronously applies the skill to a record and returns a dataframe.
+
+		Args:
+			input (InternalSeries): The input data to be processed.
+			runtime (Runtime): The runtime instance to be used for processing.
+
+		Returns:
+			InternalDataFrame: The synthesized data.
+		"""
+		if isinstance(input, InternalSeries):
+				input = input.to_dict()
+		return await runtime.arecord_to_batch(
+			input,
+			input_template=self.input_template,
+			output_template=self.output_template,
+			instruction_template=self.instruction_template,
+			output_batch_size=self.num_samples,
+			skill_name=self.name,
 		)
 
 
@@ -271,7 +512,17 @@ class AnalysisSkill(Skill):
 	"""
 	Analysis skill that analyzes a dataframe and returns a record (e.g. for data analysis purposes).
 	See base class Skill for more information about the attributes.
+
+	Attributes:
+		chunk_tokens (int, optional): Maximum number of tokens of the rows analyzed by a single call.
+			When set, the skill analyzes the dataframe with map-reduce: the formatted rows are grouped
+			into chunks of `chunk_tokens` tokens counted with tiktoken, the chunks are analyzed
+			concurrently, and the partial analyses are combined in turn by chunks until a single
+			analysis remains. The rows are formatted lazily, at most `runtime.max_workers` chunks at a
+			time, so the concatenation of all the rows is never built. Defaults to None: all the rows
+			are analyzed by a single call.
 	"""
+	chunk_tokens: Optional[int] = None
 
 	def apply(
 		self,
@@ -288,22 +539,140 @@ class AnalysisSkill(Skill):
 		Returns:
 			InternalSeries: The record containing the analysis results.
 		"""
-		if isinstance(input, InternalSeries):
-				input = input.to_frame()
-		elif isinstance(input, dict):
-				input = InternalDataFrame([input])
+		if self.chunk_tokens:
+			return InternalSeries(self._map_reduce(input, runtime))
+		aggregated_input = self._aggregate_input(input)
+		output = runtime.record_to_record(
+				{'aggregated_input': aggregated_input},
+				input_template='{aggregated_input}',
+				output_template=self.output_template,
+				instruction_template=self.instruction_template,
+				skill_name=self.name,
+		)
+		return InternalSeries(output)
 
-		aggregated_input = input.apply(
-			lambda row: self.input_template.format(**row), axis=1
-		).str.cat(sep='\n')
+	async def aapply(
+		self,
+		input: Union[InternalDataFrame, InternalSeries, Dict],
+		runtime: Runtime,
+	) -> InternalSeries:
+		"""
+		Asynchronously applies the skill to a dataframe and returns a record.
 
-		output = runtime.record_to_record(
+		Args:
+			input (InternalDataFrame): The input data to be processed.
+			runtime (Runtime): The runtime instance to be used for processing.
+
+		Returns:
+			InternalSeries: The record containing the analysis results.
+		"""
+		if self.chunk_tokens:
+			return InternalSeries(await self._amap_reduce(input, runtime))
+		aggregated_input = self._aggregate_input(input)
+		output = await runtime.arecord_to_record(
 				{'aggregated_input': aggregated_input},
 				input_template='{aggregated_input}',
 				output_template=self.output_template,
 				instruction_template=self.instruction_template,
+				skill_name=self.name,
 		)
 		return InternalSeries(output)
+
+	def _to_frame(self, input: Union[InternalDataFrame, InternalSeries, Dict]) -> InternalDataFrame:
+		if isinstance(input, InternalSeries):
+				return input.to_frame()
+		elif isinstance(input, dict):
+				return InternalDataFrame([input])
+		return input
+
+	def _iter_rows(self, input: Union[InternalDataFrame, InternalSeries, Dict]) -> Iterator[str]:
+		"""Formats the rows lazily, `ROWS_PER_RENDER` rows at a time."""
+		input = self._to_frame(input)
+		template = compile_template(self.input_template)
+		# fail before any chunk is analyzed
+		template.validate(input.columns)
+		for start in range(0, len(input), ROWS_PER_RENDER):
+			yield from template.render_batch(input.iloc[start:start + ROWS_PER_RENDER])
+
+	def _format_partial_outputs(self, outputs: List[Dict]) -> Iterator[str]:
+		for output in outputs:
+			yield '\n'.join(f'{field["name"]}: {output.get(field["name"])}' for field in self.output_template)
+
+	def _get_chunks(self, texts: Iterable[str], runtime: Runtime, min_texts: int = 1) -> Iterator[List[List[str]]]:
+		"""Yields the chunks of the texts by groups of `runtime.max_workers` chunks analyzed concurrently."""
+		chunks = chunk_by_tokens(texts, self.chunk_tokens, runtime.llm_params.get('model_name'), min_texts=min_texts)
+		while True:
+			group = list(islice(chunks, max(1, runtime.max_workers)))
+			if not group:
+				return
+			yield group
+
+	def _get_reduce_instruction(self) -> str:
+		return (
+			f'{self.instruction_template}\n\n'
+			f'The input consists of analyses of consecutive parts of the data, separated by blank lines. '
+			f'Combine them into a single analysis of the whole data.'
+		)
+
+	def _analyze_chunk(self, chunk: List[str], runtime: Runtime, instruction_template: str, separator: str) -> Dict:
+		return runtime.record_to_record(
+			{'aggregated_input': separator.join(chunk)},
+			input_template='{aggregated_input}',
+			output_template=self.output_template,
+			instruction_template=instruction_template,
+			skill_name=self.name,
+		)
+
+	async def _aanalyze_chunk(self, chunk: List[str], runtime: Runtime, instruction_template: str, separator: str) -> Dict:
+		return await runtime.arecord_to_record(
+			{'aggregated_input': separator.join(chunk)},
+			input_template='{aggregated_input}',
+			output_template=self.output_template,
+			instruction_template=instruction_template,
+			skill_name=self.name,
+		)
+
+	def _map_reduce(self, input: Union[InternalDataFrame, InternalSeries, Dict], runtime: Runtime) -> Dict:
+		"""Analyzes the chunks of rows concurrently, then combines the partial analyses by chunks."""
+		texts, instruction_template, separator, min_texts = self._iter_rows(input), self.instruction_template, '\n', 1
+		while True:
+			outputs = []
+			for group in self._get_chunks(texts, runtime, min_texts=min_texts):
+				outputs.extend(map_concurrently(
+					self._analyze_chunk,
+					group,
+					max_workers=len(group),
+					unit='chunk',
+					runtime=runtime,
+					instruction_template=instruction_template,
+					separator=separator,
+				))
+			if len(outputs) <= 1:
+				return outputs[0] if outputs else self._analyze_chunk([], runtime, instruction_template, separator)
+			# chunks of at least 2 partial analyses, so that every reduce level has fewer outputs
+			texts, instruction_template, separator, min_texts = (
+				self._format_partial_outputs(outputs), self._get_reduce_instruction(), '\n\n', 2)
+
+	async def _amap_reduce(self, input: Union[InternalDataFrame, InternalSeries, Dict], runtime: Runtime) -> Dict:
+		"""Asynchronously analyzes the chunks of rows concurrently, then combines the partial analyses by chunks."""
+		texts, instruction_template, separator, min_texts = self._iter_rows(input), self.instruction_template, '\n', 1
+		while True:
+			outputs = []
+			for group in self._get_chunks(texts, runtime, min_texts=min_texts):
+				outputs.extend(await asyncio.gather(*[
+					self._aanalyze_chunk(chunk, runtime, instruction_template, separator) for chunk in group
+				]))
+			if len(outputs) <= 1:
+				return outputs[0] if outputs else await self._aanalyze_chunk([], runtime, instruction_template, separator)
+			texts, instruction_template, separator, min_texts = (
+				self._format_partial_outputs(outputs), self._get_reduce_instruction(), '\n\n', 2)
+
+	def _aggregate_input(
+		self,
+		input: Union[InternalDataFrame, InternalSeries, Dict],
+	) -> str:
+		input = self._to_frame(input)
+		return compile_template(self.input_template).render_batch(input).str.cat(sep='\n')
 	
 	def improve(self, **kwargs):
 		"""
@@ -321,16 +690,31 @@ class RetrievalSkill(Skill):
 	query_input_fields: List[str]
 	query_output_field: str
 
+	def get_input_fields(self) -> List[str]:
+		fields = super().get_input_fields()
+		return [field for field in fields if field != self.query_output_field] + [
+			field for field in self.query_input_fields if field not in fields]
+
+	def _validate_input(self, input: InternalDataFrame):
+		"""Checks that the fields of the templates and of the query are columns of the input,
+		before any context is retrieved."""
+		missing_fields = [field for field in self.get_input_fields() if field not in input.columns]
+		if missing_fields:
+			raise ValueError(f"Fields {missing_fields} of the skill {self.name} are missing from the columns "
+							 f"{list(input.columns)}")
+
 	def apply(
 		self,
 		input: InternalDataFrame,
 		runtime: Runtime,
 	) -> InternalDataFrame:
 
+		self._validate_input(input)
 		input = self.vector_store.batch_to_batch(
 			input,
 			input_fields=self.query_input_fields,
 			output_field=self.query_output_field,
+			max_workers=runtime.max_workers,
 		)
 		print_dataframe(input)
 		return runtime.batch_to_batch(
@@ -338,6 +722,116 @@ class RetrievalSkill(Skill):
 			input_template=self.input_template,
 			output_template=self.output_template,
 			instruction_template=self.instruction_template,
+			skill_name=self.name,
+		)
+
+	async def aapply(
+		self,
+		input: InternalDataFrame,
+		runtime: Runtime,
+	) -> InternalDataFrame:
+
+		self._validate_input(input)
+		input = await self.vector_store.abatch_to_batch(
+			input,
+			input_fields=self.query_input_fields,
+			output_field=self.query_output_field,
+			max_workers=runtime.max_workers,
+		)
+		return await runtime.abatch_to_batch(
+			input,
+			input_template=self.input_template,
+			output_template=self.output_template,
+			instruction_template=self.instruction_template,
+			skill_name=self.name,
+		)
+
+	def apply_record(
+		self,
+		input: Dict,
+		runtime: Runtime,
+	) -> Dict:
+		"""
+		Retrieves the context of a single record, then applies the skill to it.
+
+		Args:
+			input (Dict): The record to be processed.
+			runtime (Runtime): The runtime instance to be used for processing.
+
+		Returns:
+			Dict: The output fields of the record.
+		"""
+
+		input = self.vector_store.record_to_record(
+			input,
+			input_fields=self.query_input_fields,
+			output_field=self.query_output_field,
+		)
+		return runtime.record_to_record(
+			input,
+			input_template=self.input_template,
+			output_template=self.output_template,
+			instruction_template=self.instruction_template,
+			skill_name=self.name,
+		)
+
+	async def aapply_record(
+		self,
+		input: Dict,
+		runtime: Runtime,
+	) -> Dict:
+		"""
+		Asynchronously retrieves the context of a single record, then applies the skill to it.
+
+		Args:
+			input (Dict): The record to be processed.
+			runtime (Runtime): The runtime instance to be used for processing.
+
+		Returns:
+			Dict: The output fields of the record.
+		"""
+
+		input = await self.vector_store.arecord_to_record(
+			input,
+			input_fields=self.query_input_fields,
+			output_field=self.query_output_field,
+		)
+		return await runtime.arecord_to_record(
+			input,
+			input_template=self.input_template,
+			output_template=self.output_template,
+			instruction_template=self.instruction_template,
+			skill_name=self.name,
+		)
+
+	async def astream(
+		self,
+		input: Dict,
+		runtime: Runtime,
+	) -> RecordStream:
+		"""
+		Retrieves the context of a single record, then streams the completion tokens.
+
+		Args:
+			input (Dict): The record to be processed.
+			runtime (Runtime): The runtime instance to be used for processing.
+
+		Returns:
+			RecordStream: The tokens of the completion. Its `output` holds the processed record
+				once the iteration is over.
+		"""
+
+		input = await self.vector_store.arecord_to_record(
+			input,
+			input_fields=self.query_input_fields,
+			output_field=self.query_output_field,
+		)
+		return runtime.astream_record_to_record(
+			input,
+			input_template=self.input_template,
+			output_template=self.output_template,
+			instruction_template=self.instruction_template,
+			skill_name=self.name,
 		)
 	
 	def improve(self, **kwargs):
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from ally.runtimes.base import Runtime
+from ally.skills.base import Skill
+
+
+def _hash(payload: Any) -> str:
+	return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class SkillOutputMemo:
+	"""
+	Memoizes the outputs of the skills applied to rows, keyed by the hash of the skill definition
+	(templates and LLM parameters) and the hash of the input fields of the row.
+
+	When a skill is improved, its instruction hash changes, so its rows are recomputed. The rows of the
+	skills using its outputs are recomputed only if these outputs changed, since they are part of their
+	input fields. The other skills are served from the memo.
+
+	Attributes:
+		max_size (int): Maximum number of memoized outputs, the least recently used ones are evicted.
+			Defaults to 100000.
+	"""
+
+	def __init__(self, max_size: int = 100000):
+		self.max_size = max_size
+		self._outputs: OrderedDict = OrderedDict()
+		self._stats: Dict[str, Dict[str, int]] = {}
+		self._lock = threading.Lock()
+
+	def __len__(self) -> int:
+		return len(self._outputs)
+
+	def get_skill_key(self, skill: Skill, runtime: Runtime) -> str:
+		"""
+		Returns the hash of everything but the input row that determines the outputs of a skill.
+
+		Args:
+			skill (Skill): The skill.
+			runtime (Runtime): The runtime applying the skill.
+		"""
+		return _hash([
+			type(skill).__name__,
+			skill.model_dump(exclude={'name', 'description', 'frozen', 'vector_store'}),
+			type(runtime).__name__,
+			{k: v for k, v in runtime.llm_params.items() if 'api_key' not in k},
+		])
+
+	def get_row_key(self, record: Dict[str, Any], input_fields: List[str]) -> str:
+		"""
+		Returns the hash of the input fields of a row.
+
+		Args:
+			record (Dict[str, Any]): The row.
+			input_fields (List[str]): The fields used by the skill.
+		"""
+		return _hash([record.get(field) for field in input_fields])
+
+	def lookup(self, skill_name: str, skill_key: str, row_key: str) -> Optional[Dict[str, Any]]:
+		"""
+		Returns a copy of the memoized output of a row, or None if it must be computed.
+
+		Args:
+			skill_name (str): The name of the skill, used for the statistics.
+			skill_key (str): The hash of the skill, see `get_skill_key`.
+			row_key (str): The hash of the row, see `get_row_key`.
+		"""
+		with self._lock:
+			stats = self._stats.setdefault(skill_name, {'hits': 0, 'misses': 0})
+			output = self._outputs.get((skill_key, row_key))
+			if output is None:
+				stats['misses'] += 1
+				return None
+			stats['hits'] += 1
+			self._outputs.move_to_end((skill_key, row_key))
+			return dict(output)
+
+	def store(self, skill_key: str, row_key: str, output: Dict[str, Any]):
+		"""
+		Memoizes the output of a row.
+
+		Args:
+			skill_key (str): The hash of the skill, see `get_skill_key`.
+			row_key (str): The hash of the row, see `get_row_key`.
+			output (Dict[str, Any]): The output fields of the row.
+		"""
+		with self._lock:
+			self._outputs[(skill_key, row_key)] = dict(output)
+			self._outputs.move_to_end((skill_key, row_key))
+			while len(self._outputs) > self.max_size:
+				self._outputs.popitem(last=False)
+
+	def get_stats(self) -> Dict[str, Dict[str, int]]:
+		"""
+		Returns the number of rows served from the memo (`hits`, each one saving an LLM call)
+		and computed (`misses`), per skill.
+		"""
+		with self._lock:
+			return {skill_name: dict(stats) for skill_name, stats in self._stats.items()}
+
+	def get_saved_calls(self) -> int:
+		"""Returns the number of LLM calls saved by the memo."""
+		with self._lock:
+			return sum(stats['hits'] for stats in self._stats.values())
@@ -1,19 +1,53 @@
 
 
+import asyncio
+import heapq
+import queue
+import threading
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional, OrderedDict, Union
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, OrderedDict, Tuple, Union
 
 from pydantic import BaseModel, field_validator, model_validator
 
 from ally.runtimes.base import Runtime
-from ally.skills.base import (AnalysisSkill, Skill, SynthesisSkill,
-                              TransformSkill)
-from ally.utils.internal_data import (InternalDataFrame,
+from ally.skills.base import (AnalysisSkill, RetrievalSkill, Skill,
+                              SynthesisSkill, TransformSkill)
+from ally.skills.memo import SkillOutputMemo
+from ally.utils.concurrency import map_concurrently
+from ally.utils.internal_data import (ColumnarContext, InternalDataFrame,
                                       InternalDataFrameConcat, InternalSeries,
                                       Record)
 from ally.utils.logs import print_text
 
 
+def _to_frame(input: Union[Record, InternalSeries, InternalDataFrame]) -> InternalDataFrame:
+	if isinstance(input, InternalSeries):
+		return input.to_frame().T
+	if isinstance(input, dict):
+		return InternalDataFrame([input])
+	return input
+
+
+def _get_skill_input(
+	skill_input: Union[ColumnarContext, Record, InternalSeries, InternalDataFrame],
+) -> Union[Record, InternalSeries, InternalDataFrame]:
+	"""Returns the dataframe of the columns passed between row skills, or the output of the other skills as is."""
+	if isinstance(skill_input, ColumnarContext):
+		return skill_input.to_frame()
+	return skill_input
+
+
+def _merge_row_outputs(
+	input: InternalDataFrame,
+	outputs: List[Dict[str, Any]],
+	columns: Optional[List[str]] = None,
+) -> InternalDataFrame:
+	"""Adds the output fields of the rows to the input, replacing the input columns with the same name."""
+	skill_output = InternalDataFrame(outputs, index=input.index, columns=columns)
+	return ColumnarContext(input).add_columns(skill_output).to_frame()
+
+
 class SkillSet(BaseModel, ABC):
 	"""
 	Represents a collection of interdependent skills aiming to achieve a specific goal.
@@ -59,7 +93,8 @@ class SkillSet(BaseModel, ABC):
 		self,
 		input: Union[Record, InternalDataFrame],
 		runtime: Runtime,
-		improved_skill: Optional[str] = None
+		improved_skill: Optional[str] = None,
+		memo: Optional[SkillOutputMemo] = None,
 	) -> InternalDataFrame:
 		"""
 		Apply the skill set to a dataset using a specified runtime.
@@ -68,6 +103,29 @@ class SkillSet(BaseModel, ABC):
 			input (Union[Record, InternalDataFrame]): Input data to apply the skill set to.
 			runtime (Runtime): The runtime environment in which to apply the skills.
 			improved_skill (Optional[str], optional): Name of the skill to start from (to optimize calculations). Defaults to None.
+			memo (SkillOutputMemo, optional): Memo of the skill outputs: the rows already processed by a skill
+				with the same definition and input fields are not processed again. Defaults to None.
+		Returns:
+			InternalDataFrame: Skill predictions.
+		"""
+
+	@abstractmethod
+	async def aapply(
+		self,
+		input: Union[Record, InternalDataFrame],
+		runtime: Runtime,
+		improved_skill: Optional[str] = None,
+		memo: Optional[SkillOutputMemo] = None,
+	) -> InternalDataFrame:
+		"""
+		Asynchronously apply the skill set to a dataset using a specified runtime.
+		
+		Args:
+			input (Union[Record, InternalDataFrame]): Input data to apply the skill set to.
+			runtime (Runtime): The runtime environment in which to apply the skills.
+			improved_skill (Optional[str], optional): Name of the skill to start from (to optimize calculations). Defaults to None.
+			memo (SkillOutputMemo, optional): Memo of the skill outputs: the rows already processed by a skill
+				with the same definition and input fields are not processed again. Defaults to None.
 		Returns:
 			InternalDataFrame: Skill predictions.
 		"""
@@ -111,18 +169,127 @@ class SkillSet(BaseModel, ABC):
 			Dict[str, str]: Dictionary of skill outputs. Keys are output names and values are skill names
 		"""
 		return {field: skill.name for skill in self.skills.values() for field in skill.get_output_fields()}
+
+	def _lookup_memo(
+		self,
+		skill: Skill,
+		input: InternalDataFrame,
+		runtime: Runtime,
+		memo: SkillOutputMemo,
+	) -> Tuple[str, List[str], List[Optional[Dict[str, Any]]]]:
+		"""Returns the skill key, the row keys and the memoized outputs of the rows, None for the rows to process."""
+		skill_key = memo.get_skill_key(skill, runtime)
+		input_fields = skill.get_input_fields()
+		# only the input fields are turned into records, the other columns can be wide
+		records = input[[field for field in input_fields if field in input.columns]].to_dict(orient='records')
+		row_keys = [memo.get_row_key(record, input_fields) for record in records]
+		outputs = [memo.lookup(skill.name, skill_key, row_key) for row_key in row_keys]
+		return skill_key, row_keys, outputs
+
+	def _store_memo(
+		self,
+		memo: SkillOutputMemo,
+		skill_key: str,
+		row_keys: List[str],
+		outputs: List[Optional[Dict[str, Any]]],
+		positions: List[int],
+		skill_output: InternalDataFrame,
+	) -> None:
+		for position, output in zip(positions, skill_output.to_dict(orient='records')):
+			outputs[position] = output
+			memo.store(skill_key, row_keys[position], output)
+
+	def _apply_skill(
+		self,
+		skill: Skill,
+		input: Union[Record, InternalSeries, InternalDataFrame],
+		runtime: Runtime,
+		memo: Optional[SkillOutputMemo] = None,
+	) -> Union[InternalDataFrame, InternalSeries]:
+		"""Applies a skill, processing only the rows missing from the memo if the skill transforms rows."""
+		if memo is None or not isinstance(skill, (TransformSkill, RetrievalSkill)) \
+				or not isinstance(input, InternalDataFrame):
+			return skill.apply(input, runtime)
+		skill_key, row_keys, outputs = self._lookup_memo(skill, input, runtime, memo)
+		positions = [position for position, output in enumerate(outputs) if output is None]
+		if positions:
+			skill_output = skill.apply(input.iloc[positions], runtime)
+			self._store_memo(memo, skill_key, row_keys, outputs, positions, skill_output)
+		return InternalDataFrame(outputs, index=input.index)
+
+	async def _aapply_skill(
+		self,
+		skill: Skill,
+		input: Union[Record, InternalSeries, InternalDataFrame],
+		runtime: Runtime,
+		memo: Optional[SkillOutputMemo] = None,
+	) -> Union[InternalDataFrame, InternalSeries]:
+		"""Asynchronously applies a skill, processing only the rows missing from the memo if the skill transforms rows."""
+		if memo is None or not isinstance(skill, (TransformSkill, RetrievalSkill)) \
+				or not isinstance(input, InternalDataFrame):
+			return await skill.aapply(input, runtime)
+		skill_key, row_keys, outputs = self._lookup_memo(skill, input, runtime, memo)
+		positions = [position for position, output in enumerate(outputs) if output is None]
+		if positions:
+			skill_output = await skill.aapply(input.iloc[positions], runtime)
+			self._store_memo(memo, skill_key, row_keys, outputs, positions, skill_output)
+		return InternalDataFrame(outputs, index=input.index)
+
+	def _apply_record(
+		self,
+		skill: Skill,
+		record: Dict[str, Any],
+		runtime: Runtime,
+		memo: Optional[SkillOutputMemo] = None,
+	) -> Dict[str, Any]:
+		"""Applies a skill to a single row, unless its output is memoized."""
+		if memo is None:
+			return skill.apply_record(record, runtime)
+		skill_key = memo.get_skill_key(skill, runtime)
+		row_key = memo.get_row_key(record, skill.get_input_fields())
+		output = memo.lookup(skill.name, skill_key, row_key)
+		if output is None:
+			output = skill.apply_record(record, runtime)
+			memo.store(skill_key, row_key, output)
+		return output
+
+	async def _aapply_record(
+		self,
+		skill: Skill,
+		record: Dict[str, Any],
+		runtime: Runtime,
+		memo: Optional[SkillOutputMemo] = None,
+	) -> Dict[str, Any]:
+		"""Asynchronously applies a skill to a single row, unless its output is memoized."""
+		if memo is None:
+			return await skill.aapply_record(record, runtime)
+		skill_key = memo.get_skill_key(skill, runtime)
+		row_key = memo.get_row_key(record, skill.get_input_fields())
+		output = memo.lookup(skill.name, skill_key, row_key)
+		if output is None:
+			output = await skill.aapply_record(record, runtime)
+			memo.store(skill_key, row_key, output)
+		return output
 	
 
 class LinearSkillSet(SkillSet):
 	"""
 	Represents a sequence of skills that are acquired in a specific order to achieve a goal.
 
-	LinearSkillSet ensures that skills are applied in a sequential manner.
+	LinearSkillSet ensures that skills are applied in a sequential manner. The output columns of each
+	skill are added to the dataset by reference, so the returned predictions share their columns with the
+	input dataset instead of copying it at every skill.
 
 	Attributes:
 		skills (Union[List[Skill], Dict[str, Skill]]): Provided skills
 		skill_sequence (List[str], optional): Ordered list of skill names indicating the order 
 																						in which they should be acquired.
+		streaming (bool): Let each row flow through the skill sequence on its own instead of applying
+			each skill to the whole dataset before the next one. Every skill has `runtime.max_workers`
+			workers taking rows from a bounded queue and passing them to the queue of the next skill,
+			so the first rows are done early. Only skills transforming rows can be streamed. Defaults to False.
+		stage_queue_size (int, optional): Maximum number of rows waiting for each skill in streaming mode.
+			Defaults to None, `runtime.max_workers`.
 
 	Examples:
 
@@ -132,6 +299,8 @@ class LinearSkillSet(SkillSet):
 	"""
     
 	skill_sequence: List[str] = None
+	streaming: bool = False
+	stage_queue_size: Optional[int] = None
 
 	@model_validator(mode='after')
 	def skill_sequence_validator(self) -> 'LinearSkillSet':
@@ -148,6 +317,11 @@ class LinearSkillSet(SkillSet):
 			raise ValueError(f"skill_sequence must contain all skill names - "
 													f"length of skill_sequence is {len(self.skill_sequence)} "
 													f"while length of skills is {len(self.skills)}")
+		if self.streaming:
+			for skill in self.skills.values():
+				if not isinstance(skill, (TransformSkill, RetrievalSkill)):
+					raise ValueError(f"Streaming only supports skills transforming rows, "
+													f"{skill.name} is a {type(skill).__name__}")
 		return self
 
 	def apply(
@@ -155,6 +329,7 @@ class LinearSkillSet(SkillSet):
 		input: Union[Record, InternalDataFrame],
 		runtime: Runtime,
 		improved_skill: Optional[str] = None,
+		memo: Optional[SkillOutputMemo] = None,
 	) -> InternalDataFrame:
 		"""
 		Sequentially applies each skill on the dataset, enhancing the agent's experience.
@@ -163,37 +338,181 @@ class LinearSkillSet(SkillSet):
 			input (InternalDataFrame): Input dataset.
 			runtime (Runtime): The runtime environment in which to apply the skills.
 			improved_skill (Optional[str], optional): Name of the skill to improve. Defaults to None.
+			memo (SkillOutputMemo, optional): Memo of the skill outputs. Defaults to None.
 		Returns:
 			InternalDataFrame: Skill predictions.
 		"""
+		if self.streaming:
+			return self._stream(input, runtime, self._get_skill_sequence(improved_skill), memo)
+		skill_input = input
+		for skill_name in self._get_skill_sequence(improved_skill):
+			skill = self.skills[skill_name]
+			print_text(f"Applying skill: {skill_name}")
+			skill_output = self._apply_skill(skill, _get_skill_input(skill_input), runtime, memo)
+			skill_input = self._merge_skill_output(skill, skill_input, skill_output)
+		return _to_frame(_get_skill_input(skill_input))
+
+	async def aapply(
+		self,
+		input: Union[Record, InternalDataFrame],
+		runtime: Runtime,
+		improved_skill: Optional[str] = None,
+		memo: Optional[SkillOutputMemo] = None,
+	) -> InternalDataFrame:
+		"""
+		Asynchronously and sequentially applies each skill on the dataset.
+		
+		Args:
+			input (InternalDataFrame): Input dataset.
+			runtime (Runtime): The runtime environment in which to apply the skills.
+			improved_skill (Optional[str], optional): Name of the skill to improve. Defaults to None.
+			memo (SkillOutputMemo, optional): Memo of the skill outputs. Defaults to None.
+		Returns:
+			InternalDataFrame: Skill predictions.
+		"""
+		if self.streaming:
+			return await self._astream(input, runtime, self._get_skill_sequence(improved_skill), memo)
+		skill_input = input
+		for skill_name in self._get_skill_sequence(improved_skill):
+			skill = self.skills[skill_name]
+			print_text(f"Applying skill: {skill_name}")
+			skill_output = await self._aapply_skill(skill, _get_skill_input(skill_input), runtime, memo)
+			skill_input = self._merge_skill_output(skill, skill_input, skill_output)
+		return _to_frame(_get_skill_input(skill_input))
+
+	def _stream(
+		self,
+		input: Union[Record, InternalSeries, InternalDataFrame],
+		runtime: Runtime,
+		skill_sequence: List[str],
+		memo: Optional[SkillOutputMemo] = None,
+	) -> InternalDataFrame:
+		"""Passes the rows through the skills with a pool of worker threads per skill."""
+		input = _to_frame(input)
+		records = input.to_dict(orient='records')
+		outputs = [{} for _ in records]
+		num_workers = max(1, runtime.max_workers)
+		queues = [
+			queue.Queue(maxsize=self.stage_queue_size or num_workers) for _ in skill_sequence]
+		errors = []
+		failed = threading.Event()
+		print_text(f"Streaming rows through skills: {' -> '.join(skill_sequence)}")
+
+		def work(stage: int):
+			skill = self.skills[skill_sequence[stage]]
+			while True:
+				position = queues[stage].get()
+				if position is None:
+					return
+				if failed.is_set():
+					# drain the queue so the previous stage is never blocked
+					continue
+				try:
+					outputs[position].update(
+						self._apply_record(skill, {**records[position], **outputs[position]}, runtime, memo))
+				except Exception as e:
+					errors.append(e)
+					failed.set()
+					continue
+				if stage + 1 < len(queues):
+					queues[stage + 1].put(position)
+
+		workers = [
+			[threading.Thread(target=work, args=(stage,), daemon=True) for _ in range(num_workers)]
+			for stage in range(len(skill_sequence))
+		]
+		for stage_workers in workers:
+			for worker in stage_workers:
+				worker.start()
+		for position in range(len(records)):
+			if failed.is_set():
+				break
+			queues[0].put(position)
+		# stop the workers stage by stage, once the previous stage can't pass rows anymore
+		for stage, stage_workers in enumerate(workers):
+			for _ in stage_workers:
+				queues[stage].put(None)
+			for worker in stage_workers:
+				worker.join()
+		if errors:
+			raise errors[0]
+		return _merge_row_outputs(input, outputs)
+
+	async def _astream(
+		self,
+		input: Union[Record, InternalSeries, InternalDataFrame],
+		runtime: Runtime,
+		skill_sequence: List[str],
+		memo: Optional[SkillOutputMemo] = None,
+	) -> InternalDataFrame:
+		"""Passes the rows through the skills with a pool of worker tasks per skill."""
+		input = _to_frame(input)
+		records = input.to_dict(orient='records')
+		outputs = [{} for _ in records]
+		num_workers = max(1, runtime.max_workers)
+		queues = [
+			asyncio.Queue(maxsize=self.stage_queue_size or num_workers) for _ in skill_sequence]
+		print_text(f"Streaming rows through skills: {' -> '.join(skill_sequence)}")
+
+		async def work(stage: int):
+			skill = self.skills[skill_sequence[stage]]
+			while True:
+				position = await queues[stage].get()
+				if position is None:
+					return
+				outputs[position].update(
+					await self._aapply_record(skill, {**records[position], **outputs[position]}, runtime, memo))
+				if stage + 1 < len(queues):
+					await queues[stage + 1].put(position)
+
+		async def feed():
+			for position in range(len(records)):
+				await queues[0].put(position)
+			# stop the workers stage by stage, once the previous stage can't pass rows anymore
+			for stage, stage_workers in enumerate(workers):
+				for _ in stage_workers:
+					await queues[stage].put(None)
+				await asyncio.gather(*stage_workers)
+
+		workers = [
+			[asyncio.ensure_future(work(stage)) for _ in range(num_workers)]
+			for stage in range(len(skill_sequence))
+		]
+		tasks = [asyncio.ensure_future(feed())] + [worker for stage_workers in workers for worker in stage_workers]
+		try:
+			# the first error stops the pipeline
+			done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+			for task in done:
+				task.result()
+		finally:
+			for task in tasks:
+				task.cancel()
+		return _merge_row_outputs(input, outputs)
+
+	def _get_skill_sequence(self, improved_skill: Optional[str] = None) -> List[str]:
 		if improved_skill:
 			# start from the specified skill, assuming previous skills have already been applied
-			skill_sequence = self.skill_sequence[
+			return self.skill_sequence[
 					self.skill_sequence.index(improved_skill) :
 			]
+		return self.skill_sequence
+
+	def _merge_skill_output(
+		self,
+		skill: Skill,
+		skill_input: Union[ColumnarContext, Record, InternalDataFrame, InternalSeries],
+		skill_output: Union[InternalDataFrame, InternalSeries],
+	) -> Union[ColumnarContext, InternalDataFrame, InternalSeries]:
+		if isinstance(skill, (TransformSkill, RetrievalSkill)):
+			if not isinstance(skill_input, ColumnarContext):
+				skill_input = ColumnarContext(_to_frame(skill_input))
+			# output columns are added by reference, replacing the input columns with the same name
+			return skill_input.add_columns(skill_output)
+		elif isinstance(skill, (AnalysisSkill, SynthesisSkill)):
+			# the record or dataframe is passed as is to the next skill
+			return skill_output
 		else:
-			skill_sequence = self.skill_sequence
-		skill_input = input
-		for i, skill_name in enumerate(skill_sequence):
-			skill = self.skills[skill_name]
-			# use input dataset for the first node in the pipeline
-			print_text(f"Applying skill: {skill_name}")
-			skill_output = skill.apply(skill_input, runtime)
-			if isinstance(skill, TransformSkill):
-				# Columns to drop from skill_input because they are also in skill_output
-				cols_to_drop = set(skill_output.columns) & set(skill_input.columns)
-				skill_input_reduced = skill_input.drop(columns=cols_to_drop)
-
-				skill_input = skill_input_reduced.merge(
-						skill_output, left_index=True, right_index=True, how="inner"
-				)
-			elif isinstance(skill, (AnalysisSkill, SynthesisSkill)):
-				skill_input = skill_output
-			else:
-				raise ValueError(f"Unsupported skill type: {type(skill)}")
-		if isinstance(skill_input, InternalSeries):
-				skill_input = skill_input.to_frame().T
-		return skill_input
+			raise ValueError(f"Unsupported skill type: {type(skill)}")
 
 	def __rich__(self):
 		"""Returns a rich representation of the skill."""
@@ -222,6 +541,7 @@ class ParallelSkillSet(SkillSet):
 		input: Union[InternalSeries, InternalDataFrame],
 		runtime: Runtime,
 		improved_skill: Optional[str] = None,
+		memo: Optional[SkillOutputMemo] = None,
 	) -> InternalDataFrame:
 		"""
 		Applies each skill on the dataset, enhancing the agent's experience.
@@ -230,33 +550,64 @@ class ParallelSkillSet(SkillSet):
 			input (Union[Record, InternalDataFrame]): Input data
 			runtime (Runtime): The runtime environment in which to apply the skills.
 			improved_skill (Optional[str], optional): Unused in ParallelSkillSet. Defaults to None.
+			memo (SkillOutputMemo, optional): Memo of the skill outputs. Defaults to None.
+		Returns:
+			Union[Record, InternalDataFrame]: Skill predictions.
+		"""
+		skill_sequence = self._get_skill_sequence(improved_skill)
+		print_text(f"Applying skills: {', '.join(skill_sequence)}")
+		skill_outputs = map_concurrently(
+			lambda skill_name: self._apply_skill(self.skills[skill_name], input, runtime, memo),
+			skill_sequence,
+			max_workers=len(skill_sequence),
+			unit='skill',
+		)
+		return self._combine_skill_outputs(input, skill_outputs)
+
+	async def aapply(
+		self,
+		input: Union[InternalSeries, InternalDataFrame],
+		runtime: Runtime,
+		improved_skill: Optional[str] = None,
+		memo: Optional[SkillOutputMemo] = None,
+	) -> InternalDataFrame:
+		"""
+		Asynchronously applies all the skills on the dataset at the same time.
+
+		Args:
+			input (Union[Record, InternalDataFrame]): Input data
+			runtime (Runtime): The runtime environment in which to apply the skills.
+			improved_skill (Optional[str], optional): Unused in ParallelSkillSet. Defaults to None.
+			memo (SkillOutputMemo, optional): Memo of the skill outputs. Defaults to None.
 		Returns:
 			Union[Record, InternalDataFrame]: Skill predictions.
 		"""
+		skill_sequence = self._get_skill_sequence(improved_skill)
+		print_text(f"Applying skills: {', '.join(skill_sequence)}")
+		skill_outputs = await asyncio.gather(
+			*[self._aapply_skill(self.skills[skill_name], input, runtime, memo) for skill_name in skill_sequence]
+		)
+		return self._combine_skill_outputs(input, list(skill_outputs))
+
+	def _get_skill_sequence(self, improved_skill: Optional[str] = None) -> List[str]:
 		if improved_skill:
 			# start from the specified skill, assuming previous skills have already been applied
-			skill_sequence = [improved_skill]
-		else:
-			skill_sequence = list(self.skills.keys())
+			return [improved_skill]
+		return list(self.skills.keys())
 
-		skill_outputs = []
-		for i, skill_name in enumerate(skill_sequence):
-			skill = self.skills[skill_name]
-			# use input dataset for the first node in the pipeline
-			print_text(f"Applying skill: {skill_name}")
-			skill_output = skill.apply(input, runtime)
-			skill_outputs.append(skill_output)
+	def _combine_skill_outputs(
+		self,
+		input: Union[InternalSeries, InternalDataFrame],
+		skill_outputs: List[Union[InternalDataFrame, InternalSeries]],
+	) -> InternalDataFrame:
 		if not skill_outputs:
 			return InternalDataFrame()
 		else:
 			if isinstance(skill_outputs[0], InternalDataFrame):
-				skill_outputs = InternalDataFrameConcat(skill_outputs, axis=1)
-				cols_to_drop = set(input.columns) & set(skill_outputs.columns)
-				skill_input_reduced = input.drop(columns=cols_to_drop)
-
-				return skill_input_reduced.merge(
-					skill_outputs, left_index=True, right_index=True, how="inner"
-				)
+				context = ColumnarContext(input)
+				for skill_output in skill_outputs:
+					context.add_columns(skill_output)
+				return context.to_frame()
 			elif isinstance(skill_outputs[0], (dict, InternalSeries)):
 				# concatenate output to each row of input
 				output = skill_outputs[0]
@@ -272,4 +623,243 @@ class ParallelSkillSet(SkillSet):
 					axis=1,
 				)
 			else:
-				raise ValueError(f"Unsupported output type: {type(skill_outputs[0])}")
\ No newline at end of file
+				raise ValueError(f"Unsupported output type: {type(skill_outputs[0])}")
+
+
+class _RowSchedule:
+	"""
+	Tracks which skills of a GraphSkillSet are done for each row, and which (row, skill) calls are
+	ready to run. Calls of the deepest skills come first, then the first rows, so the rows started
+	first flow to the end of the graph before new rows are started.
+	"""
+
+	def __init__(self, dependencies: Dict[str, List[str]], num_rows: int):
+		self.dependencies = dependencies
+		self.dependents = {name: [] for name in dependencies}
+		for name, parents in dependencies.items():
+			for parent in parents:
+				self.dependents[parent].append(name)
+		self.depths = {}
+		for name in dependencies:
+			self._get_depth(name)
+		self.done: List[set] = [set() for _ in range(num_rows)]
+		self._ready: List[Tuple[int, int, str]] = []
+		for position in range(num_rows):
+			for name, parents in dependencies.items():
+				if not parents:
+					heapq.heappush(self._ready, (0, position, name))
+
+	def _get_depth(self, name: str) -> int:
+		if name not in self.depths:
+			self.depths[name] = 1 + max((self._get_depth(parent) for parent in self.dependencies[name]), default=-1)
+		return self.depths[name]
+
+	def pop_ready(self) -> Optional[Tuple[int, str]]:
+		"""Returns the next (row position, skill name) call to run, or None if no call is ready."""
+		if not self._ready:
+			return None
+		_, position, name = heapq.heappop(self._ready)
+		return position, name
+
+	def complete(self, position: int, name: str):
+		"""Marks a call as done, making the calls of the dependent skills for the row ready."""
+		done = self.done[position]
+		done.add(name)
+		for dependent in self.dependents[name]:
+			if all(parent in done for parent in self.dependencies[dependent]):
+				heapq.heappush(self._ready, (-self.depths[dependent], position, dependent))
+
+
+class GraphSkillSet(SkillSet):
+	"""
+	Represents skills forming a directed acyclic graph, where a skill depends on the skills
+	producing the fields used by its input or instruction template.
+
+	The dependencies are inferred from `get_input_fields()` and `get_output_fields()`. Each row goes
+	through the graph on its own: a skill is applied to a row as soon as the skills it depends on are
+	done for that row, so independent skills run concurrently and a row can reach the next skill
+	while the other rows are still processed by the previous one. At most `runtime.max_workers`
+	calls are in flight at the same time.
+
+	Only skills transforming rows (TransformSkill, RetrievalSkill) can be part of the graph.
+
+	Examples:
+		>>> skillset = GraphSkillSet(skills=[
+		...     TransformSkill(name='explainer', input_template='{question}', output_template=[{'name': 'explanation', ...}]),
+		...     TransformSkill(name='solver', input_template='{question} {explanation}', output_template=[{'name': 'answer', ...}]),
+		... ])
+		>>> skillset.get_dependencies()
+		{'explainer': [], 'solver': ['explainer']}
+	"""
+
+	@model_validator(mode='after')
+	def dependencies_validator(self) -> 'GraphSkillSet':
+		"""
+		Validates that the skills transform rows and that their dependencies don't form a cycle.
+
+		Returns:
+			GraphSkillSet: The current instance.
+		"""
+		for skill in self.skills.values():
+			if not isinstance(skill, (TransformSkill, RetrievalSkill)):
+				raise ValueError(f"GraphSkillSet only supports skills transforming rows, "
+												f"{skill.name} is a {type(skill).__name__}")
+		self.get_skill_sequence()
+		return self
+
+	def get_dependencies(self) -> Dict[str, List[str]]:
+		"""
+		Get the dependencies of the skills.
+
+		Returns:
+			Dict[str, List[str]]: For each skill name, the names of the skills producing its input fields.
+		"""
+		producers = {}
+		for skill in self.skills.values():
+			for field in skill.get_output_fields():
+				producers.setdefault(field, []).append(skill.name)
+		dependencies = {}
+		for skill in self.skills.values():
+			parents = []
+			for field in skill.get_input_fields():
+				for producer in producers.get(field, []):
+					if producer != skill.name and producer not in parents:
+						parents.append(producer)
+			dependencies[skill.name] = parents
+		return dependencies
+
+	def get_skill_sequence(self) -> List[str]:
+		"""
+		Get the skill names in a topological order of the dependencies.
+
+		Returns:
+			List[str]: The skill names, each one after the skills it depends on.
+		"""
+		dependencies = self.get_dependencies()
+		sequence = []
+		remaining = list(self.skills)
+		while remaining:
+			ready = [name for name in remaining if all(parent in sequence for parent in dependencies[name])]
+			if not ready:
+				raise ValueError(f"Skills {remaining} have circular dependencies")
+			sequence.extend(ready)
+			remaining = [name for name in remaining if name not in ready]
+		return sequence
+
+	def _get_dependencies(self, improved_skill: Optional[str] = None) -> Dict[str, List[str]]:
+		"""Returns the dependencies of the skills to apply: all the skills, or the improved skill
+		and the skills depending on it, assuming the other skills have already been applied."""
+		dependencies = self.get_dependencies()
+		if not improved_skill:
+			return dependencies
+		selected = [improved_skill]
+		for name in self.get_skill_sequence():
+			if any(parent in selected for parent in dependencies[name]):
+				selected.append(name)
+		return {
+			name: [parent for parent in dependencies[name] if parent in selected]
+			for name in self.get_skill_sequence() if name in selected
+		}
+
+	def _get_record(self, records: List[Dict[str, Any]], outputs: List[Dict[str, Any]], position: int) -> Dict[str, Any]:
+		return {**records[position], **outputs[position]}
+
+	def _get_output_columns(self, dependencies: Dict[str, List[str]]) -> List[str]:
+		# rows are completed in any order, the output columns follow the skill sequence
+		return [field for name in dependencies for field in self.skills[name].get_output_fields()]
+
+	def apply(
+		self,
+		input: Union[Record, InternalDataFrame],
+		runtime: Runtime,
+		improved_skill: Optional[str] = None,
+		memo: Optional[SkillOutputMemo] = None,
+	) -> InternalDataFrame:
+		"""
+		Applies the skills on the dataset, each row flowing through the graph independently.
+
+		Args:
+			input (Union[Record, InternalDataFrame]): Input dataset.
+			runtime (Runtime): The runtime environment in which to apply the skills.
+			improved_skill (Optional[str], optional): Name of the skill to improve: only this skill and
+				the skills depending on it are applied. Defaults to None.
+			memo (SkillOutputMemo, optional): Memo of the skill outputs. Defaults to None.
+		Returns:
+			InternalDataFrame: Skill predictions.
+		"""
+		input = _to_frame(input)
+		records = input.to_dict(orient='records')
+		outputs = [{} for _ in records]
+		schedule = _RowSchedule(self._get_dependencies(improved_skill), len(records))
+		print_text(f"Applying skills: {', '.join(schedule.dependencies)}")
+		max_workers = max(1, runtime.max_workers)
+		with ThreadPoolExecutor(max_workers=max_workers) as executor:
+			futures = {}
+			try:
+				while True:
+					while len(futures) < max_workers:
+						call = schedule.pop_ready()
+						if call is None:
+							break
+						position, name = call
+						futures[executor.submit(
+							self._apply_record, self.skills[name], self._get_record(records, outputs, position), runtime, memo)] = call
+					if not futures:
+						break
+					done, _ = wait(futures, return_when=FIRST_COMPLETED)
+					for future in done:
+						position, name = futures.pop(future)
+						outputs[position].update(future.result())
+						schedule.complete(position, name)
+			finally:
+				for future in futures:
+					future.cancel()
+		return _merge_row_outputs(input, outputs, self._get_output_columns(schedule.dependencies))
+
+	async def aapply(
+		self,
+		input: Union[Record, InternalDataFrame],
+		runtime: Runtime,
+		improved_skill: Optional[str] = None,
+		memo: Optional[SkillOutputMemo] = None,
+	) -> InternalDataFrame:
+		"""
+		Asynchronously applies the skills on the dataset, each row flowing through the graph independently.
+
+		Args:
+			input (Union[Record, InternalDataFrame]): Input dataset.
+			runtime (Runtime): The runtime environment in which to apply the skills.
+			improved_skill (Optional[str], optional): Name of the skill to improve: only this skill and
+				the skills depending on it are applied. Defaults to None.
+			memo (SkillOutputMemo, optional): Memo of the skill outputs. Defaults to None.
+		Returns:
+			InternalDataFrame: Skill predictions.
+		"""
+		input = _to_frame(input)
+		records = input.to_dict(orient='records')
+		outputs = [{} for _ in records]
+		schedule = _RowSchedule(self._get_dependencies(improved_skill), len(records))
+		print_text(f"Applying skills: {', '.join(schedule.dependencies)}")
+		max_workers = max(1, runtime.max_workers)
+		tasks = {}
+		try:
+			while True:
+				while len(tasks) < max_workers:
+					call = schedule.pop_ready()
+					if call is None:
+						break
+					position, name = call
+					tasks[asyncio.ensure_future(
+						self._aapply_record(self.skills[name], self._get_record(records, outputs, position), runtime, memo))] = call
+				if not tasks:
+					break
+				done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+				for task in done:
+					position, name = tasks.pop(task)
+					outputs[position].update(task.result())
+					schedule.complete(position, name)
+		finally:
+			for task in tasks:
+				task.cancel()
+		return _merge_row_outputs(input, outputs, self._get_output_columns(schedule.dependencies))
+
@@ -0,0 +1,80 @@
+import asyncio
+import re
+import threading
+
+import pytest
+
+from ally.runtimes.fake import FakeRuntime
+from ally.skills.base import AnalysisSkill
+from ally.utils.internal_data import InternalDataFrame
+from ally.utils.tokens import chunk_by_tokens, count_tokens
+
+
+class RowCounter:
+	"""Output generator counting the rows of a chunk, or summing the counts of partial analyses."""
+
+	def __init__(self):
+		self.inputs = []
+		self.lock = threading.Lock()
+
+	def __call__(self, inputs, output_fields, rng):
+		text = inputs['aggregated_input']
+		with self.lock:
+			self.inputs.append(text)
+		counts = re.findall(r'count: (\d+)', text)
+		if counts:
+			return {'count': str(sum(int(count) for count in counts))}
+		return {'count': str(len(re.findall(r'^Row \d+', text, re.MULTILINE)))}
+
+
+def _skill(chunk_tokens):
+	return AnalysisSkill(
+		name='counter',
+		input_template='Row {id}: {text}',
+		output_template=[{'name': 'count', 'description': 'number of rows'}],
+		instruction_template='Count the rows.',
+		chunk_tokens=chunk_tokens,
+	)
+
+
+def _batch(num_rows):
+	return InternalDataFrame({'id': range(num_rows), 'text': [f'some text number {i}' for i in range(num_rows)]})
+
+
+def test_chunks_are_limited_by_tokens():
+	texts = ['one two three', 'four', 'a much longer text that does not fit in a chunk', 'five', 'six']
+	# one more token per text for the separator
+	max_tokens = count_tokens('one two three') + count_tokens('four') + 2
+	chunks = list(chunk_by_tokens(iter(texts), max_tokens=max_tokens))
+	assert chunks == [['one two three', 'four'], ['a much longer text that does not fit in a chunk'], ['five', 'six']]
+	assert list(chunk_by_tokens(texts, max_tokens=1, min_texts=2)) == [texts[:2], texts[2:4], texts[4:]]
+
+
+@pytest.mark.parametrize('asynchronous', [False, True])
+def test_rows_are_analyzed_by_chunks_and_reduced(asynchronous, monkeypatch):
+	counter = RowCounter()
+	runtime = FakeRuntime(output_generator=counter, max_workers=4)
+	skill = _skill(chunk_tokens=100)
+	# the concatenation of all the rows is never built
+	monkeypatch.setattr(AnalysisSkill, '_aggregate_input', lambda self, input: pytest.fail('aggregated'))
+
+	batch = _batch(500)
+	if asynchronous:
+		output = asyncio.run(skill.aapply(batch, runtime))
+	else:
+		output = skill.apply(batch, runtime)
+
+	assert output['count'] == '500'
+	map_inputs = [text for text in counter.inputs if text.startswith('Row')]
+	assert len(map_inputs) > 4
+	assert all(count_tokens(text) <= 100 for text in map_inputs)
+	assert sum(len(text.splitlines()) for text in map_inputs) == 500
+	# the partial analyses are combined in several levels
+	assert len(counter.inputs) > len(map_inputs) + 1
+
+
+def test_small_inputs_are_analyzed_by_a_single_call():
+	counter = RowCounter()
+	output = _skill(chunk_tokens=10000).apply(_batch(10), FakeRuntime(output_generator=counter))
+	assert output['count'] == '10'
+	assert counter.inputs == ['\n'.join(f'Row {i}: some text number {i}' for i in range(10))]
@@ -0,0 +1,134 @@
+import asyncio
+import time
+import tracemalloc
+
+import pytest
+
+from ally.agents.base import Agent
+from ally.environments.base import StaticEnvironment
+from ally.runtimes.fake import FakeLLMError, FakeRuntime, LatencyDistribution
+from ally.runtimes.rate_limit import clear_rate_limiters
+from ally.skills.collection.classification import ClassificationSkill
+from ally.skills.skillset import LinearSkillSet
+from ally.utils.internal_data import InternalDataFrame
+
+OUTPUT_TEMPLATE = [{'name': 'label', 'description': 'the label'}]
+
+
+def setup_function():
+	clear_rate_limiters()
+
+
+def _labels(inputs, output_fields, rng):
+	return {field: rng.choice(['positive', 'negative']) for field in output_fields}
+
+
+def _batch_to_batch(runtime, texts):
+	return runtime.batch_to_batch(
+		InternalDataFrame({'text': texts}),
+		input_template='{text}',
+		output_template=OUTPUT_TEMPLATE,
+		instruction_template='Label the text.',
+	)
+
+
+def test_outputs_are_deterministic_regardless_of_scheduling():
+	texts = [f'text {i}' for i in range(50)]
+	sequential = _batch_to_batch(FakeRuntime(seed=1, output_generator=_labels), texts)
+	concurrent = _batch_to_batch(FakeRuntime(seed=1, output_generator=_labels, max_workers=8), texts)
+	other_seed = _batch_to_batch(FakeRuntime(seed=2, output_generator=_labels), texts)
+	assert sequential['label'].tolist() == concurrent['label'].tolist()
+	assert sequential['label'].tolist() != other_seed['label'].tolist()
+	assert set(sequential['label']) == {'positive', 'negative'}
+
+
+def test_latency_distributions():
+	runtime = FakeRuntime(latency=0.2, jitter=0.05, latency_distribution=LatencyDistribution.Normal)
+	latencies = [runtime._sample_latency(runtime._get_call_rng(str(i))) for i in range(2000)]
+	assert 0.19 < sum(latencies) / len(latencies) < 0.21
+	runtime.latency_distribution = LatencyDistribution.Uniform
+	latencies = [runtime._sample_latency(runtime._get_call_rng(str(i))) for i in range(2000)]
+	assert min(latencies) >= 0.15 and max(latencies) <= 0.25
+
+
+def test_simulated_errors():
+	with pytest.raises(FakeLLMError):
+		_batch_to_batch(FakeRuntime(error_rate=1.0), ['a'])
+
+	# rate-limit errors are retried by the rate limiter
+	runtime = FakeRuntime(rate_limit_rate=0.3, requests_per_minute=100000, max_workers=4, seed=3)
+	runtime._get_rate_limiter().max_backoff = 0.01
+	output = _batch_to_batch(runtime, [f'text {i}' for i in range(40)])
+	stats = runtime.get_stats()
+	assert output['label'].notnull().all()
+	assert stats['num_errors'] > 0
+	assert stats['num_calls'] == 40 + stats['num_errors']
+
+
+def test_malformed_outputs_exercise_parse_fallbacks():
+	runtime = FakeRuntime(unfenced_rate=0.3, truncated_rate=0.2)
+	_batch_to_batch(runtime, [f'text {i}' for i in range(100)])
+	stats = runtime.parse_stats()
+	assert stats['parsed'] > 0 and stats['fast_path'] > 0 and stats['raw'] > 0
+	assert stats['parsed'] + stats['fast_path'] + stats['raw'] == 100
+
+
+def _agent(df, **runtime_params):
+	skills = LinearSkillSet(skills=[
+		ClassificationSkill(
+			name='sentiment',
+			instruction_template='Label the text.',
+			input_template='{text}',
+			output_template=[{'name': 'sentiment', 'description': 'the label'}],
+		),
+		ClassificationSkill(
+			name='topic',
+			instruction_template='Find the topic.',
+			input_template='{text} ({sentiment})',
+			output_template=[{'name': 'topic', 'description': 'the topic'}],
+		),
+	])
+	runtime = FakeRuntime(output_generator=_labels, **runtime_params)
+	return Agent(
+		skills=skills,
+		environment=StaticEnvironment(df=df, matching_function='exact'),
+		runtimes={'fake': runtime},
+		teacher_runtimes={'fake': FakeRuntime()},
+		default_runtime='fake',
+		default_teacher_runtime='fake',
+	)
+
+
+def test_agent_load_10k_rows():
+	num_rows = 10000
+	df = InternalDataFrame({'text': [f'text {i}' for i in range(num_rows)]})
+	agent = _agent(df, max_workers=4)
+
+	tracemalloc.start()
+	start_time = time.perf_counter()
+	output = agent.run(df)
+	elapsed = time.perf_counter() - start_time
+	_, peak_memory = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	assert len(output) == num_rows
+	# the whole run holds a few copies of the frame at most, and the fake calls stay cheap
+	assert peak_memory < 64 * 2 ** 20
+	assert elapsed / (2 * num_rows) < 0.01
+	assert output[['sentiment', 'topic']].notnull().all().all()
+	assert agent.runtimes['fake'].get_stats()['num_calls'] == 2 * num_rows
+
+	async_output = asyncio.run(agent.arun(df.head(1000)))
+	assert async_output['topic'].tolist() == output['topic'].head(1000).tolist()
+
+
+def test_agent_learn_with_fake_runtimes():
+	df = InternalDataFrame({
+		'text': [f'text {i}' for i in range(200)],
+		'sentiment': ['positive'] * 200,
+		'topic': ['sports'] * 200,
+	})
+	agent = _agent(df, max_workers=8)
+	agent.learn(learning_iterations=1, batch_size=100)
+	assert agent.teacher_runtimes['fake'].get_stats()['num_calls'] > 0
+	assert agent.skills['sentiment'].instruction_template != 'Label the text.'
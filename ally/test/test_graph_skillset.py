@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+import pytest
+
+from ally.agents.base import Agent
+from ally.runtimes.fake import FakeRuntime
+from ally.skills.base import AnalysisSkill
+from ally.skills.skillset import GraphSkillSet, ParallelSkillSet
+from ally.test.utils import CallLog, transform_skill
+from ally.utils.internal_data import InternalDataFrame
+
+SOURCES = {'answer': 'question', 'explanation': 'question', 'keywords': 'question'}
+
+
+def _skillset():
+	return GraphSkillSet(skills=[
+		transform_skill('solver', '{question} {explanation} {keywords}', 'answer'),
+		transform_skill('explainer', '{question}', 'explanation'),
+		transform_skill('keywords', '{question}', 'keywords'),
+	])
+
+
+def _batch(num_rows):
+	return InternalDataFrame({'question': [f'q{i}' for i in range(num_rows)]}, index=[f'id-{i}' for i in range(num_rows)])
+
+
+def test_dependencies_are_inferred_from_the_templates():
+	skillset = _skillset()
+	assert skillset.get_dependencies() == {'solver': ['explainer', 'keywords'], 'explainer': [], 'keywords': []}
+	assert skillset.get_skill_sequence() == ['explainer', 'keywords', 'solver']
+
+	with pytest.raises(ValueError, match='circular'):
+		GraphSkillSet(skills=[transform_skill('a', '{y}', 'x'), transform_skill('b', '{x}', 'y')])
+	with pytest.raises(ValueError, match='AnalysisSkill'):
+		GraphSkillSet(skills=[AnalysisSkill(name='analysis', instruction_template='')])
+
+
+def test_rows_flow_to_the_next_skill_as_soon_as_their_inputs_are_ready():
+	log = CallLog(SOURCES)
+	runtime = FakeRuntime(output_generator=log, latency=0.02, max_workers=2)
+	output = _skillset().apply(_batch(6), runtime)
+
+	assert output.index.tolist() == [f'id-{i}' for i in range(6)]
+	assert output['question'].tolist() == [f'q{i}' for i in range(6)]
+	assert output['answer'].tolist() == [f'q{i}.answer' for i in range(6)]
+	assert output['explanation'].tolist() == [f'q{i}.explanation' for i in range(6)]
+	# the first row is solved before the explanations of the last rows are started
+	assert log.calls.index(('answer', 'q0')) < log.calls.index(('explanation', 'q5'))
+
+
+def test_independent_skills_run_concurrently():
+	runtime = FakeRuntime(output_generator=CallLog(SOURCES), latency=0.1, max_workers=4)
+	start_time = time.perf_counter()
+	output = asyncio.run(_skillset().aapply(_batch(2), runtime))
+	# explainer and keywords of both rows in parallel, then the solvers
+	assert time.perf_counter() - start_time < 0.35
+	assert output['answer'].tolist() == ['q0.answer', 'q1.answer']
+
+
+def test_only_the_improved_skill_and_its_dependents_are_applied():
+	log = CallLog(SOURCES)
+	runtime = FakeRuntime(output_generator=log)
+	predictions = _skillset().apply(_batch(2), runtime)
+	log.calls.clear()
+
+	_skillset().apply(predictions, runtime, improved_skill='keywords')
+	assert sorted(field for field, _ in log.calls) == ['answer', 'answer', 'keywords', 'keywords']
+
+
+def test_agent_learns_with_a_graph_skillset():
+	agent = Agent(skills=_skillset(), runtimes={'fake': FakeRuntime(output_generator=CallLog(SOURCES), max_workers=4)})
+	predictions = agent.run(_batch(3), runtime='fake')
+	assert predictions['answer'].tolist() == ['q0.answer', 'q1.answer', 'q2.answer']
+
+
+def test_parallel_skillset_applies_the_skills_concurrently():
+	skills = ParallelSkillSet(skills=[
+		transform_skill('explainer', '{question}', 'explanation'),
+		transform_skill('keywords', '{question}', 'keywords'),
+	])
+	runtime = FakeRuntime(output_generator=CallLog(SOURCES), latency=0.1)
+	start_time = time.perf_counter()
+	output = skills.apply(_batch(1), runtime)
+	assert time.perf_counter() - start_time < 0.2
+	assert output.columns.tolist() == ['question', 'explanation', 'keywords']
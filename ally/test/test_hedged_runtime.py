@@ -0,0 +1,130 @@
+import asyncio
+import time
+
+import pytest
+
+from ally.runtimes.cache import InMemoryResponseCache
+from ally.runtimes.fake import FakeLLMError, FakeRuntime
+from ally.runtimes.hedged import HedgedRuntime
+from ally.runtimes.latency import LatencyTracker
+from ally.utils.internal_data import InternalDataFrame
+
+OUTPUT_TEMPLATE = [{'name': 'label', 'description': 'the label'}]
+
+
+def _answering(name, **kwargs):
+	return FakeRuntime(output_generator=lambda inputs, fields, rng: {'label': name}, **kwargs)
+
+
+def _batch_to_batch(runtime, num_rows):
+	return runtime.batch_to_batch(
+		InternalDataFrame({'text': [f'text {i}' for i in range(num_rows)]}),
+		input_template='{text}',
+		output_template=OUTPUT_TEMPLATE,
+		instruction_template='Label the text.',
+	)
+
+
+def test_latency_tracker_percentiles():
+	tracker = LatencyTracker(window=100)
+	assert tracker.percentile(50) is None
+	for latency in range(1, 201):
+		tracker.record(latency / 100)
+	stats = tracker.get_stats()
+	assert stats['count'] == 200
+	assert stats['p50'] == 1.5 and stats['p95'] == 1.95 and stats['p99'] == 1.99
+
+
+def test_slow_primary_is_hedged():
+	runtime = HedgedRuntime(
+		runtimes={'primary': _answering('primary', latency=0.5), 'secondary': _answering('secondary', latency=0.01)},
+		initial_hedge_delay=0.05,
+		max_workers=4,
+	)
+	start_time = time.perf_counter()
+	output = _batch_to_batch(runtime, 8)
+	assert time.perf_counter() - start_time < 0.5
+	assert output['label'].tolist() == ['secondary'] * 8
+	stats = runtime.get_stats()
+	assert stats['secondary']['num_hedges'] == 8
+	assert stats['secondary']['num_wins'] == 8
+
+
+def test_hedge_delay_follows_the_latency_percentile():
+	runtime = HedgedRuntime(
+		runtimes={'primary': _answering('primary', latency=0.02), 'secondary': _answering('secondary', latency=0.02)},
+		min_latency_samples=5,
+	)
+	assert runtime.get_stats()['primary']['hedge_delay'] is None
+	output = _batch_to_batch(runtime, 5)
+	assert output['label'].tolist() == ['primary'] * 5
+	stats = runtime.get_stats()['primary']
+	assert stats['count'] == 5
+	assert stats['hedge_delay'] == stats['p95']
+	assert 0.02 <= stats['hedge_delay'] < 0.1
+
+
+def test_failover_on_errors():
+	runtime = HedgedRuntime(runtimes={
+		'primary': _answering('primary', error_rate=1.0),
+		'secondary': _answering('secondary'),
+	})
+	assert _batch_to_batch(runtime, 3)['label'].tolist() == ['secondary'] * 3
+	stats = runtime.get_stats()
+	assert stats['primary']['num_errors'] == 3
+	assert stats['secondary']['num_failovers'] == 3
+
+	runtime = HedgedRuntime(runtimes={'primary': _answering('primary', error_rate=1.0)})
+	with pytest.raises(FakeLLMError):
+		_batch_to_batch(runtime, 1)
+
+
+def test_async_hedging_cancels_the_slow_call():
+	primary = _answering('primary', latency=0.5)
+	runtime = HedgedRuntime(
+		runtimes={'primary': primary, 'secondary': _answering('secondary', latency=0.01)},
+		initial_hedge_delay=0.05,
+		max_workers=4,
+	)
+	start_time = time.perf_counter()
+	output = asyncio.run(runtime.abatch_to_batch(
+		InternalDataFrame({'text': [f'text {i}' for i in range(8)]}),
+		input_template='{text}',
+		output_template=OUTPUT_TEMPLATE,
+		instruction_template='Label the text.',
+	))
+	assert time.perf_counter() - start_time < 0.5
+	assert output['label'].tolist() == ['secondary'] * 8
+	# the primary calls were cancelled before answering
+	assert primary.get_stats()['num_calls'] == 0
+
+
+@pytest.mark.parametrize('asynchronous', [False, True])
+def test_samples_are_hedged(asynchronous):
+	runtime = HedgedRuntime(
+		runtimes={'primary': _answering('primary', samples_per_prompt=4), 'secondary': _answering('secondary')},
+		samples_per_prompt=4,
+	)
+	kwargs = dict(input_template='{text}', output_template=OUTPUT_TEMPLATE, instruction_template='Label the text.')
+	if asynchronous:
+		output = asyncio.run(runtime.arecord_to_batch({'text': 'a text'}, output_batch_size=6, **kwargs))
+	else:
+		output = runtime.record_to_batch({'text': 'a text'}, output_batch_size=6, **kwargs)
+	assert output['label'].tolist() == ['primary'] * 6
+	# 4 + 2 samples
+	assert runtime.get_stats()['primary']['num_wins'] == 2
+	assert runtime.runtimes['primary'].get_stats()['num_calls'] == 2
+
+
+@pytest.mark.parametrize('temperature, num_calls', [('0', 1), ('0.7', 8)])
+def test_calls_are_cached_and_coalesced_only_without_sampling(temperature, num_calls):
+	primary = _answering('primary', llm_params={'temperature': temperature})
+	runtime = HedgedRuntime(
+		runtimes={'primary': primary, 'secondary': _answering('secondary')},
+		response_cache=InMemoryResponseCache(),
+	)
+	batch = InternalDataFrame({'text': ['same text'] * 4})
+	for _ in range(2):
+		runtime.batch_to_batch(
+			batch, input_template='{text}', output_template=OUTPUT_TEMPLATE, instruction_template='Label the text.')
+	assert primary.get_stats()['num_calls'] == num_calls
@@ -0,0 +1,110 @@
+import json
+import re
+import threading
+
+import pytest
+
+from ally.agents.base import Agent
+from ally.environments.base import StaticEnvironment
+from ally.runtimes.base import Runtime
+from ally.runtimes.fake import FakeRuntime
+from ally.skills.base import TransformSkill
+from ally.utils.internal_data import InternalDataFrame
+
+
+class InstructionChain:
+	"""Fake chain labelling every row as positive only if the instruction is one of the good ones."""
+
+	lock = threading.Lock()
+
+	def __init__(self, prompt, good_instructions, calls):
+		self.prompt = prompt
+		self.good_instructions = good_instructions
+		self.calls = calls
+
+	def run(self, inputs):
+		prompt = '\n'.join(message.content for message in self.prompt.format_messages(**inputs))
+		with self.lock:
+			self.calls.append(prompt)
+		label = 'positive' if any(instruction in prompt for instruction in self.good_instructions) else 'negative'
+		return '```json\n' + json.dumps({'sentiment': label}) + '\n```'
+
+
+class InstructionRuntime(Runtime):
+	good_instructions: list = []
+	calls: list = []
+
+	def _create_chain(self):
+		self._chain = InstructionChain(self._llm_prompt_template, self.good_instructions, self.calls)
+
+
+def teacher(inputs, output_fields, rng):
+	if output_fields == ['reasoning']:
+		return {'reasoning': 'The labels are wrong.'}
+	candidate = re.search(r'candidate #(\d+) of', inputs['input'])
+	return {'output': f'Candidate {candidate.group(1) if candidate else 1}.'}
+
+
+def _agent(good_instructions, num_rows=20):
+	df = InternalDataFrame({'text': [f'text {i}' for i in range(num_rows)], 'sentiment': ['positive'] * num_rows})
+	skill = TransformSkill(
+		name='sentiment',
+		input_template='Text: {text}',
+		output_template=[{'name': 'sentiment', 'description': 'sentiment'}],
+		instruction_template='Label the sentiment.',
+	)
+	return Agent(
+		skills=skill,
+		environment=StaticEnvironment(df=df, matching_function='exact'),
+		runtimes={'student': InstructionRuntime(good_instructions=good_instructions, max_workers=4)},
+		teacher_runtimes={'teacher': FakeRuntime(output_generator=teacher, max_workers=4)},
+		default_runtime='student',
+		default_teacher_runtime='teacher',
+	)
+
+
+def test_the_best_candidate_is_kept():
+	agent = _agent(good_instructions=['Candidate 3.'])
+	agent.learn(learning_iterations=1, num_candidates=4)
+
+	assert agent.skills['sentiment'].instruction_template == 'Candidate 3.'
+	# one reasoning call, then the 4 candidates
+	assert agent.teacher_runtimes['teacher'].get_stats()['num_calls'] == 5
+	# 20 predictions, then 4 candidates applied to the 10 held-out rows
+	assert len(agent.runtimes['student'].calls) == 20 + 4 * 10
+
+
+def test_the_current_instruction_is_kept_if_it_scores_better():
+	agent = _agent(good_instructions=['Label the sentiment.'])
+	# every prediction is correct but one, so the skill is improved
+	agent.environment.df.loc[0, 'sentiment'] = 'negative'
+	agent.learn(learning_iterations=1, num_candidates=3)
+	assert agent.skills['sentiment'].instruction_template == 'Label the sentiment.'
+
+
+def test_a_single_candidate_is_adopted():
+	agent = _agent(good_instructions=[])
+	agent.learn(learning_iterations=1)
+	assert agent.skills['sentiment'].instruction_template == 'Candidate 1.'
+	assert agent.teacher_runtimes['teacher'].get_stats()['num_calls'] == 2
+	assert len(agent.runtimes['student'].calls) == 20
+
+
+def test_candidates_require_a_scorer():
+	agent = _agent(good_instructions=[])
+	skill = agent.skills['sentiment']
+	teacher_runtime = agent.teacher_runtimes['teacher']
+	predictions = agent.skills.apply(agent.environment.df, agent.runtimes['student'])
+	feedback = agent.environment.get_feedback(agent.skills, predictions)
+	with pytest.raises(ValueError, match='student_runtime and a scorer'):
+		skill.improve(predictions, 'sentiment', feedback, teacher_runtime, num_candidates=3)
+	# the teacher is not called
+	assert teacher_runtime.get_stats()['num_calls'] == 0
+
+
+def test_a_single_candidate_without_held_out_rows():
+	agent = _agent(good_instructions=[], num_rows=1)
+	agent.learn(learning_iterations=1, num_candidates=4)
+	assert agent.skills['sentiment'].instruction_template == 'Candidate 1.'
+	# one reasoning call, then a single candidate
+	assert agent.teacher_runtimes['teacher'].get_stats()['num_calls'] == 2
@@ -0,0 +1,80 @@
+import json
+import time
+from unittest.mock import patch
+
+import openai
+import pytest
+from langchain.chains.llm import LLMChain
+
+from ally.runtimes.key_pool import ApiKeyPool
+from ally.runtimes.openai import OpenAIRuntime, clear_available_models_cache
+from ally.test.utils import PatchedCalls
+from ally.utils.internal_data import InternalDataFrame
+
+MODELS = {'data': [{'id': 'gpt-3.5-turbo'}]}
+OUTPUT_TEMPLATE = [{'name': 'output', 'description': 'the text'}]
+
+
+def setup_function():
+	clear_available_models_cache()
+
+
+def fake_call(chain, inputs, run_manager=None):
+	api_key = chain.llm.openai_api_key
+	if api_key == 'revoked-key':
+		raise openai.error.AuthenticationError('Incorrect API key provided')
+	# keep the calls in flight long enough for the pool to spread them
+	time.sleep(0.02)
+	return {'text': '```json\n' + json.dumps({'output': api_key}) + '\n```'}
+
+
+def test_key_pool_prefers_fast_keys_and_ejects_failing_ones():
+	pool = ApiKeyPool(['a', 'b', 'c'], ejection_seconds=0.05)
+	for api_key, latency in [('a', 1.0), ('b', 0.1), ('c', 0.5)]:
+		pool.acquire(exclude=[k for k in 'abc' if k != api_key])
+		pool.release(api_key, latency=latency)
+	assert pool.acquire() == 'b'
+	pool.release('b', eject=True)
+	assert pool.acquire() == 'c'
+	time.sleep(0.1)
+	assert pool.acquire() == 'b'
+
+
+def test_key_pool_spreads_calls_by_quota():
+	quotas = {'a': 0.1, 'b': 1.0}
+	pool = ApiKeyPool(['a', 'b'], remaining_quota=quotas.get)
+	assert pool.acquire() == 'b'
+
+
+def test_openai_runtime_spreads_calls_and_skips_revoked_keys():
+	with patch(PatchedCalls.OPENAI_MODEL_LIST.value, return_value=MODELS), \
+			patch.object(LLMChain, '_call', autospec=True, side_effect=fake_call):
+		runtime = OpenAIRuntime(
+			api_keys=['key-1', 'revoked-key', 'key-2'],
+			gpt_model_name='gpt-3.5-turbo',
+			max_workers=4,
+		)
+		output = runtime.batch_to_batch(
+			InternalDataFrame({'text': [str(i) for i in range(12)]}),
+			input_template='{text}',
+			output_template=OUTPUT_TEMPLATE,
+			instruction_template='Repeat the text.',
+		)
+	assert set(output['output']) == {'key-1', 'key-2'}
+	stats = runtime.get_key_pool_stats()
+	assert stats['...-key']['ejected']
+	assert stats['...-key']['num_errors'] == 1
+	assert stats['...ey-1']['num_calls'] + stats['...ey-2']['num_calls'] == 12
+
+
+def test_openai_runtime_raises_when_all_keys_fail():
+	with patch(PatchedCalls.OPENAI_MODEL_LIST.value, return_value=MODELS), \
+			patch.object(LLMChain, '_call', autospec=True, side_effect=fake_call):
+		runtime = OpenAIRuntime(api_keys=['revoked-key'], gpt_model_name='gpt-3.5-turbo')
+		with pytest.raises(openai.error.AuthenticationError):
+			runtime.record_to_record(
+				{'text': 'a'},
+				input_template='{text}',
+				output_template=OUTPUT_TEMPLATE,
+				instruction_template='Repeat the text.',
+			)
@@ -0,0 +1,59 @@
+from unittest.mock import patch
+
+import pytest
+
+from ally.runtimes.openai import (ModelValidation, OpenAIRuntime,
+                                  clear_available_models_cache)
+from ally.test.utils import PatchedCalls
+
+MODELS = {'data': [{'id': 'gpt-3.5-turbo'}, {'id': 'gpt-4'}]}
+
+
+def setup_function():
+	clear_available_models_cache()
+
+
+def test_model_list_is_fetched_once_per_api_key():
+	with patch(PatchedCalls.OPENAI_MODEL_LIST.value, return_value=MODELS) as model_list:
+		for _ in range(3):
+			OpenAIRuntime(api_key='key-1', gpt_model_name='gpt-3.5-turbo')
+		OpenAIRuntime(api_key='key-2', gpt_model_name='gpt-4')
+	assert model_list.call_count == 2
+
+
+def test_unavailable_model_is_rejected_from_cache():
+	with patch(PatchedCalls.OPENAI_MODEL_LIST.value, return_value=MODELS) as model_list:
+		OpenAIRuntime(api_key='key-1', gpt_model_name='gpt-3.5-turbo')
+		with pytest.raises(ValueError):
+			OpenAIRuntime(api_key='key-1', gpt_model_name='unknown-model')
+	assert model_list.call_count == 1
+
+
+def test_deferred_and_skipped_validation():
+	with patch(PatchedCalls.OPENAI_MODEL_LIST.value, return_value=MODELS) as model_list:
+		OpenAIRuntime(
+			api_key='key-1', gpt_model_name='gpt-4', availability_check=ModelValidation.Skip)
+		runtime = OpenAIRuntime(
+			api_key='key-1', gpt_model_name='unknown-model', availability_check=ModelValidation.Deferred)
+		assert model_list.call_count == 0
+		with pytest.raises(ValueError):
+			runtime.record_to_record(
+				{'text': 'hello'},
+				input_template='{text}',
+				output_template=[{'name': 'output', 'description': 'output'}],
+				instruction_template='Repeat the text.',
+			)
+	assert model_list.call_count == 1
+
+
+def test_model_validation_is_a_deprecated_alias():
+	with patch(PatchedCalls.OPENAI_MODEL_LIST.value, return_value=MODELS) as model_list:
+		with pytest.warns(DeprecationWarning):
+			runtime = OpenAIRuntime(api_key='key-1', gpt_model_name='gpt-4', model_validation=ModelValidation.Skip)
+	assert model_list.call_count == 0
+	assert runtime.availability_check == ModelValidation.Skip
+	with pytest.warns(DeprecationWarning):
+		runtime.model_validation = ModelValidation.Deferred
+	assert runtime.availability_check == ModelValidation.Deferred
+	with pytest.warns(DeprecationWarning):
+		assert runtime.model_validation == ModelValidation.Deferred
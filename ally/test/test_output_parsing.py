@@ -0,0 +1,73 @@
+import json
+from typing import Any, Dict
+
+from ally.test.utils import SleepingChain, SleepingRuntime
+from ally.utils.output_parsing import extract_json, extract_structured_output
+
+OUTPUT_TEMPLATE = [{'name': 'label', 'description': 'the label'}]
+
+
+def test_extract_json_ignores_surrounding_text():
+	assert extract_json('Sure! {"label": "positive"} Hope it helps {"x": 1}') == {'label': 'positive'}
+	assert extract_json('```JSON\n[{"label": "a"}]\n```\ntrailing') == [{'label': 'a'}]
+	assert extract_json('no json here') is None
+
+
+def test_extract_structured_output():
+	fields = ['label', 'score']
+	assert extract_structured_output('```\n{"Label": "a", "score": 1, "extra": 2}\n```', fields) == {'label': 'a', 'score': 1}
+	assert extract_structured_output('{"label": "a"}', fields) is None
+	assert extract_structured_output('positive', ['label']) == {'label': 'positive'}
+	assert extract_structured_output('   ', ['label']) is None
+
+
+class SloppyChain(SleepingChain):
+	"""Fake chain answering without the fenced block expected by the output parser,
+	and fixing the completions it is asked to fix, unless they are unfixable."""
+
+	def _format_output(self, inputs: Dict[str, Any]) -> str:
+		if 'completion' in inputs:
+			if 'unfixable' in inputs['prompt']:
+				return inputs['completion']
+			return '```json\n{"label": "fixed"}\n```'
+		if inputs['text'] in ('broken', 'unfixable'):
+			return '{"label": '
+		return 'The answer is ' + json.dumps({'label': inputs['text']}) + ', as requested.'
+
+
+class SloppyRuntime(SleepingRuntime):
+
+	def _create_chain(self):
+		self._chain = SloppyChain(prompt=self._llm_prompt_template, delay=0)
+
+
+def _record_to_record(runtime, text):
+	return runtime.record_to_record(
+		{'text': text},
+		input_template='{text}',
+		output_template=OUTPUT_TEMPLATE,
+		instruction_template='Label the text.',
+	)
+
+
+def test_fast_path_recovers_without_llm_retry():
+	runtime = SloppyRuntime()
+	assert _record_to_record(runtime, 'positive') == {'label': 'positive'}
+	assert _record_to_record(runtime, 'broken') == {'output': '{"label": '}
+	assert runtime.parse_stats() == {'parsed': 0, 'fast_path': 1, 'llm_retry': 0, 'raw': 1}
+
+
+def test_llm_retry_is_the_last_resort():
+	runtime = SloppyRuntime(parse_retry_with_llm=True)
+	assert _record_to_record(runtime, 'positive') == {'label': 'positive'}
+	assert _record_to_record(runtime, 'broken') == {'label': 'fixed'}
+	assert runtime.parse_stats() == {'parsed': 0, 'fast_path': 1, 'llm_retry': 1, 'raw': 0}
+	# the retry is made with a chain of the runtime, like the other calls
+	assert runtime._prepare_parse_retry_chain().num_calls == 1
+
+
+def test_failed_llm_retries_return_the_raw_output():
+	runtime = SloppyRuntime(parse_retry_with_llm=True, max_parse_retries=2)
+	assert _record_to_record(runtime, 'unfixable') == {'output': '{"label": '}
+	assert runtime.parse_stats() == {'parsed': 0, 'fast_path': 0, 'llm_retry': 0, 'raw': 1}
+	assert runtime._prepare_parse_retry_chain().num_calls == 2
@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+import pytest
+
+from ally.runtimes.rate_limit import (RateLimiter, TokenBucket,
+                                      clear_rate_limiters, is_rate_limit_error)
+from ally.test.utils import SleepingChain, SleepingRuntime
+from ally.utils.internal_data import InternalDataFrame
+
+OUTPUT_TEMPLATE = [{'name': 'output', 'description': 'upper-cased text'}]
+
+
+class RateLimitError(Exception):
+	http_status = 429
+
+
+class FlakyChain(SleepingChain):
+	"""Fake chain failing with a rate-limit error on every other call."""
+
+	def run(self, inputs):
+		if self.num_calls % 2 == 0:
+			self.num_calls += 1
+			raise RateLimitError('Rate limit reached')
+		return super().run(inputs)
+
+
+class FlakyRuntime(SleepingRuntime):
+
+	def _create_chain(self):
+		self._chain = FlakyChain(prompt=self._llm_prompt_template, delay=0)
+
+
+def setup_function():
+	clear_rate_limiters()
+
+
+def test_token_bucket_reservations():
+	bucket = TokenBucket(capacity=60)
+	assert bucket.reserve(60) == 0.0
+	# refilled at one token per second
+	assert bucket.reserve(2) == pytest.approx(2.0, abs=0.05)
+
+
+def test_aimd_concurrency_window():
+	limiter = RateLimiter(max_concurrency=8, max_backoff=0.01)
+	limiter.acquire()
+	limiter.release(rate_limited=True)
+	assert limiter.concurrency_limit == 4
+	limiter.acquire()
+	limiter.release(rate_limited=True)
+	assert limiter.concurrency_limit == 2
+	for _ in range(3):
+		limiter.acquire()
+		limiter.release()
+	assert 2 < limiter.concurrency_limit < 4
+	assert limiter.num_rate_limited == 2
+
+
+def test_requests_per_minute_budget_is_enforced():
+	runtime = SleepingRuntime(requests_per_minute=600, max_workers=4)
+	batch = InternalDataFrame({'text': [str(i) for i in range(15)]})
+	start_time = time.perf_counter()
+	runtime.batch_to_batch(batch, input_template='{text}', output_template=OUTPUT_TEMPLATE,
+		instruction_template='Upper-case the text.')
+	# the burst of 600 rpm bucket covers the whole batch
+	assert time.perf_counter() - start_time < 1.0
+
+	runtime = SleepingRuntime(requests_per_minute=60, max_workers=4)
+	runtime.llm_params = {'model_name': 'slow-model'}
+	limiter = runtime._get_rate_limiter()
+	limiter.requests_bucket.reserve(60)
+	start_time = time.perf_counter()
+	runtime.record_to_record({'text': 'a'}, input_template='{text}', output_template=OUTPUT_TEMPLATE,
+		instruction_template='Upper-case the text.')
+	assert time.perf_counter() - start_time >= 0.9
+
+
+def test_rate_limited_calls_are_retried():
+	runtime = FlakyRuntime(requests_per_minute=6000)
+	runtime._get_rate_limiter().max_backoff = 0.01
+	output = runtime.record_to_record(
+		{'text': 'a'}, input_template='{text}', output_template=OUTPUT_TEMPLATE,
+		instruction_template='Upper-case the text.')
+	assert output == {'output': 'A'}
+	assert runtime._get_rate_limiter().num_rate_limited == 1
+
+
+def test_async_calls_share_the_limiter():
+	runtime = SleepingRuntime(tokens_per_minute=100000, max_workers=8)
+	batch = InternalDataFrame({'text': [str(i) for i in range(8)]})
+	output = asyncio.run(runtime.abatch_to_batch(
+		batch, input_template='{text}', output_template=OUTPUT_TEMPLATE,
+		instruction_template='Upper-case the text.'))
+	assert output['output'].tolist() == [str(i) for i in range(8)]
+	assert runtime._get_rate_limiter().in_flight == 0
+
+
+def test_is_rate_limit_error():
+	assert is_rate_limit_error(RateLimitError())
+	assert not is_rate_limit_error(ValueError())
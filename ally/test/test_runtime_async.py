@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+from ally.agents.base import Agent
+from ally.skills.base import RetrievalSkill, TransformSkill
+from ally.skills.skillset import LinearSkillSet, ParallelSkillSet
+from ally.test.utils import (SleepingRuntime, SleepingVectorStore,
+                             TopKVectorStore)
+from ally.utils.internal_data import InternalDataFrame
+from ally.vector_store.base import AllyVectorStore
+
+OUTPUT_TEMPLATE = [{'name': 'output', 'description': 'upper-cased text'}]
+
+
+def _make_batch(size: int) -> InternalDataFrame:
+	return InternalDataFrame(
+		{'text': [f'row {i}' for i in range(size)]},
+		index=[f'id-{size - i}' for i in range(size)],
+	)
+
+
+def test_arecord_to_record():
+	runtime = SleepingRuntime()
+	output = asyncio.run(runtime.arecord_to_record(
+		{'text': 'hello'},
+		input_template='{text}',
+		output_template=OUTPUT_TEMPLATE,
+		instruction_template='Upper-case the text.',
+	))
+	assert output == {'output': 'HELLO'}
+
+
+def test_abatch_to_batch_respects_concurrency_limit():
+	batch = _make_batch(40)
+	kwargs = dict(
+		input_template='{text}',
+		output_template=OUTPUT_TEMPLATE,
+		instruction_template='Upper-case the text.',
+	)
+
+	start_time = time.perf_counter()
+	output = asyncio.run(SleepingRuntime(max_workers=40).abatch_to_batch(batch, **kwargs))
+	unbounded = time.perf_counter() - start_time
+
+	start_time = time.perf_counter()
+	asyncio.run(SleepingRuntime(max_workers=4).abatch_to_batch(batch, **kwargs))
+	bounded = time.perf_counter() - start_time
+
+	assert list(output.index) == list(batch.index)
+	assert output['output'].tolist() == [f'ROW {i}' for i in range(40)]
+	# 40 rows x 50ms with 4 slots take at least 10 rounds
+	assert bounded >= 0.5
+	assert unbounded < bounded
+
+
+def test_agent_arun_with_linear_skillset():
+	skills = LinearSkillSet(skills=[
+		TransformSkill(
+			name='upper',
+			input_template='{text}',
+			output_template=OUTPUT_TEMPLATE,
+		),
+		RetrievalSkill(
+			name='retrieval_upper',
+			input_template='{text} {context}',
+			output_template=OUTPUT_TEMPLATE,
+			vector_store=AllyVectorStore(vector_store=SleepingVectorStore()),
+			query_input_fields=['text'],
+			query_output_field='context',
+		),
+	])
+	agent = Agent(skills=skills, runtimes={'fake': SleepingRuntime(max_workers=10)})
+	batch = _make_batch(10)
+	predictions = asyncio.run(agent.arun(batch, runtime='fake'))
+	assert list(predictions.index) == list(batch.index)
+	assert predictions['output'].tolist() == [f'ROW {i}' for i in range(10)]
+	assert predictions['text'].tolist() == batch['text'].tolist()
+
+
+def test_parallel_skillset_aapply():
+	skills = ParallelSkillSet(skills=[
+		TransformSkill(name='first', input_template='{text}', output_template=OUTPUT_TEMPLATE),
+	])
+	batch = _make_batch(3)
+	predictions = asyncio.run(skills.aapply(batch, runtime=SleepingRuntime(max_workers=3)))
+	assert predictions['output'].tolist() == ['ROW 0', 'ROW 1', 'ROW 2']
+
+
+def test_async_retrieval_uses_the_default_k_of_the_store():
+	vector_store = AllyVectorStore(vector_store=TopKVectorStore())
+	record = {'text': 'question'}
+	output = vector_store.record_to_record(record, input_fields=['text'], output_field='context')
+	async_output = asyncio.run(vector_store.arecord_to_record(record, input_fields=['text'], output_field='context'))
+	assert output['context'] == async_output['context'] == 'd0 d1'
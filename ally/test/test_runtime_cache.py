@@ -0,0 +1,128 @@
+import time
+
+from ally.runtimes.cache import (InMemoryResponseCache, LRUCache,
+                                 SQLiteResponseCache)
+from ally.skills.base import TransformSkill
+from ally.test.utils import SleepingRuntime
+from ally.utils.internal_data import InternalDataFrame
+
+OUTPUT_TEMPLATE = [{'name': 'output', 'description': 'upper-cased text'}]
+
+
+class CountingRuntime(SleepingRuntime):
+	num_created_chains: int = 0
+
+	def _create_chain(self):
+		self.num_created_chains += 1
+		super()._create_chain()
+
+
+def test_lru_cache_eviction_and_counters():
+	cache = LRUCache(max_size=2)
+	assert cache.get_or_create('a', lambda: 1) == 1
+	assert cache.get_or_create('b', lambda: 2) == 2
+	assert cache.get_or_create('a', lambda: -1) == 1
+	# 'b' is the least recently used entry
+	assert cache.get_or_create('c', lambda: 3) == 3
+	assert cache.get_or_create('b', lambda: 4) == 4
+	info = cache.info()
+	assert info['hits'] == 1
+	assert info['misses'] == 4
+	assert info['size'] == 2
+
+
+def test_prepared_chain_is_reused_for_same_templates():
+	runtime = CountingRuntime()
+	batch = InternalDataFrame({'text': ['a', 'b']})
+	for _ in range(3):
+		runtime.batch_to_batch(
+			batch,
+			input_template='{text}',
+			output_template=OUTPUT_TEMPLATE,
+			instruction_template='Upper-case the text.',
+		)
+	runtime.record_to_record(
+		{'text': 'c'},
+		input_template='{text}',
+		output_template=OUTPUT_TEMPLATE,
+		instruction_template='Lower-case the text.',
+	)
+	assert runtime.num_created_chains == 2
+	assert runtime.chain_cache_info()['hits'] == 2
+	assert runtime.chain_cache_info()['misses'] == 2
+
+	runtime.llm_params = {'temperature': 0.5}
+	runtime.record_to_record(
+		{'text': 'c'},
+		input_template='{text}',
+		output_template=OUTPUT_TEMPLATE,
+		instruction_template='Lower-case the text.',
+	)
+	assert runtime.num_created_chains == 3
+
+
+def test_chain_cache_can_be_disabled():
+	runtime = CountingRuntime(chain_cache_size=0)
+	for _ in range(2):
+		runtime.record_to_record(
+			{'text': 'c'},
+			input_template='{text}',
+			output_template=OUTPUT_TEMPLATE,
+			instruction_template='Upper-case the text.',
+		)
+	assert runtime.num_created_chains == 2
+	assert runtime.chain_cache_info()['size'] == 0
+
+
+def _run_skill(runtime, batch):
+	skill = TransformSkill(
+		name='upper',
+		input_template='{text}',
+		output_template=OUTPUT_TEMPLATE,
+		instruction_template='Upper-case the text.',
+	)
+	return skill.apply(batch, runtime)
+
+
+def test_in_memory_response_cache_skips_identical_prompts():
+	# the duplicate prompt goes through the cache instead of being coalesced with the first one
+	runtime = SleepingRuntime(response_cache=InMemoryResponseCache(), coalesce_requests=False)
+	batch = InternalDataFrame({'text': ['a', 'b', 'a']})
+	first = _run_skill(runtime, batch)
+	second = _run_skill(runtime, batch)
+	assert first.equals(second)
+	assert runtime._chain.num_calls == 2
+	assert runtime.response_cache.get_stats()['upper'] == {
+		'hits': 4, 'misses': 2, 'bypasses': 0, 'hit_rate': 4 / 6}
+
+
+def test_response_cache_is_bypassed_for_sampled_completions():
+	runtime = SleepingRuntime(response_cache=InMemoryResponseCache())
+	runtime.llm_params = {'temperature': 0.7}
+	_run_skill(runtime, InternalDataFrame({'text': ['a', 'a']}))
+	assert runtime._chain.num_calls == 2
+	assert runtime.response_cache.get_stats()['upper']['bypasses'] == 2
+
+
+def test_in_memory_response_cache_ttl_and_size():
+	cache = InMemoryResponseCache(max_size=1, ttl=0.05)
+	cache.store('a', 'A')
+	cache.store('b', 'B')
+	assert cache.lookup('a') is None
+	assert cache.lookup('b') == 'B'
+	time.sleep(0.1)
+	assert cache.lookup('b') is None
+
+
+def test_sqlite_response_cache_persists_between_runtimes(tmp_path):
+	path = str(tmp_path / 'responses.sqlite')
+	batch = InternalDataFrame({'text': ['a', 'b']})
+	runtime = SleepingRuntime(response_cache=SQLiteResponseCache(path=path))
+	_run_skill(runtime, batch)
+	assert runtime._chain.num_calls == 2
+
+	runtime = SleepingRuntime(response_cache=SQLiteResponseCache(path=path, max_size=1))
+	output = _run_skill(runtime, batch)
+	assert output['output'].tolist() == ['A', 'B']
+	assert runtime._chain.num_calls == 0
+	assert runtime.response_cache.get_stats()['upper']['hit_rate'] == 1.0
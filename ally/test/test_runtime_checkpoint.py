@@ -0,0 +1,98 @@
+import asyncio
+import json
+
+import pytest
+
+from ally.runtimes.checkpoint import BatchCheckpoint
+from ally.runtimes.fake import FakeRuntime
+from ally.utils.internal_data import InternalDataFrame
+
+OUTPUT_TEMPLATE = [{'name': 'label', 'description': 'the label'}]
+TEMPLATES = dict(input_template='{text}', output_template=OUTPUT_TEMPLATE, instruction_template='Label the text.')
+
+
+def _batch():
+	return InternalDataFrame({'text': [f'text {i}' for i in range(10)]}, index=range(100, 110))
+
+
+def _crashing_at(text):
+	def generate(inputs, output_fields, rng):
+		if text in inputs.get('text', ''):
+			raise RuntimeError('crashed')
+		return {'label': inputs['text'].upper()}
+	return generate
+
+
+def _upper(inputs, output_fields, rng):
+	return {'label': inputs['text'].upper()}
+
+
+def test_interrupted_batch_resumes_without_repeated_calls(tmp_path):
+	path = str(tmp_path / 'checkpoint.jsonl')
+	crashing = FakeRuntime(output_generator=_crashing_at('text 7'), checkpoint_path=path, checkpoint_interval=3)
+	with pytest.raises(RuntimeError):
+		crashing.batch_to_batch(_batch(), **TEMPLATES)
+	# the rows completed before the crash were saved
+	num_saved = len(BatchCheckpoint(path))
+	assert num_saved >= 7
+
+	runtime = FakeRuntime(output_generator=_upper, checkpoint_path=path, checkpoint_interval=3)
+	output = runtime.batch_to_batch(_batch(), **TEMPLATES)
+	assert runtime.get_stats()['num_calls'] == 10 - num_saved
+	assert output.index.tolist() == list(range(100, 110))
+	assert output['label'].tolist() == [f'TEXT {i}' for i in range(10)]
+
+	# all the rows are restored, then only the rows with a new prompt are processed
+	runtime.batch_to_batch(_batch(), **TEMPLATES)
+	assert runtime.get_stats()['num_calls'] == 10 - num_saved
+	runtime.batch_to_batch(_batch(), **{**TEMPLATES, 'instruction_template': 'Label the text again.'})
+	assert runtime.get_stats()['num_calls'] == 20 - num_saved
+
+
+@pytest.mark.parametrize('asynchronous', [False, True])
+def test_rows_completed_before_a_crash_in_the_middle_of_a_chunk_are_saved(tmp_path, asynchronous):
+	path = str(tmp_path / 'checkpoint.jsonl')
+	crashing = FakeRuntime(output_generator=_crashing_at('text 7'), checkpoint_path=path, checkpoint_interval=100)
+	with pytest.raises(RuntimeError):
+		if asynchronous:
+			asyncio.run(crashing.abatch_to_batch(_batch(), **TEMPLATES))
+		else:
+			crashing.batch_to_batch(_batch(), **TEMPLATES)
+	# every successful call was saved, though the chunk of 100 rows was not completed
+	num_saved = len(BatchCheckpoint(path))
+	assert num_saved >= 7
+	assert num_saved == crashing.get_stats()['num_calls']
+
+	runtime = FakeRuntime(output_generator=_upper, checkpoint_path=path, checkpoint_interval=100)
+	output = runtime.batch_to_batch(_batch(), **TEMPLATES)
+	# only the crashed row and the rows not processed before the crash are processed again
+	assert runtime.get_stats()['num_calls'] == 10 - num_saved
+	assert output['label'].tolist() == [f'TEXT {i}' for i in range(10)]
+
+
+def test_async_batch_resumes_from_the_checkpoint(tmp_path):
+	path = str(tmp_path / 'checkpoint.jsonl')
+	FakeRuntime(output_generator=_upper, checkpoint_path=path).batch_to_batch(_batch().iloc[:5], **TEMPLATES)
+
+	runtime = FakeRuntime(output_generator=_upper, checkpoint_path=path, max_workers=4)
+	output = asyncio.run(runtime.abatch_to_batch(_batch(), **TEMPLATES))
+	assert runtime.get_stats()['num_calls'] == 5
+	assert output['label'].tolist() == [f'TEXT {i}' for i in range(10)]
+
+
+def test_torn_lines_are_ignored(tmp_path):
+	path = tmp_path / 'checkpoint.jsonl'
+	checkpoint = BatchCheckpoint(str(path))
+	checkpoint.append([(0, 'a', {'label': 'A'}), (1, 'b', {'label': 'B'})])
+	with open(path, 'a', encoding='utf-8') as f:
+		f.write(json.dumps({'index': 2, 'key': 'c', 'output': {'label': 'C'}})[:20])
+
+	checkpoint = BatchCheckpoint(str(path))
+	assert len(checkpoint) == 2
+	assert checkpoint.lookup(1, 'b') == {'label': 'B'}
+	# the row index and the prompt hash must both match
+	assert checkpoint.lookup(1, 'a') is None
+	assert checkpoint.num_restored == 1
+
+	checkpoint.append([(2, 'c', {'label': 'C'})])
+	assert BatchCheckpoint(str(path)).lookup(2, 'c') == {'label': 'C'}
@@ -0,0 +1,81 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ally.runtimes.coalescing import SingleFlight
+from ally.runtimes.fake import FakeRuntime
+from ally.utils.internal_data import InternalDataFrame
+
+OUTPUT_TEMPLATE = [{'name': 'label', 'description': 'the label'}]
+TEMPLATES = dict(input_template='{text}', output_template=OUTPUT_TEMPLATE, instruction_template='Label the text.')
+
+
+def _batch():
+	return InternalDataFrame({'text': ['a', 'b', 'a', 'c', 'a', 'b']}, index=[10, 11, 12, 13, 14, 15])
+
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_duplicate_rows_of_a_batch_make_one_call(max_workers):
+	runtime = FakeRuntime(max_workers=max_workers)
+	output = runtime.batch_to_batch(_batch(), **TEMPLATES)
+	assert runtime.get_stats()['num_calls'] == 3
+	assert output.index.tolist() == [10, 11, 12, 13, 14, 15]
+	labels = output['label'].tolist()
+	assert labels[0] == labels[2] == labels[4] and labels[1] == labels[5]
+	assert runtime.coalescing_stats()['num_coalesced'] == 3
+
+	uncoalesced = FakeRuntime(max_workers=max_workers, coalesce_requests=False)
+	assert uncoalesced.batch_to_batch(_batch(), **TEMPLATES).equals(output)
+	assert uncoalesced.get_stats()['num_calls'] == 6
+
+
+def test_concurrent_record_to_record_calls_share_one_call():
+	runtime = FakeRuntime(latency=0.1)
+	with ThreadPoolExecutor(max_workers=8) as executor:
+		outputs = list(executor.map(lambda _: runtime.record_to_record({'text': 'a'}, **TEMPLATES), range(8)))
+	assert runtime.get_stats()['num_calls'] == 1
+	assert all(output == outputs[0] for output in outputs)
+	# each caller gets its own copy of the output
+	assert len({id(output) for output in outputs}) == 8
+
+	# the prompt is not in flight anymore
+	runtime.record_to_record({'text': 'a'}, **TEMPLATES)
+	assert runtime.get_stats()['num_calls'] == 2
+
+
+def test_concurrent_async_calls_share_one_call():
+	runtime = FakeRuntime(latency=0.1, max_workers=8)
+
+	async def run():
+		outputs = await asyncio.gather(*[runtime.arecord_to_record({'text': 'a'}, **TEMPLATES) for _ in range(5)])
+		batch_output = await runtime.abatch_to_batch(_batch(), **TEMPLATES)
+		return outputs, batch_output
+
+	outputs, batch_output = asyncio.run(run())
+	assert all(output == outputs[0] for output in outputs)
+	assert batch_output['label'].tolist()[0] == outputs[0]['label']
+	assert runtime.get_stats()['num_calls'] == 1 + 3
+
+
+def test_sampled_calls_are_not_coalesced():
+	runtime = FakeRuntime()
+	runtime.llm_params = {'model_name': 'fake', 'temperature': 0.7}
+	runtime.batch_to_batch(_batch(), **TEMPLATES)
+	assert runtime.get_stats()['num_calls'] == 6
+
+
+def test_errors_are_shared_with_the_waiting_callers():
+	single_flight = SingleFlight()
+
+	async def failing_call():
+		await asyncio.sleep(0.05)
+		raise ValueError('failed')
+
+	async def run():
+		return await asyncio.gather(
+			*[single_flight.ado('key', failing_call) for _ in range(3)], return_exceptions=True)
+
+	errors = asyncio.run(run())
+	assert all(isinstance(error, ValueError) for error in errors)
+	assert single_flight.get_stats() == {'num_calls': 1, 'num_coalesced': 2}
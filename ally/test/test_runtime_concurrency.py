@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pytest
+
+from ally.skills.base import RetrievalSkill, TransformSkill
+from ally.test.utils import SleepingRuntime, SleepingVectorStore
+from ally.utils.concurrency import map_concurrently
+from ally.utils.internal_data import InternalDataFrame
+from ally.vector_store.base import AllyVectorStore
+
+
+def _make_batch(size: int) -> InternalDataFrame:
+	return InternalDataFrame(
+		{'text': [f'row {i}' for i in range(size)]},
+		index=[f'id-{size - i}' for i in range(size)],
+	)
+
+
+def test_transform_skill_concurrent_batch_keeps_index_order():
+	batch = _make_batch(20)
+	skill = TransformSkill(
+		name='upper',
+		input_template='{text}',
+		output_template=[{'name': 'output', 'description': 'upper-cased text'}],
+	)
+
+	start_time = time.perf_counter()
+	output = skill.apply(batch, SleepingRuntime(max_workers=10))
+	elapsed = time.perf_counter() - start_time
+
+	assert list(output.index) == list(batch.index)
+	assert output['output'].tolist() == [f'ROW {i}' for i in range(20)]
+	# 20 rows x 50ms sequentially would take at least 1s
+	assert elapsed < 0.6
+
+
+def test_sequential_and_concurrent_batches_are_equal():
+	batch = _make_batch(5)
+	kwargs = dict(
+		input_template='{text}',
+		output_template=[{'name': 'output', 'description': 'upper-cased text'}],
+		instruction_template='Upper-case the text.',
+	)
+	sequential = SleepingRuntime(max_workers=1).batch_to_batch(batch, **kwargs)
+	concurrent = SleepingRuntime(max_workers=4).batch_to_batch(batch, **kwargs)
+	assert sequential.equals(concurrent)
+
+
+def test_retrieval_skill_concurrent_batch():
+	batch = _make_batch(10)
+	skill = RetrievalSkill(
+		name='retrieval',
+		input_template='{text} {context}',
+		output_template=[{'name': 'output', 'description': 'upper-cased text'}],
+		vector_store=AllyVectorStore(vector_store=SleepingVectorStore()),
+		query_input_fields=['text'],
+		query_output_field='context',
+	)
+	output = skill.apply(batch, SleepingRuntime(max_workers=10))
+	assert list(output.index) == list(batch.index)
+	assert output['output'].tolist() == [f'ROW {i}' for i in range(10)]
+
+
+def test_pending_items_are_cancelled_on_error():
+	started = []
+	lock = threading.Lock()
+
+	def process(item):
+		with lock:
+			started.append(item)
+		if item == 0:
+			raise RuntimeError('failed')
+		time.sleep(0.05)
+		return item
+
+	with pytest.raises(RuntimeError, match='failed'):
+		map_concurrently(process, range(100), max_workers=4)
+	# only the items started before the error, a few per worker
+	assert len(started) < 20
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from ally.runtimes.cache import InMemoryResponseCache
+from ally.runtimes.fake import FakeLLMError, FakeRuntime
+from ally.runtimes.metrics import CallMetrics, MetricsRecorder, estimate_cost
+from ally.test.utils import transform_skill
+from ally.utils.internal_data import InternalDataFrame
+
+OUTPUT_TEMPLATE = [{'name': 'label', 'description': 'the label'}]
+
+
+def _skill(name='labeler'):
+	return transform_skill(name, '{text}', 'label')
+
+
+def _batch(num_rows=10):
+	return InternalDataFrame({'text': [f'text {i}' for i in range(num_rows)]})
+
+
+def test_calls_are_recorded_per_skill():
+	calls = []
+	runtime = FakeRuntime(
+		latency=0.01, unfenced_rate=0.5, metrics_hooks=[calls.append], token_prices=(1.0, 2.0), track_tokens=True)
+	_skill().apply(_batch(), runtime)
+
+	assert len(calls) == 10
+	call = calls[0]
+	assert call.runtime_name == 'FakeRuntime' and call.skill_name == 'labeler'
+	assert call.llm_latency >= 0.01 and call.parse_time > 0
+	assert call.prompt_tokens > 0 and call.completion_tokens > 0
+	assert call.cost == pytest.approx((call.prompt_tokens + 2 * call.completion_tokens) / 1000)
+
+	metrics = runtime.get_metrics()['FakeRuntime']['labeler']
+	assert metrics['num_calls'] == 10
+	assert metrics['num_parse_fallbacks'] == sum(call.parse_fallback for call in calls) > 0
+	assert metrics['prompt_tokens'] == sum(call.prompt_tokens for call in calls)
+	assert metrics['llm_latency']['count'] == 10
+	assert 0.01 <= metrics['llm_latency']['p50'] <= metrics['llm_latency']['p99']
+
+
+def test_queue_wait_of_async_calls():
+	runtime = FakeRuntime(latency=0.05, max_workers=2)
+	asyncio.run(_skill().aapply(_batch(6), runtime))
+	metrics = runtime.get_metrics()['FakeRuntime']['labeler']
+	# the calls wait for one of the two concurrency slots
+	assert metrics['queue_wait']['p99'] >= 0.05
+	assert metrics['llm_latency']['p99'] < 0.1
+
+
+def test_cached_and_failed_calls():
+	runtime = FakeRuntime(response_cache=InMemoryResponseCache())
+	_skill().apply(_batch(3), runtime)
+	_skill().apply(_batch(3), runtime)
+	metrics = runtime.get_metrics()['FakeRuntime']['labeler']
+	assert metrics['num_calls'] == 6 and metrics['num_cached'] == 3
+
+	failing = FakeRuntime(error_rate=1.0)
+	with pytest.raises(FakeLLMError):
+		failing.record_to_record({'text': 'a'}, '{text}', OUTPUT_TEMPLATE, 'Label the text.')
+	assert failing.get_metrics()['FakeRuntime']['']['num_errors'] == 1
+
+
+def test_prometheus_export():
+	recorder = MetricsRecorder()
+	runtimes = [FakeRuntime(metrics_hooks=[recorder], collect_metrics=False) for _ in range(2)]
+	_skill('a').apply(_batch(2), runtimes[0])
+	_skill('b').apply(_batch(3), runtimes[1])
+	assert runtimes[0].get_metrics() == {}
+
+	text = recorder.to_prometheus()
+	assert '# TYPE ally_num_calls_total counter' in text
+	assert 'ally_num_calls_total{runtime="FakeRuntime",skill="b"} 3' in text
+	assert '# TYPE ally_llm_latency_seconds histogram' in text
+	assert 'ally_llm_latency_seconds_bucket{runtime="FakeRuntime",skill="a",le="+Inf"} 2' in text
+	assert 'ally_llm_latency_seconds_count{runtime="FakeRuntime",skill="a"} 2' in text
+
+
+def test_estimate_cost():
+	assert estimate_cost('gpt-4-0613', 1000, 1000) == pytest.approx(0.09)
+	assert estimate_cost('gpt-3.5-turbo-16k-0613', 1000, 0) == pytest.approx(0.003)
+	assert estimate_cost('llama', 1000, 1000) is None
+	recorder = MetricsRecorder()
+	recorder(CallMetrics(runtime_name='r', cost=None))
+	assert recorder.to_dict()['r']['']['cost'] == 0
+
+
+def test_tokens_are_only_counted_on_demand(monkeypatch):
+	monkeypatch.setattr('ally.runtimes.base.count_tokens', lambda *args: pytest.fail('tokens counted'))
+	calls = []
+	_skill().apply(_batch(3), FakeRuntime(metrics_hooks=[calls.append]))
+	assert len(calls) == 3
+	assert all(call.prompt_tokens == call.completion_tokens == 0 and call.cost is None for call in calls)
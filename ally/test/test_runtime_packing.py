@@ -0,0 +1,79 @@
+import json
+import re
+from typing import Any, Dict
+
+from ally.skills.collection.classification import ClassificationSkill
+from ally.test.utils import SleepingChain, SleepingRuntime
+from ally.utils.internal_data import InternalDataFrame
+
+
+class PackedEchoChain(SleepingChain):
+	"""Fake chain that answers a packed prompt, forgetting the items listed in `skipped_texts`."""
+
+	skipped_texts = {'skip me'}
+
+	def run(self, inputs: Dict[str, Any]) -> str:
+		self.num_calls += 1
+		items = re.findall(r'### Item (\d+)\n(.*)', inputs['items'])
+		outputs = [
+			{'item': int(number), 'predictions': text.upper()}
+			for number, text in items if text not in self.skipped_texts
+		]
+		return 'Here you go:\n```json\n' + json.dumps(outputs) + '\n```'
+
+
+class EchoChain(SleepingChain):
+
+	def _format_output(self, inputs: Dict[str, Any]) -> str:
+		return '```json\n' + json.dumps({'predictions': inputs['text'].upper()}) + '\n```'
+
+
+class PackingRuntime(SleepingRuntime):
+
+	def _create_chain(self):
+		if 'items' in self._llm_prompt_template.input_variables:
+			self._chain = PackedEchoChain(prompt=self._llm_prompt_template, delay=0)
+		else:
+			self._chain = EchoChain(prompt=self._llm_prompt_template, delay=0)
+
+
+def _apply(runtime, texts):
+	skill = ClassificationSkill(
+		name='sentiment',
+		instruction_template='Label the text as positive or negative.',
+		input_template='{text}',
+		output_template=[{'name': 'predictions', 'description': 'the label'}],
+	)
+	batch = InternalDataFrame({'text': texts}, index=[10 + i for i in range(len(texts))])
+	return skill.apply(batch, runtime)
+
+
+def test_packed_prompts_reduce_the_number_of_calls():
+	runtime = PackingRuntime(records_per_prompt=4, max_workers=2)
+	texts = [f'text {i}' for i in range(10)]
+	output = _apply(runtime, texts)
+	assert output['predictions'].tolist() == [text.upper() for text in texts]
+	assert list(output.index) == [10 + i for i in range(10)]
+	packed_chain, = [chain for chain in _cached_chains(runtime) if isinstance(chain, PackedEchoChain)]
+	assert packed_chain.num_calls == 3
+
+
+def test_unparsed_items_fall_back_to_single_record_calls():
+	runtime = PackingRuntime(records_per_prompt=5)
+	output = _apply(runtime, ['a', 'skip me', 'b'])
+	assert output['predictions'].tolist() == ['A', 'SKIP ME', 'B']
+	single_chain, = [chain for chain in _cached_chains(runtime) if isinstance(chain, EchoChain)]
+	assert single_chain.num_calls == 1
+
+
+def test_records_depending_on_instruction_variables_are_not_packed():
+	runtime = PackingRuntime(records_per_prompt=5)
+	assert not runtime._can_pack(
+		[{'name': 'predictions', 'description': 'the label'}], 'Label with {labels}')
+	assert runtime._can_pack(
+		[{'name': 'predictions', 'description': 'the label'}], 'Label with {{labels}}')
+
+
+def _cached_chains(runtime):
+	for value in runtime._get_chain_cache()._data.values():
+		yield value[0] if isinstance(value, tuple) else value
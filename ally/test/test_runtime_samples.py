@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+import pytest
+
+from ally.runtimes.fake import FakeRuntime
+from ally.skills.base import SynthesisSkill
+
+
+class QuestionSkill(SynthesisSkill):
+
+	def improve(self, **kwargs):
+		pass
+
+
+def _skill(num_samples):
+	return QuestionSkill(
+		name='questions',
+		input_template='Topic: {topic}',
+		output_template=[{'name': 'question', 'description': 'a question about the topic'}],
+		instruction_template='Write a question about the topic.',
+		num_samples=num_samples,
+	)
+
+
+def numbered_question(inputs, output_fields, rng):
+	return {'question': f'{inputs["topic"]} question {rng.randrange(10 ** 6)}'}
+
+
+@pytest.mark.parametrize('asynchronous', [False, True])
+def test_samples_are_generated_by_a_few_prompts(asynchronous):
+	runtime = FakeRuntime(output_generator=numbered_question, samples_per_prompt=10, max_workers=4)
+	skill = _skill(num_samples=25)
+	if asynchronous:
+		output = asyncio.run(skill.aapply({'topic': 'math'}, runtime))
+	else:
+		output = skill.apply({'topic': 'math'}, runtime)
+
+	assert len(output) == 25
+	assert output['question'].str.startswith('math question').all()
+	assert output['question'].nunique() == 25
+	# 10 + 10 + 5 samples
+	assert runtime.get_stats()['num_calls'] == 3
+
+
+def test_one_prompt_per_sample_without_list_outputs():
+	runtime = FakeRuntime(output_generator=numbered_question, samples_per_prompt=1, llm_params={'temperature': '1'})
+	output = _skill(num_samples=5).apply({'topic': 'math'}, runtime)
+	assert len(output) == 5
+	assert runtime.get_stats()['num_calls'] == 5
+
+
+class ShortListRuntime(FakeRuntime):
+	"""Fake runtime returning fewer samples than requested."""
+
+	def _build_samples_chain(self, input_template, output_template, instruction_template, num_samples, *args):
+		chain = super()._build_samples_chain(input_template, output_template, instruction_template, num_samples, *args)
+		chain.num_samples = num_samples - 2
+		return chain
+
+
+def test_missing_samples_are_generated_one_by_one():
+	runtime = ShortListRuntime(output_generator=numbered_question, samples_per_prompt=8, llm_params={'temperature': '1'})
+	output = _skill(num_samples=8).apply({'topic': 'math'}, runtime)
+	assert len(output) == 8
+	assert output['question'].notnull().all()
+	# one prompt for 6 samples, then the 2 missing ones
+	assert runtime.get_stats()['num_calls'] == 3
+
+
+def test_the_prompt_asks_for_a_list():
+	runtime = FakeRuntime(output_generator=numbered_question, samples_per_prompt=4)
+	template = [{'name': 'question', 'description': 'a question about the topic'}]
+	chain = runtime._prepare_samples_chain('Topic: {topic}', template, 'Write a question.', 4, prompt_number=2, num_prompts=3)
+	prompt = '\n'.join(message.content for message in chain.prompt.format_messages(topic='math'))
+	assert 'Generate 4 different outputs' in prompt
+	assert 'This is the set 2 of 3' in prompt
+	assert runtime._parse_packed_output(
+		'```json\n' + json.dumps([{'item': 2, 'question': 'b'}, {'item': 1, 'question': 'a'}]) + '\n```',
+		['question'], 3) == [{'question': 'a'}, {'question': 'b'}, None]
@@ -0,0 +1,89 @@
+import asyncio
+import json
+import time
+
+from langchain.chains.llm import LLMChain
+from langchain.chat_models.fake import FakeListChatModel
+
+from ally.runtimes.base import Runtime
+from ally.runtimes.cache import InMemoryResponseCache
+from ally.runtimes.fake import FakeRuntime
+from ally.skills.base import RetrievalSkill
+from ally.test.utils import SleepingVectorStore
+from ally.vector_store.base import AllyVectorStore
+
+OUTPUT_TEMPLATE = [{'name': 'answer', 'description': 'the answer'}]
+COMPLETION = '```json\n' + json.dumps({'answer': 'forty two'}) + '\n```'
+
+
+class FakeChatRuntime(Runtime):
+
+	def _create_chain(self):
+		self._llm = FakeListChatModel(responses=[COMPLETION])
+		self._chain = LLMChain(llm=self._llm, prompt=self._llm_prompt_template)
+
+
+def _stream(runtime, text='question'):
+	return runtime.astream_record_to_record(
+		{'text': text},
+		input_template='{text}',
+		output_template=OUTPUT_TEMPLATE,
+		instruction_template='Answer the question.',
+	)
+
+
+async def _consume(stream):
+	tokens = [token async for token in stream]
+	return tokens, stream.output
+
+
+def test_stream_yields_tokens_and_parses_the_final_text():
+	runtime = FakeChatRuntime(response_cache=InMemoryResponseCache())
+	tokens, output = asyncio.run(_consume(_stream(runtime)))
+	assert len(tokens) == len(COMPLETION)
+	assert ''.join(tokens) == COMPLETION
+	assert output == {'answer': 'forty two'}
+
+	# the streamed completion is cached and replayed in one piece
+	tokens, output = asyncio.run(_consume(_stream(runtime)))
+	assert tokens == [COMPLETION]
+	assert output == {'answer': 'forty two'}
+	assert runtime.response_cache.get_stats()['default']['hits'] == 1
+
+
+def test_time_to_first_token_is_a_fraction_of_the_latency():
+	runtime = FakeRuntime(latency=0.5)
+
+	async def run():
+		start_time = time.perf_counter()
+		stream = _stream(runtime)
+		first_token_time = None
+		async for _ in stream:
+			if first_token_time is None:
+				first_token_time = time.perf_counter() - start_time
+		return first_token_time, time.perf_counter() - start_time, stream.output
+
+	first_token_time, total_time, output = asyncio.run(run())
+	assert first_token_time < total_time / 3
+	assert total_time >= 0.5
+	assert set(output) == {'answer'}
+	assert output == asyncio.run(_stream(runtime).collect())
+
+
+def test_retrieval_skill_streams_after_retrieving_the_context():
+	skill = RetrievalSkill(
+		name='qa',
+		instruction_template='Answer the question.',
+		input_template='{context}\n{text}',
+		output_template=OUTPUT_TEMPLATE,
+		vector_store=AllyVectorStore(vector_store=SleepingVectorStore()),
+		query_input_fields=['text'],
+		query_output_field='context',
+	)
+	runtime = FakeRuntime()
+
+	async def run():
+		stream = await skill.astream({'text': 'question'}, runtime)
+		return await stream.collect()
+
+	assert set(asyncio.run(run())) == {'answer'}
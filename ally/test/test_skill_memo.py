@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+
+from ally.agents.base import Agent
+from ally.environments.base import StaticEnvironment
+from ally.runtimes.fake import FakeRuntime
+from ally.skills.memo import SkillOutputMemo
+from ally.skills.skillset import GraphSkillSet, LinearSkillSet
+from ally.test.utils import transform_skill
+from ally.utils.internal_data import InternalDataFrame
+
+NUM_ROWS = 20
+
+
+def _skills():
+	return [transform_skill('a', '{text}', 'x'), transform_skill('b', '{x}', 'y'), transform_skill('c', '{text}', 'z')]
+
+
+def _batch():
+	return InternalDataFrame({'text': [f'text {i}' for i in range(NUM_ROWS)]})
+
+
+def _misses(memo):
+	return sum(stats['misses'] for stats in memo.get_stats().values())
+
+
+@pytest.mark.parametrize('skillset_class', [LinearSkillSet, GraphSkillSet])
+def test_only_the_changed_skill_and_its_dependents_are_recomputed(skillset_class):
+	skillset = skillset_class(skills=_skills())
+	runtime = FakeRuntime(max_workers=4, coalesce_requests=False)
+	memo = SkillOutputMemo()
+	expected = skillset.apply(_batch(), runtime, memo=memo)
+	num_calls = runtime.get_stats()['num_calls']
+	assert num_calls == _misses(memo)
+
+	output = skillset.apply(_batch(), runtime, memo=memo)
+	assert output.equals(expected)
+	assert runtime.get_stats()['num_calls'] == num_calls
+	assert memo.get_saved_calls() >= 3 * NUM_ROWS
+
+	skillset['a'].instruction_template = 'Run a better.'
+	b_misses = memo.get_stats()['b']['misses']
+	output = skillset.apply(_batch(), runtime, memo=memo)
+	stats = memo.get_stats()
+	assert stats['a'] == {'hits': NUM_ROWS, 'misses': 2 * NUM_ROWS}
+	# b is recomputed only for the rows whose x changed, c is not recomputed
+	assert 0 < stats['b']['misses'] - b_misses <= NUM_ROWS
+	assert stats['c'] == {'hits': 2 * NUM_ROWS, 'misses': NUM_ROWS}
+	assert output['z'].tolist() == expected['z'].tolist()
+	assert runtime.get_stats()['num_calls'] == _misses(memo)
+
+
+def test_async_apply_and_streaming_use_the_memo():
+	runtime = FakeRuntime(max_workers=4, coalesce_requests=False)
+	memo = SkillOutputMemo()
+	expected = asyncio.run(LinearSkillSet(skills=_skills()).aapply(_batch(), runtime, memo=memo))
+	output = LinearSkillSet(skills=_skills(), streaming=True).apply(_batch(), runtime, memo=memo)
+	assert output[expected.columns].equals(expected)
+	assert runtime.get_stats()['num_calls'] == _misses(memo)
+	assert memo.get_saved_calls() == 3 * NUM_ROWS
+
+
+def test_learning_iterations_reuse_the_outputs_of_unchanged_skills():
+	df = InternalDataFrame({'text': [f'text {i}' for i in range(NUM_ROWS)], 'x': ['x_0'] * NUM_ROWS, 'z': ['z_0'] * NUM_ROWS})
+	skills = LinearSkillSet(skills=[transform_skill('a', '{text}', 'x'), transform_skill('c', '{text}', 'z')])
+	skills['c'].frozen = True
+	agent = Agent(
+		skills=skills,
+		environment=StaticEnvironment(df=df, ground_truth_columns={'x': 'x', 'z': 'z'}),
+		runtimes={'fake': FakeRuntime()},
+		teacher_runtimes={'fake': FakeRuntime(output_generator=lambda inputs, fields, rng: {field: 'Improved.' for field in fields})},
+		default_runtime='fake',
+		default_teacher_runtime='fake',
+	)
+	memo = SkillOutputMemo()
+	agent.learn(learning_iterations=2, memo=memo)
+	# the frozen skill is applied once, then served from the memo
+	assert memo.get_stats()['c'] == {'hits': NUM_ROWS, 'misses': NUM_ROWS}
+	assert memo.get_saved_calls() >= NUM_ROWS
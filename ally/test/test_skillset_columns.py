@@ -0,0 +1,123 @@
+import asyncio
+import tracemalloc
+
+import numpy as np
+
+from ally.runtimes.fake import FakeRuntime
+from ally.skills.base import AnalysisSkill, SynthesisSkill
+from ally.skills.memo import SkillOutputMemo
+from ally.skills.skillset import LinearSkillSet, ParallelSkillSet
+from ally.test.utils import transform_skill
+from ally.utils.internal_data import ColumnarContext, InternalDataFrame
+
+
+def _wide_frame(num_rows, num_columns):
+	# long texts shared by the rows of a column: copying a frame copies the references to the texts
+	columns = {f'text_{j}': [f'{j} ' * 1000] * (num_rows - 1) + [f'{j} last'] for j in range(num_columns)}
+	return InternalDataFrame(columns, index=[f'id-{i}' for i in range(num_rows)])
+
+
+def test_columns_are_added_by_reference():
+	df = InternalDataFrame({'a': ['1', '2', '3'], 'b': ['4', '5', '6'], 'c': ['7', '8', '9']})
+	output = InternalDataFrame({'b': ['x', 'y', 'z'], 'd': ['u', 'v', 'w']})
+	frame = ColumnarContext(df).add_columns(output).to_frame()
+
+	# replaced columns move to the end, as with drop + merge
+	assert frame.columns.tolist() == ['a', 'c', 'b', 'd']
+	assert frame.equals(df.drop(columns=['b']).merge(output, left_index=True, right_index=True))
+	assert np.shares_memory(frame['a'].values, df['a'].values)
+	assert np.shares_memory(frame['d'].values, output['d'].values)
+	assert df['b'].tolist() == ['4', '5', '6']
+
+
+def test_only_the_rows_of_both_frames_are_kept():
+	df = InternalDataFrame({'a': ['1', '2', '3']}, index=[10, 11, 12])
+	frame = ColumnarContext(df).add_columns(InternalDataFrame({'b': ['z', 'x']}, index=[12, 10])).to_frame()
+	assert frame.index.tolist() == [10, 12]
+	assert frame.to_dict(orient='list') == {'a': ['1', '3'], 'b': ['x', 'z']}
+
+
+def test_skillsets_share_the_input_columns():
+	df = _wide_frame(10, 3)
+	runtime = FakeRuntime()
+	skills = [transform_skill('a', '{text_0}', 'x'), transform_skill('b', '{x}', 'text_1')]
+	output = LinearSkillSet(skills=skills).apply(df, runtime)
+	assert output.columns.tolist() == ['text_0', 'text_2', 'x', 'text_1']
+	assert output.index.equals(df.index)
+	assert np.shares_memory(output['text_2'].values, df['text_2'].values)
+	assert df['text_1'].str.startswith('1 ').all()
+
+	skills = [transform_skill('a', '{text_0}', 'x'), transform_skill('b', '{text_0}', 'y')]
+	output = ParallelSkillSet(skills=skills).apply(df, runtime)
+	assert output.columns.tolist() == ['text_0', 'text_1', 'text_2', 'x', 'y']
+	assert np.shares_memory(output['text_0'].values, df['text_0'].values)
+
+
+class TopicSynthesis(SynthesisSkill):
+
+	def improve(self, **kwargs):
+		pass
+
+
+def test_records_are_passed_to_the_skills_producing_tables():
+	analysis = AnalysisSkill(
+		name='analysis',
+		input_template='{text}',
+		output_template=[{'name': 'topic', 'description': 'topic'}],
+		instruction_template='Find the topic.',
+	)
+	synthesis = TopicSynthesis(
+		name='synthesis',
+		input_template='Topic: {topic}',
+		output_template=[{'name': 'question', 'description': 'question'}],
+		instruction_template='Write a question.',
+		num_samples=3,
+	)
+	def generator(inputs, fields, rng):
+		if 'question' in fields:
+			return {'question': f'question about {inputs["topic"]}'}
+		return {field: 'cats' for field in fields}
+
+	for samples_per_prompt in (1, 10):
+		runtime = FakeRuntime(output_generator=generator, samples_per_prompt=samples_per_prompt)
+		output = LinearSkillSet(skills=[synthesis]).apply({'topic': 'cats'}, runtime)
+		assert output['question'].tolist() == ['question about cats'] * 3
+
+		df = InternalDataFrame({'text': ['some text', 'other text']})
+		skillset = LinearSkillSet(skills=[analysis, synthesis, transform_skill('answer', '{question}', 'answer')])
+		for output in (skillset.apply(df, runtime), asyncio.run(skillset.aapply(df, runtime))):
+			assert output.columns.tolist() == ['question', 'answer']
+			assert output['question'].tolist() == ['question about cats'] * 3
+
+
+def test_benchmark_peak_memory_per_stage():
+	num_rows, num_columns, num_stages = 5000, 200, 4
+	df = _wide_frame(num_rows, num_columns)
+	skills = [transform_skill(f'stage_{k}', f'{{text_{k}}}', f'output_{k}') for k in range(num_stages)]
+	runtime = FakeRuntime(max_workers=8)
+	memo = SkillOutputMemo()
+	# the memo serves the skill outputs, so only the pipeline itself is measured
+	LinearSkillSet(skills=skills).apply(df, runtime, memo=memo)
+	column_bytes = num_rows * num_columns * df['text_0'].values.itemsize
+
+	for k in range(1, num_stages + 1):
+		skillset = LinearSkillSet(skills=skills[:k])
+		tracemalloc.start()
+		output = skillset.apply(df, runtime, memo=memo)
+		_, peak_memory = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+
+		# previous implementation: drop + merge at every stage
+		tracemalloc.start()
+		legacy = df
+		for skill in skills[:k]:
+			skill_output = output[skill.get_output_fields()]
+			legacy = legacy.drop(columns=set(skill_output.columns) & set(legacy.columns)).merge(
+				skill_output, left_index=True, right_index=True, how='inner')
+		_, legacy_peak_memory = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+
+		assert output.equals(legacy)
+		assert peak_memory < column_bytes / 2
+		assert legacy_peak_memory > column_bytes
+		assert peak_memory * 4 < legacy_peak_memory
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from ally.runtimes.fake import FakeLLMError, FakeRuntime
+from ally.skills.base import AnalysisSkill
+from ally.skills.skillset import LinearSkillSet
+from ally.test.utils import CallLog, transform_skill
+from ally.utils.internal_data import InternalDataFrame
+
+SOURCES = {'x': 'text', 'y': 'x', 'z': 'y'}
+
+
+def _skillset(**kwargs):
+	return LinearSkillSet(skills=[
+		transform_skill('a', '{text}', 'x'),
+		transform_skill('b', '{x}', 'y'),
+		transform_skill('c', '{y}', 'z'),
+	], **kwargs)
+
+
+def _batch(num_rows):
+	return InternalDataFrame({'text': [f'r{i}' for i in range(num_rows)]}, index=range(10, 10 + num_rows))
+
+
+def test_streaming_gives_the_same_predictions():
+	batch = _batch(8)
+	expected = _skillset().apply(batch, FakeRuntime(output_generator=CallLog(SOURCES), max_workers=2))
+	output = _skillset(streaming=True).apply(batch, FakeRuntime(output_generator=CallLog(SOURCES), max_workers=2))
+	assert output.equals(expected)
+	assert output['z'].tolist() == [f'r{i}.x.y.z' for i in range(8)]
+
+	output = asyncio.run(
+		_skillset(streaming=True).aapply(batch, FakeRuntime(output_generator=CallLog(SOURCES), max_workers=2)))
+	assert output.equals(expected)
+
+
+@pytest.mark.parametrize('asynchronous', [False, True])
+def test_first_rows_finish_before_the_first_skill_is_done(asynchronous):
+	log = CallLog(SOURCES)
+	runtime = FakeRuntime(output_generator=log, latency=0.02, max_workers=2)
+	skillset = _skillset(streaming=True, stage_queue_size=1)
+	if asynchronous:
+		asyncio.run(skillset.aapply(_batch(8), runtime))
+	else:
+		skillset.apply(_batch(8), runtime)
+	assert log.calls.index(('z', 'r0.x.y')) < log.calls.index(('x', 'r7'))
+
+
+@pytest.mark.parametrize('asynchronous', [False, True])
+def test_errors_stop_the_pipeline(asynchronous):
+	runtime = FakeRuntime(output_generator=CallLog(SOURCES, failing_input='r1.x'), max_workers=2)
+	skillset = _skillset(streaming=True)
+	with pytest.raises(FakeLLMError):
+		if asynchronous:
+			asyncio.run(skillset.aapply(_batch(20), runtime))
+		else:
+			skillset.apply(_batch(20), runtime)
+
+
+def test_only_row_skills_can_be_streamed():
+	with pytest.raises(ValueError, match='AnalysisSkill'):
+		LinearSkillSet(skills=[AnalysisSkill(name='analysis', instruction_template='')], streaming=True)
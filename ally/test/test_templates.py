@@ -0,0 +1,126 @@
+import time
+
+import pytest
+
+from ally.runtimes.fake import FakeRuntime
+from ally.skills.base import AnalysisSkill, RetrievalSkill, TransformSkill
+from ally.test.utils import SleepingVectorStore
+from ally.utils.internal_data import InternalDataFrame
+from ally.utils.templates import CompiledTemplate, compile_template
+from ally.vector_store.base import AllyVectorStore
+
+
+def _frame(num_rows):
+	return InternalDataFrame({
+		'id': range(num_rows),
+		'text': [f'some text {i}' for i in range(num_rows)],
+		'score': [i / 3 for i in range(num_rows)],
+		'tags': [['a', str(i)] for i in range(num_rows)],
+	}, index=[f'row-{i}' for i in range(num_rows)])
+
+
+@pytest.mark.parametrize('template', [
+	'Row {id}: {text}',
+	'{text!r} scored {score:.2f} {{literal}}',
+	'first tag {tags[0]}, last tag {tags[1]}',
+	'no fields',
+])
+def test_batches_are_rendered_as_str_format(template):
+	df = _frame(20)
+	compiled = compile_template(template)
+	expected = [template.format(**record) for record in df.to_dict(orient='records')]
+	assert compiled.render_batch(df).tolist() == expected
+	assert compiled.render_batch(df).index.equals(df.index)
+	assert [compiled.render(record) for record in df.to_dict(orient='records')] == expected
+
+
+def test_templates_are_parsed_once():
+	assert compile_template('Row {id}: {text}') is compile_template('Row {id}: {text}')
+	assert compile_template('{text} {id} {text.upper} {tags[0]}').fields == ['text', 'id', 'tags']
+
+
+def test_missing_fields_are_reported():
+	template = compile_template('Row {id}: {text} {label}')
+	assert template.get_missing_fields(['id', 'text']) == ['label']
+	with pytest.raises(ValueError, match=r"\['label'\]"):
+		template.render_batch(_frame(3))
+	with pytest.raises(ValueError, match='positional'):
+		CompiledTemplate('Row {}')
+
+
+def test_rendering_is_faster_than_formatting_row_by_row():
+	df = _frame(20000)
+	template = 'Row {id}: {text} ({score})'
+
+	start_time = time.perf_counter()
+	rendered = compile_template(template).render_batch(df)
+	render_time = time.perf_counter() - start_time
+
+	start_time = time.perf_counter()
+	formatted = df.apply(lambda row: template.format(**row), axis=1)
+	format_time = time.perf_counter() - start_time
+
+	assert rendered.equals(formatted)
+	assert render_time < format_time
+
+
+class FailingRuntime(FakeRuntime):
+	"""Fake runtime failing on any LLM call."""
+
+	def _call_chain(self, *args, **kwargs):
+		raise AssertionError('no call expected')
+
+
+def test_missing_fields_fail_before_any_call():
+	runtime = FailingRuntime()
+	batch = _frame(5)
+	with pytest.raises(ValueError, match=r"\['label'\]"):
+		runtime.batch_to_batch(batch, input_template='{text} {label}', output_template=[{'name': 'out', 'description': 'out'}])
+
+	analysis = AnalysisSkill(
+		name='analysis',
+		input_template='{text} {label}',
+		output_template=[{'name': 'out', 'description': 'out'}],
+		instruction_template='Analyze.',
+		chunk_tokens=100,
+	)
+	with pytest.raises(ValueError, match=r"\['label'\]"):
+		analysis.apply(batch, runtime)
+
+	retrieval = RetrievalSkill(
+		name='retrieval',
+		input_template='{question} {context}',
+		output_template=[{'name': 'answer', 'description': 'answer'}],
+		instruction_template='Answer.',
+		vector_store=AllyVectorStore(vector_store=SleepingVectorStore()),
+		query_input_fields=['question'],
+		query_output_field='context',
+	)
+	with pytest.raises(ValueError, match=r"\['question'\]"):
+		retrieval.apply(batch, runtime)
+
+
+def test_improve_examples_are_rendered_by_columns():
+	skill = TransformSkill(
+		name='sentiment',
+		input_template='Text: {text}',
+		output_template=[{'name': 'sentiment', 'description': 'sentiment'}],
+		instruction_template='Label the sentiment.',
+	)
+	seen_inputs = []
+
+	def teacher(inputs, output_fields, rng):
+		seen_inputs.append(inputs['input'])
+		return {output_fields[0]: 'New instruction.'}
+
+	predictions = InternalDataFrame({'text': ['good', 'bad', 'fine'], 'sentiment': ['negative', 'positive', 'positive']})
+	feedback = type('Feedback', (), {
+		'match': InternalDataFrame({'sentiment': [False, False, True]}),
+		'feedback': InternalDataFrame({'sentiment': ['should be positive', 'should be negative', None]}),
+	})()
+	skill.improve(predictions, 'sentiment', feedback, FakeRuntime(output_generator=teacher))
+
+	assert skill.instruction_template == 'New instruction.'
+	assert '### Example #0\n\nText: good\n\nsentiment: negative\n\nUser feedback: should be positive' in seen_inputs[0]
+	assert '### Example #1\n\nText: bad\n\nsentiment: positive\n\nUser feedback: should be negative' in seen_inputs[0]
+	assert '### Example #2' not in seen_inputs[0]
@@ -0,0 +1,189 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ally.runtimes.tgi import TGIApiType, TGIError, TGIRuntime
+from ally.utils.internal_data import InternalDataFrame
+
+OUTPUT_TEMPLATE = [{'name': 'label', 'description': 'the label'}]
+
+
+class StubTGIHandler(BaseHTTPRequestHandler):
+	"""Answers like a TGI server: the label is the last word of the first message."""
+
+	protocol_version = 'HTTP/1.1'
+
+	def log_message(self, format, *args):
+		pass
+
+	def _send(self, status, body, content_type='application/json'):
+		body = body.encode('utf-8')
+		self.send_response(status)
+		self.send_header('Content-Type', content_type)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def do_POST(self):
+		server = self.server
+		payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+		with server.lock:
+			server.requests.append((self.path, payload))
+			server.connections.add(self.client_address)
+			server.in_flight += 1
+			server.max_in_flight = max(server.max_in_flight, server.in_flight)
+		time.sleep(0.05)
+		with server.lock:
+			server.in_flight -= 1
+
+		if self.path.startswith('/generate'):
+			prompt = payload['inputs'].split('\n\n')[0]
+		else:
+			prompt = payload['messages'][0]['content']
+		if 'overloaded' in prompt:
+			return self._send(429, json.dumps({'error': 'Model is overloaded'}))
+		completion = '```json\n' + json.dumps({'label': prompt.split()[-1]}) + '\n```'
+
+		if self.path == '/generate':
+			stop = payload['parameters']['stop']
+			self._send(200, json.dumps({'generated_text': completion + (stop[0] if stop else '')}))
+		elif self.path == '/generate_stream':
+			events = ''.join(
+				f'data: {json.dumps({"token": {"text": char, "special": False}})}\n\n' for char in completion)
+			self._send(200, events, content_type='text/event-stream')
+		else:
+			self._send(200, json.dumps({'choices': [{'message': {'role': 'assistant', 'content': completion}}]}))
+
+
+@pytest.fixture
+def server():
+	server = ThreadingHTTPServer(('127.0.0.1', 0), StubTGIHandler)
+	server.lock = threading.Lock()
+	server.requests = []
+	server.connections = set()
+	server.in_flight = 0
+	server.max_in_flight = 0
+	thread = threading.Thread(target=server.serve_forever, daemon=True)
+	thread.start()
+	yield server
+	server.shutdown()
+	server.server_close()
+
+
+def _runtime(server, **kwargs):
+	return TGIRuntime(endpoint_url=f'http://127.0.0.1:{server.server_address[1]}', **kwargs)
+
+
+def _batch(num_rows):
+	return InternalDataFrame({'text': [f'text {i}' for i in range(num_rows)]})
+
+
+def _batch_to_batch(runtime, batch):
+	return runtime.batch_to_batch(
+		batch,
+		input_template='{text}',
+		output_template=OUTPUT_TEMPLATE,
+		instruction_template='Label the text.',
+	)
+
+
+def test_concurrent_generate_calls_reuse_pooled_connections(server):
+	runtime = _runtime(server, max_workers=8, max_new_tokens=32, stop_sequences=['</s>'])
+	output = _batch_to_batch(runtime, _batch(32))
+	assert output['label'].tolist() == [str(i) for i in range(32)]
+	assert server.max_in_flight > 1
+	assert len(server.connections) <= 8
+	path, payload = server.requests[0]
+	assert path == '/generate'
+	assert payload['parameters'] == {'max_new_tokens': 32, 'stop': ['</s>']}
+
+
+def test_async_calls_with_openai_compatible_api(server):
+	runtime = _runtime(server, api_type=TGIApiType.OpenAI, model_name='llama', max_workers=8, temperature=0.5)
+
+	async def run():
+		output = await runtime.abatch_to_batch(
+			_batch(16),
+			input_template='{text}',
+			output_template=OUTPUT_TEMPLATE,
+			instruction_template='Label the text.',
+		)
+		await runtime.aclose()
+		return output
+
+	output = asyncio.run(run())
+	assert output['label'].tolist() == [str(i) for i in range(16)]
+	assert server.max_in_flight > 1
+	assert len(server.connections) <= 8
+	path, payload = server.requests[0]
+	assert path == '/v1/chat/completions'
+	assert payload['model'] == 'llama' and payload['temperature'] == 0.5
+	assert [message['role'] for message in payload['messages']] == ['user', 'system']
+
+
+def test_the_session_of_another_event_loop_is_closed_when_replaced(server):
+	runtime = _runtime(server)
+	record = dict(
+		record={'text': 'hello'},
+		input_template='{text}',
+		output_template=OUTPUT_TEMPLATE,
+		instruction_template='Label the text.',
+	)
+	loop = asyncio.new_event_loop()
+	thread = threading.Thread(target=loop.run_forever, daemon=True)
+	thread.start()
+	try:
+		assert asyncio.run_coroutine_threadsafe(runtime.arecord_to_record(**record), loop).result() == {'label': 'hello'}
+		session = runtime._async_session
+
+		async def run():
+			output = await runtime.arecord_to_record(**record)
+			await runtime.aclose()
+			return output
+
+		assert asyncio.run(run()) == {'label': 'hello'}
+		assert runtime._async_session is None
+		for _ in range(100):
+			if session.closed:
+				break
+			time.sleep(0.01)
+		assert session.closed
+	finally:
+		loop.call_soon_threadsafe(loop.stop)
+		thread.join()
+		loop.close()
+
+
+def test_stream(server):
+	runtime = _runtime(server)
+
+	async def run():
+		stream = runtime.astream_record_to_record(
+			{'text': 'hello'},
+			input_template='{text}',
+			output_template=OUTPUT_TEMPLATE,
+			instruction_template='Label the text.',
+		)
+		tokens = [token async for token in stream]
+		await runtime.aclose()
+		return tokens, stream.output
+
+	tokens, output = asyncio.run(run())
+	assert len(tokens) > 1
+	assert output == {'label': 'hello'}
+
+
+def test_server_errors_carry_the_status_code(server):
+	runtime = _runtime(server)
+	with pytest.raises(TGIError) as error:
+		runtime.record_to_record(
+			{'text': 'overloaded'},
+			input_template='{text}',
+			output_template=OUTPUT_TEMPLATE,
+			instruction_template='Label the text.',
+		)
+	assert error.value.status_code == 429
@@ -0,0 +1,175 @@
+import asyncio
+import threading
+import time
+from typing import List
+
+import pytest
+from langchain.schema import Document
+from langchain.schema.embeddings import Embeddings
+from langchain.schema.vectorstore import VectorStore
+
+from ally.runtimes.fake import FakeRuntime
+from ally.skills.base import RetrievalSkill
+from ally.test.utils import SleepingVectorStore, TopKVectorStore
+from ally.utils.internal_data import InternalDataFrame
+from ally.vector_store.base import AllyVectorStore
+
+
+class CountingEmbeddings(Embeddings):
+	"""Embeds a text as its number, counting the calls."""
+
+	def __init__(self):
+		self.calls = []
+
+	def embed_documents(self, texts: List[str]) -> List[List[float]]:
+		self.calls.append(len(texts))
+		return [[float(text.split()[-1])] for text in texts]
+
+	def embed_query(self, text: str) -> List[float]:
+		return self.embed_documents([text])[0]
+
+
+class VectorSearchStore(VectorStore):
+	"""Vector store answering lookups by vector after a delay, tracking the concurrent lookups."""
+
+	def __init__(self, delay: float = 0.0):
+		self._embeddings = CountingEmbeddings()
+		self.delay = delay
+		self.lookups = 0
+		self.in_flight = 0
+		self.max_in_flight = 0
+		self.lock = threading.Lock()
+
+	@property
+	def embeddings(self):
+		return self._embeddings
+
+	def add_texts(self, texts, metadatas=None, **kwargs):
+		return []
+
+	@classmethod
+	def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+		return cls()
+
+	def similarity_search(self, query, k=4, **kwargs):
+		raise AssertionError('queries must be embedded in bulk')
+
+	def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+		with self.lock:
+			self.lookups += 1
+			self.in_flight += 1
+			self.max_in_flight = max(self.max_in_flight, self.in_flight)
+		time.sleep(self.delay)
+		with self.lock:
+			self.in_flight -= 1
+		return [Document(page_content=f'doc {int(embedding[0])}')]
+
+
+def _batch(num_rows, num_distinct):
+	return InternalDataFrame(
+		{'question': [f'question {i % num_distinct}' for i in range(num_rows)]},
+		index=[f'id-{num_rows - i}' for i in range(num_rows)],
+	)
+
+
+def test_queries_are_embedded_in_chunks_and_joined_back_by_index():
+	store = VectorSearchStore()
+	vector_store = AllyVectorStore(vector_store=store, embedding_batch_size=64)
+	batch = _batch(1000, 300)
+	output = vector_store.batch_to_batch(batch, input_fields=['question'], output_field='context', max_workers=8)
+
+	assert output.index.equals(batch.index)
+	assert output['question'].tolist() == batch['question'].tolist()
+	assert output['context'].tolist() == [f'doc {i % 300}' for i in range(1000)]
+	# 300 distinct queries: 5 embedding calls and 300 lookups instead of 1000 of each
+	assert store.embeddings.calls == [64, 64, 64, 64, 44]
+	assert store.lookups == 300
+
+
+def test_lookups_run_concurrently():
+	store = VectorSearchStore(delay=0.05)
+	vector_store = AllyVectorStore(vector_store=store)
+	start_time = time.perf_counter()
+	vector_store.batch_to_batch(_batch(20, 20), input_fields=['question'], output_field='context', max_workers=10)
+	assert time.perf_counter() - start_time < 0.5
+	assert store.max_in_flight <= 10
+
+	store = VectorSearchStore(delay=0.05)
+	vector_store = AllyVectorStore(vector_store=store, embedding_batch_size=8)
+	output = asyncio.run(vector_store.abatch_to_batch(
+		_batch(40, 20), input_fields=['question'], output_field='context', max_workers=4))
+	assert output['context'].tolist() == [f'doc {i % 20}' for i in range(40)]
+	assert store.embeddings.calls == [8, 8, 4]
+	assert 1 < store.max_in_flight <= 4
+
+
+def test_stores_without_vector_search_are_queried_by_text():
+	vector_store = AllyVectorStore(vector_store=SleepingVectorStore())
+	batch = _batch(10, 5)
+	output = vector_store.batch_to_batch(batch, input_fields=['question'], output_field='context', max_workers=5)
+	assert output['context'].tolist() == [f'context for question {i % 5}' for i in range(10)]
+	output = asyncio.run(vector_store.abatch_to_batch(batch, input_fields=['question'], output_field='context'))
+	assert output['context'].tolist() == [f'context for question {i % 5}' for i in range(10)]
+
+
+def test_retrieval_skill_uses_the_batched_path():
+	store = VectorSearchStore()
+	skill = RetrievalSkill(
+		name='answer',
+		input_template='{question} {context}',
+		output_template=[{'name': 'answer', 'description': 'answer'}],
+		instruction_template='Answer the question.',
+		vector_store=AllyVectorStore(vector_store=store),
+		query_input_fields=['question'],
+		query_output_field='context',
+	)
+	output = skill.apply(_batch(100, 10), FakeRuntime(max_workers=4))
+	assert len(output) == 100
+	assert store.embeddings.calls == [10]
+	assert store.lookups == 10
+
+
+class NoEmbeddingsStore(VectorSearchStore):
+	"""Vector store searchable by vector that doesn't expose its embeddings."""
+
+	@property
+	def embeddings(self):
+		return None
+
+	def similarity_search(self, query, k=4, **kwargs):
+		with self.lock:
+			self.lookups += 1
+		return [Document(page_content=f'text {query.split()[-1]}')]
+
+
+def test_stores_without_embeddings_are_queried_by_text():
+	store = NoEmbeddingsStore()
+	vector_store = AllyVectorStore(vector_store=store)
+	batch = _batch(10, 5)
+	output = vector_store.batch_to_batch(batch, input_fields=['question'], output_field='context', max_workers=4)
+	assert output['context'].tolist() == [f'text {i % 5}' for i in range(10)]
+	assert store.lookups == 5
+	output = asyncio.run(vector_store.abatch_to_batch(batch, input_fields=['question'], output_field='context'))
+	assert output['context'].tolist() == [f'text {i % 5}' for i in range(10)]
+
+
+class TopKVectorSearchStore(VectorSearchStore):
+	"""Vector store searchable by vector returning `k` documents, 2 by default."""
+
+	def similarity_search_by_vector(self, embedding, k=2, **kwargs):
+		return [Document(page_content=f'doc {int(embedding[0])}.{i}') for i in range(k)]
+
+
+@pytest.mark.parametrize('store, first_context', [
+	(TopKVectorStore(), 'd0 d1'),
+	(TopKVectorSearchStore(), 'doc 0.0 doc 0.1'),
+])
+def test_sync_and_async_batches_retrieve_the_same_contexts(store, first_context):
+	batch = _batch(20, 10)
+	vector_store = AllyVectorStore(vector_store=store)
+	output = vector_store.batch_to_batch(batch, input_fields=['question'], output_field='context', max_workers=4)
+	async_output = asyncio.run(vector_store.abatch_to_batch(
+		batch, input_fields=['question'], output_field='context', max_workers=4))
+	# the default k of the store, 2, is used by both paths
+	assert output['context'].iloc[0] == first_context
+	assert async_output.equals(output)
@@ -1,6 +1,18 @@
+import asyncio
 import enum
+import json
+import threading
+import time
+from typing import Any, Dict, List, Optional
 from unittest.mock import patch
 
+from langchain.schema import Document
+from langchain.schema.vectorstore import VectorStore
+
+from ally.runtimes.base import Runtime
+from ally.runtimes.fake import FakeLLMError
+from ally.skills.base import TransformSkill
+
 
 class PatchedCalls(enum.Enum):
 	LLMChain = 'langchain.chains.llm.LLMChain._call'
@@ -71,3 +83,95 @@ def patching(target_function, data, strict=False):
 		return wrapper
 
 	return decorator
+
+
+class SleepingChain:
+	"""Fake chain that sleeps before echoing the text input as a structured output."""
+
+	def __init__(self, prompt, delay: float = 0.05):
+		self.prompt = prompt
+		self.delay = delay
+		self.num_calls = 0
+
+	def run(self, inputs: Dict[str, Any]) -> str:
+		self.num_calls += 1
+		time.sleep(self.delay)
+		return self._format_output(inputs)
+
+	async def arun(self, inputs: Dict[str, Any]) -> str:
+		self.num_calls += 1
+		await asyncio.sleep(self.delay)
+		return self._format_output(inputs)
+
+	def _format_output(self, inputs: Dict[str, Any]) -> str:
+		return '```json\n' + json.dumps({'output': str(inputs['text']).upper()}) + '\n```'
+
+
+class SleepingRuntime(Runtime):
+
+	def _create_chain(self):
+		self._chain = SleepingChain(prompt=self._llm_prompt_template)
+
+
+class SleepingVectorStore(VectorStore):
+
+	def add_texts(self, texts, metadatas=None, **kwargs) -> List[str]:
+		return []
+
+	@classmethod
+	def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+		return cls()
+
+	def similarity_search(self, query: str, k: int = 4, **kwargs) -> List[Document]:
+		time.sleep(0.05)
+		return [Document(page_content=f'context for {query}')]
+
+
+class TopKVectorStore(VectorStore):
+	"""Vector store returning the first `k` documents, with a default k of 2 as CustomSupabaseVectorStore."""
+
+	def add_texts(self, texts, metadatas=None, **kwargs) -> List[str]:
+		return []
+
+	@classmethod
+	def from_texts(cls, texts, embedding, metadatas=None, **kwargs):
+		return cls()
+
+	def similarity_search(self, query: str, k: int = 2, **kwargs) -> List[Document]:
+		return [Document(page_content=f'd{i}') for i in range(k)]
+
+
+def transform_skill(name: str, input_template: str, output_field: str) -> TransformSkill:
+	"""Returns a skill named `name` generating the field `output_field` from `input_template`."""
+	return TransformSkill(
+		name=name,
+		input_template=input_template,
+		output_template=[{'name': output_field, 'description': output_field}],
+		instruction_template=f'Run {name}.',
+	)
+
+
+class CallLog:
+	"""
+	Output generator of FakeRuntime appending the output field to an input value, e.g. `r0.x` for the field `x`
+	of the input `r0`, and logging the calls in order as (output field, input value) pairs.
+
+	Args:
+		sources (Dict[str, str]): The input field of each output field.
+		failing_input (str, optional): Input value making the call fail with a FakeLLMError.
+	"""
+
+	def __init__(self, sources: Dict[str, str], failing_input: Optional[str] = None):
+		self.sources = sources
+		self.failing_input = failing_input
+		self.calls = []
+		self.lock = threading.Lock()
+
+	def __call__(self, inputs, output_fields, rng):
+		field = output_fields[0]
+		value = inputs[self.sources[field]]
+		if value == self.failing_input:
+			raise FakeLLMError('failed')
+		with self.lock:
+			self.calls.append((field, value))
+		return {field: f'{value}.{field}'}
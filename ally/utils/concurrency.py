@@ -0,0 +1,89 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, List
+
+from tqdm import tqdm
+
+from ally.utils.internal_data import InternalDataFrame
+from ally.utils.logs import print_text
+
+
+def map_concurrently(
+	func: Callable[..., Any],
+	items: Iterable[Any],
+	max_workers: int = 1,
+	unit: str = 'it',
+	**kwargs,
+) -> List[Any]:
+	"""
+	Calls a function on every item using a bounded thread pool, showing the progress.
+
+	Args:
+		func (Callable): Function that takes an item.
+		items (Iterable): The items to process.
+		max_workers (int): Maximum number of items processed at the same time. Defaults to 1.
+		unit (str): Name of the item unit in the progress bar. Defaults to 'it'.
+		**kwargs: Additional keyword arguments passed to `func`.
+
+	Returns:
+		List[Any]: The results, in the order of the items.
+
+	Raises:
+		Exception: The first exception raised by `func`. The items that haven't started yet are cancelled.
+	"""
+	items = list(items)
+	results: List[Any] = [None] * len(items)
+	if not items:
+		return results
+	with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+		futures = {
+			executor.submit(func, item, **kwargs): position
+			for position, item in enumerate(items)
+		}
+		try:
+			for future in tqdm(as_completed(futures), total=len(futures), unit=unit):
+				results[futures[future]] = future.result()
+		except BaseException:
+			# the items not started yet are not processed, the running ones are waited for
+			executor.shutdown(wait=False, cancel_futures=True)
+			raise
+	return results
+
+
+def apply_concurrently(
+	batch: InternalDataFrame,
+	func: Callable[..., Dict[str, Any]],
+	max_workers: int = 1,
+	verbose: bool = False,
+	**kwargs,
+) -> InternalDataFrame:
+	"""
+	Applies a record-level function to every row of a dataframe using a bounded thread pool.
+
+	Rows are submitted to at most `max_workers` threads, and the results are reassembled
+	in the original index order, so the output is equivalent to
+	`batch.progress_apply(func, axis=1, result_type='expand', **kwargs)`.
+
+	Args:
+		batch (InternalDataFrame): The batch of records to be processed.
+		func (Callable): Function that takes a record (dict) and returns a dict.
+		max_workers (int): Maximum number of rows processed at the same time. Defaults to 1.
+		verbose (bool): Print the total and per-row processing time. Defaults to False.
+		**kwargs: Additional keyword arguments passed to `func`.
+
+	Returns:
+		InternalDataFrame: The processed batch, indexed like the input batch.
+	"""
+	records = batch.to_dict(orient='records')
+	if not records:
+		return InternalDataFrame(index=batch.index)
+
+	start_time = time.perf_counter()
+	results = map_concurrently(func, records, max_workers=max_workers, unit='row', **kwargs)
+	elapsed = time.perf_counter() - start_time
+
+	if verbose:
+		print_text(
+			f'Processed {len(records)} rows in {elapsed:.2f}s '
+			f'({elapsed / len(records):.3f}s/row, max_workers={max_workers})')
+	return InternalDataFrame(results, index=batch.index)
@@ -24,3 +24,44 @@ def InternalDataFrameConcat(dfs: Iterable[InternalDataFrame], **kwargs) -> Inter
 		InternalDataFrame: The concatenated dataframe.
 	"""
 	return pd.concat(dfs, **kwargs)
+
+
+class ColumnarContext:
+	"""
+	Columns of a dataframe flowing through a pipeline of skills, kept by reference.
+
+	Adding the output columns of a skill replaces the columns with the same name and appends the others,
+	without copying the existing columns as `drop` and `merge` would. Frames are built from the columns
+	without copying them, so they share their data with the input frame and the skill outputs.
+
+	Args:
+		df (InternalDataFrame): The input dataframe.
+	"""
+
+	def __init__(self, df: InternalDataFrame):
+		self.index = df.index
+		self.columns: Dict[str, InternalSeries] = {name: df[name] for name in df.columns}
+
+	def add_columns(self, df: InternalDataFrame) -> 'ColumnarContext':
+		"""
+		Adds the columns of a dataframe, keeping only the rows present in both, as an inner join on the index.
+
+		Args:
+			df (InternalDataFrame): The dataframe whose columns are added.
+
+		Returns:
+			ColumnarContext: The context itself.
+		"""
+		if not df.index.equals(self.index):
+			self.index = self.index[self.index.isin(df.index)]
+			self.columns = {name: column.loc[self.index] for name, column in self.columns.items()}
+			df = df.loc[self.index]
+		for name in df.columns:
+			# replaced columns move to the end, as with drop + merge
+			self.columns.pop(name, None)
+			self.columns[name] = df[name]
+		return self
+
+	def to_frame(self) -> InternalDataFrame:
+		"""Returns a dataframe referencing the columns."""
+		return InternalDataFrame(self.columns, index=self.index, copy=False)
@@ -0,0 +1,63 @@
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+_FENCED_BLOCK = re.compile(r'```(?:[a-zA-Z]+)?\s*(.*?)```', re.DOTALL)
+_JSON_DECODER = json.JSONDecoder()
+
+
+def extract_json(text: str) -> Optional[Any]:
+	"""
+	Extracts the first JSON object or list from an LLM completion in a single pass.
+
+	Fenced code blocks are tried first, then the first position of the text where a JSON value
+	can be decoded, so leading and trailing prose are ignored.
+
+	Args:
+		text (str): The completion.
+
+	Returns:
+		Optional[Any]: The decoded dict or list, or None if the text contains no JSON value.
+	"""
+	candidates = [match.group(1) for match in _FENCED_BLOCK.finditer(text)]
+	candidates.append(text)
+	for candidate in candidates:
+		for match in re.finditer(r'[{\[]', candidate):
+			try:
+				value, _ = _JSON_DECODER.raw_decode(candidate, match.start())
+			except ValueError:
+				continue
+			if isinstance(value, (dict, list)):
+				return value
+	return None
+
+
+def extract_structured_output(text: str, output_fields: List[str]) -> Optional[Dict[str, Any]]:
+	"""
+	Recovers the output fields from a completion that the structured output parser rejected,
+	without calling the LLM again.
+
+	Handles fenced blocks with any language tag, JSON surrounded by text and keys differing
+	only by case. A completion without JSON is used as the value when a single field is expected.
+
+	Args:
+		text (str): The completion.
+		output_fields (List[str]): The expected output fields.
+
+	Returns:
+		Optional[Dict[str, Any]]: The output fields, or None if they can't be recovered.
+	"""
+	value = extract_json(text)
+	if isinstance(value, list) and len(value) == 1:
+		value = value[0]
+	if isinstance(value, dict):
+		keys = {str(key).strip().lower(): key for key in value}
+		if all(field.lower() in keys for field in output_fields):
+			return {field: value[keys[field.lower()]] for field in output_fields}
+		return None
+	if value is None and len(output_fields) == 1:
+		answer = _FENCED_BLOCK.sub(lambda match: match.group(1), text).strip()
+		# a truncated or malformed JSON object is not a raw answer
+		if answer and '{' not in answer:
+			return {output_fields[0]: answer}
+	return None
@@ -0,0 +1,138 @@
+import re
+import string
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ally.utils.internal_data import InternalDataFrame, InternalSeries
+
+_formatter = string.Formatter()
+
+# Name of the record field referenced by a replacement field, e.g. `a` for `{a.b}` or `{a[0]}`
+_FIELD_NAME = re.compile(r'[^.\[]*')
+
+
+class CompiledTemplate:
+	"""
+	A `str.format` template parsed once, rendering records or whole dataframes.
+
+	The template is split into literal texts and replacement fields when it is created, so its fields
+	can be checked against the columns of a dataframe before any row is rendered. Dataframes are rendered
+	column by column: the values of a field are converted to strings for all the rows at once, then
+	concatenated with the literal texts, instead of formatting the template row by row.
+
+	Args:
+		template (str): The template, e.g. `'Text: {text}'`.
+
+	Raises:
+		ValueError: If the template is malformed, or has positional fields or nested format specs.
+	"""
+
+	def __init__(self, template: str):
+		self.template = template
+		# (literal text, field name, format spec, conversion) as returned by `string.Formatter.parse`
+		self.segments: List[Tuple[str, Optional[str], str, Optional[str]]] = list(_formatter.parse(template))
+		self.fields: List[str] = []
+		for _, field_name, format_spec, _ in self.segments:
+			if field_name is None:
+				continue
+			name = _FIELD_NAME.match(field_name).group()
+			if not name or name.isdigit():
+				raise ValueError(f'Template {template!r} has positional fields, only named fields are supported')
+			if format_spec and '{' in format_spec:
+				raise ValueError(f'Template {template!r} has nested format specs, which are not supported')
+			if name not in self.fields:
+				self.fields.append(name)
+
+	def __repr__(self) -> str:
+		return f'{type(self).__name__}({self.template!r})'
+
+	def get_missing_fields(self, columns: Iterable[str]) -> List[str]:
+		"""
+		Returns the fields of the template that are not in the columns.
+
+		Args:
+			columns (Iterable[str]): The available columns, e.g. `df.columns`.
+
+		Returns:
+			List[str]: The missing fields, in order of appearance.
+		"""
+		columns = set(columns)
+		return [field for field in self.fields if field not in columns]
+
+	def validate(self, columns: Iterable[str]):
+		"""
+		Checks that every field of the template is one of the columns.
+
+		Args:
+			columns (Iterable[str]): The available columns, e.g. `df.columns`.
+
+		Raises:
+			ValueError: If some fields are missing.
+		"""
+		columns = list(columns)
+		missing_fields = self.get_missing_fields(columns)
+		if missing_fields:
+			raise ValueError(
+				f'Fields {missing_fields} of the template {self.template!r} are missing from the columns {columns}')
+
+	def _format_value(self, value: Any, field_name: str, format_spec: str, conversion: Optional[str]) -> str:
+		name = _FIELD_NAME.match(field_name).group()
+		if field_name != name:
+			value, _ = _formatter.get_field(field_name, (), {name: value})
+		return format(_formatter.convert_field(value, conversion), format_spec)
+
+	def render(self, record: Dict[str, Any]) -> str:
+		"""
+		Renders a record, as `template.format(**record)`.
+
+		Args:
+			record (Dict[str, Any]): The record.
+
+		Returns:
+			str: The rendered text.
+		"""
+		# the C implementation of format_map is faster than joining the segments of a single record
+		return self.template.format_map(record)
+
+	def _render_column(self, column: InternalSeries, field_name: str, format_spec: str, conversion: Optional[str]):
+		if field_name == _FIELD_NAME.match(field_name).group() and not format_spec and not conversion:
+			# format(value, '') is str(value)
+			return column.astype(str)
+		return column.map(lambda value: self._format_value(value, field_name, format_spec, conversion))
+
+	def render_batch(self, df: InternalDataFrame) -> InternalSeries:
+		"""
+		Renders every row of a dataframe.
+
+		Args:
+			df (InternalDataFrame): The dataframe.
+
+		Returns:
+			InternalSeries: The rendered texts, with the index of the dataframe.
+
+		Raises:
+			ValueError: If some fields of the template are not columns of the dataframe.
+		"""
+		self.validate(df.columns)
+		output = InternalSeries('', index=df.index, dtype=object)
+		for literal_text, field_name, format_spec, conversion in self.segments:
+			if literal_text:
+				output = output + literal_text
+			if field_name is not None:
+				column = df[_FIELD_NAME.match(field_name).group()]
+				output = output + self._render_column(column, field_name, format_spec, conversion)
+		return output
+
+
+@lru_cache(maxsize=256)
+def compile_template(template: str) -> CompiledTemplate:
+	"""
+	Returns the compiled template, parsing every distinct template once.
+
+	Args:
+		template (str): The template.
+
+	Returns:
+		CompiledTemplate: The compiled template.
+	"""
+	return CompiledTemplate(template)
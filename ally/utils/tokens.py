@@ -0,0 +1,80 @@
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional
+
+import tiktoken
+
+# Average number of characters per token, used when no tokenizer is available
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name: Optional[str] = None) -> Optional[tiktoken.Encoding]:
+	"""
+	Returns the tiktoken encoding of the model, or None if it can't be loaded
+	(e.g. the encoding files can't be downloaded).
+
+	Args:
+		model_name (str, optional): The name of the model. Defaults to the cl100k_base encoding.
+
+	Returns:
+		Optional[tiktoken.Encoding]: The encoding.
+	"""
+	try:
+		if model_name:
+			try:
+				return tiktoken.encoding_for_model(model_name)
+			except KeyError:
+				pass
+		return tiktoken.get_encoding('cl100k_base')
+	except Exception:
+		return None
+
+
+def count_tokens(text: str, model_name: Optional[str] = None) -> int:
+	"""
+	Counts the tokens of a text with the tokenizer of the model, or estimates them
+	from the text length if the tokenizer is not available.
+
+	Args:
+		text (str): The text.
+		model_name (str, optional): The name of the model.
+
+	Returns:
+		int: The number of tokens.
+	"""
+	encoding = get_encoding(model_name)
+	if encoding is None:
+		return len(text) // CHARS_PER_TOKEN + 1
+	return len(encoding.encode(text, disallowed_special=()))
+
+
+def chunk_by_tokens(
+	texts: Iterable[str],
+	max_tokens: int,
+	model_name: Optional[str] = None,
+	min_texts: int = 1,
+) -> Iterator[List[str]]:
+	"""
+	Groups consecutive texts into chunks of at most `max_tokens` tokens, counting one more token
+	per text for the separator. A text longer than `max_tokens` is a chunk on its own, unless
+	a chunk needs more texts to reach `min_texts`. Texts are consumed lazily.
+
+	Args:
+		texts (Iterable[str]): The texts.
+		max_tokens (int): Maximum number of tokens of a chunk.
+		model_name (str, optional): The name of the model, to select its tokenizer.
+		min_texts (int): Minimum number of texts of a chunk, except the last one. Defaults to 1.
+
+	Yields:
+		List[str]: The texts of a chunk.
+	"""
+	chunk, chunk_tokens = [], 0
+	for text in texts:
+		tokens = count_tokens(text, model_name) + 1
+		if len(chunk) >= min_texts and chunk_tokens + tokens > max_tokens:
+			yield chunk
+			chunk, chunk_tokens = [], 0
+		chunk.append(text)
+		chunk_tokens += tokens
+	if chunk:
+		yield chunk
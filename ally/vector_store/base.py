@@ -1,23 +1,65 @@
-from typing import Any, Dict
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
 
 from langchain.schema import Document
+from langchain.schema.embeddings import Embeddings
 from langchain.schema.vectorstore import VectorStore
 from pydantic import BaseModel
+from tqdm.asyncio import tqdm_asyncio
 
+from ally.utils.concurrency import map_concurrently
 from ally.utils.internal_data import InternalDataFrame
 
 
 class AllyVectorStore(BaseModel):
+	"""
+	Retrieves the context of the records from a vector store.
+
+	Batches are retrieved in bulk: the distinct queries of the batch are embedded with chunked
+	`embed_documents` calls, then the similarity lookups run concurrently by vector and the contexts
+	are joined back to the records. Vector stores without embeddings or without
+	`similarity_search_by_vector` are queried concurrently with `similarity_search`.
+
+	Attributes:
+		vector_store (VectorStore): The vector store to query.
+		embedding_batch_size (int): Maximum number of queries embedded by a single call. Defaults to 64.
+	"""
   	
 	class Config:
 		arbitrary_types_allowed = True
 	
 	vector_store: VectorStore = None
+	embedding_batch_size: int = 64
 
 	def update(self, experience_doc: Document):
 		ids = self.vector_store.add_documents([experience_doc])
 		return ids
 
+	def _get_query(self, record, input_fields: list[str]) -> Tuple[Dict[str, Any], str]:
+		if not isinstance(record, dict):
+			record = record.to_dict()
+		else:
+			record = record.copy()
+		input_data = " ".join([str(
+			record[input_field]) for input_field in input_fields])
+		return record, input_data
+
+	def _get_context(self, docs: List[Document]) -> str:
+		return " ".join([doc.page_content for doc in docs])
+
+	async def _asimilarity_search(self, query: str) -> List[Document]:
+		"""Searches the query asynchronously with the same documents count as `similarity_search`: the default
+		`VectorStore.asimilarity_search` passes k=4, overriding the default k of the store."""
+		if type(self.vector_store).asimilarity_search is VectorStore.asimilarity_search:
+			return await asyncio.to_thread(self.vector_store.similarity_search, query)
+		return await self.vector_store.asimilarity_search(query)
+
+	async def _asimilarity_search_by_vector(self, embedding: List[float]) -> List[Document]:
+		"""Searches the embedded query asynchronously with the same documents count as `similarity_search_by_vector`."""
+		if type(self.vector_store).asimilarity_search_by_vector is VectorStore.asimilarity_search_by_vector:
+			return await asyncio.to_thread(self.vector_store.similarity_search_by_vector, embedding)
+		return await self.vector_store.asimilarity_search_by_vector(embedding)
+
 	def _process_record(
 		self,
 		record,
@@ -34,28 +76,190 @@ class AllyVectorStore(BaseModel):
 		Returns:
 				Dict[str, Any]: The processed record.
 		"""
-		if not isinstance(record, dict):
-			record = record.to_dict()
-		else:
-			record = record.copy()
-		input_data = " ".join([str(
-			record[input_field]) for input_field in input_fields])
+		record, input_data = self._get_query(record, input_fields)
 		docs = self.vector_store.similarity_search(input_data)
-		record[output_field] = " ".join([doc.page_content for doc in docs])
+		record[output_field] = self._get_context(docs)
+		return record
+
+	async def _aprocess_record(
+		self,
+		record,
+		input_fields: list[str],
+		output_field: str,
+		semaphore: asyncio.Semaphore,
+	) -> Dict[str, Any]:
+		"""Asynchronously processes a single record using input and output fields.
+
+		Args:
+				record (Dict[str, str]): The record to be processed.
+				input_field (str): The input field to be used for extract the query.
+				output_field (str): The output field to store the result.
+				semaphore (asyncio.Semaphore): Semaphore limiting the number of concurrent queries.
+
+		Returns:
+				Dict[str, Any]: The processed record.
+		"""
+		record, input_data = self._get_query(record, input_fields)
+		async with semaphore:
+			docs = await self._asimilarity_search(input_data)
+		record[output_field] = self._get_context(docs)
 		return record
 	
+	def record_to_record(
+		self,
+		record: Dict[str, Any],
+		input_fields: list[str],
+		output_field: str,
+	) -> Dict[str, Any]:
+		"""Retrieves the context for a single record.
+
+		Args:
+				record (Dict[str, Any]): The record to be processed.
+				input_fields (list[str]): The input fields used to build the query.
+				output_field (str): The output field to store the retrieved context.
+
+		Returns:
+				Dict[str, Any]: The record with the retrieved context.
+		"""
+		return self._process_record(record, input_fields=input_fields, output_field=output_field)
+
+	async def arecord_to_record(
+		self,
+		record: Dict[str, Any],
+		input_fields: list[str],
+		output_field: str,
+	) -> Dict[str, Any]:
+		"""Asynchronously retrieves the context for a single record.
+
+		Args:
+				record (Dict[str, Any]): The record to be processed.
+				input_fields (list[str]): The input fields used to build the query.
+				output_field (str): The output field to store the retrieved context.
+
+		Returns:
+				Dict[str, Any]: The record with the retrieved context.
+		"""
+		return await self._aprocess_record(
+			record,
+			input_fields=input_fields,
+			output_field=output_field,
+			semaphore=asyncio.Semaphore(1),
+		)
+
+	def _get_embeddings(self) -> Optional[Embeddings]:
+		"""Returns the embeddings of the vector store if it can be queried by vector, None otherwise:
+		the queries are then searched one by one with `similarity_search`."""
+		if type(self.vector_store).similarity_search_by_vector is VectorStore.similarity_search_by_vector:
+			return None
+		try:
+			# the default `VectorStore.embeddings` is None, and some stores don't implement it
+			return self.vector_store.embeddings
+		except NotImplementedError:
+			return None
+
+	def _get_chunks(self, queries: List[str]) -> List[List[str]]:
+		size = max(1, self.embedding_batch_size)
+		return [queries[start:start + size] for start in range(0, len(queries), size)]
+
+	def _retrieve(self, queries: List[str], max_workers: int = 1) -> List[str]:
+		"""Retrieves the context of every distinct query, in bulk."""
+		embeddings = self._get_embeddings()
+		if embeddings is None:
+			docs = map_concurrently(self.vector_store.similarity_search, queries, max_workers=max_workers, unit='query')
+		else:
+			vectors = [vector for chunk in self._get_chunks(queries) for vector in embeddings.embed_documents(chunk)]
+			docs = map_concurrently(
+				self.vector_store.similarity_search_by_vector, vectors, max_workers=max_workers, unit='query')
+		return [self._get_context(query_docs) for query_docs in docs]
+
+	async def _aretrieve(self, queries: List[str], max_workers: int = 1) -> List[str]:
+		"""Asynchronously retrieves the context of every distinct query, in bulk."""
+		semaphore = asyncio.Semaphore(max(1, max_workers))
+
+		async def search(func, query):
+			async with semaphore:
+				return await func(query)
+
+		embeddings = self._get_embeddings()
+		if embeddings is None:
+			func, items = self._asimilarity_search, queries
+		else:
+			chunks = await asyncio.gather(*[search(embeddings.aembed_documents, chunk) for chunk in self._get_chunks(queries)])
+			func, items = self._asimilarity_search_by_vector, [vector for chunk in chunks for vector in chunk]
+		docs = await tqdm_asyncio.gather(*[search(func, item) for item in items], unit='query')
+		return [self._get_context(query_docs) for query_docs in docs]
+
+	def _get_queries(self, batch: InternalDataFrame, input_fields: list[str]) -> Tuple[List[Dict[str, Any]], List[str]]:
+		"""Returns the records of the batch and their queries."""
+		records = batch.to_dict(orient='records')
+		if not input_fields:
+			return records, [''] * len(records)
+		# the query columns are joined for all the rows at once, as `_get_query` joins the fields of a record
+		queries = batch[input_fields[0]].astype(str)
+		for input_field in input_fields[1:]:
+			queries = queries + ' ' + batch[input_field].astype(str)
+		return records, queries.tolist()
+
+	def _join_contexts(
+		self,
+		batch: InternalDataFrame,
+		records: List[Dict[str, Any]],
+		queries: List[str],
+		distinct_queries: List[str],
+		contexts: List[str],
+		output_field: str,
+	) -> InternalDataFrame:
+		contexts = dict(zip(distinct_queries, contexts))
+		for record, query in zip(records, queries):
+			record[output_field] = contexts[query]
+		return InternalDataFrame(records, index=batch.index)
+
 	def batch_to_batch(
 		self,
 		batch: InternalDataFrame,
 		input_fields: list[str],
 		output_field: str,
+		max_workers: int = 1,
 	) -> InternalDataFrame:
-		output = batch.progress_apply(
-				self._process_record,
-				axis=1,
-				result_type='expand',
-				input_fields=input_fields,
-				output_field=output_field,
-		)
-		return output
-		
+		"""Retrieves the context for every record of the batch.
+
+		Args:
+				batch (InternalDataFrame): The batch of records to be processed.
+				input_fields (list[str]): The input fields used to build the queries.
+				output_field (str): The output field to store the retrieved context.
+				max_workers (int): Maximum number of queries run concurrently. Defaults to 1.
+
+		Returns:
+				InternalDataFrame: The batch with the retrieved context.
+		"""
+		records, queries = self._get_queries(batch, input_fields)
+		if not records:
+			return batch
+		distinct_queries = list(dict.fromkeys(queries))
+		contexts = self._retrieve(distinct_queries, max_workers=max_workers)
+		return self._join_contexts(batch, records, queries, distinct_queries, contexts, output_field)
+
+	async def abatch_to_batch(
+		self,
+		batch: InternalDataFrame,
+		input_fields: list[str],
+		output_field: str,
+		max_workers: int = 1,
+	) -> InternalDataFrame:
+		"""Asynchronously retrieves the context for every record of the batch.
+
+		Args:
+				batch (InternalDataFrame): The batch of records to be processed.
+				input_fields (list[str]): The input fields used to build the queries.
+				output_field (str): The output field to store the retrieved context.
+				max_workers (int): Maximum number of queries in flight at the same time. Defaults to 1.
+
+		Returns:
+				InternalDataFrame: The batch with the retrieved context.
+		"""
+		records, queries = self._get_queries(batch, input_fields)
+		if not records:
+			return batch
+		distinct_queries = list(dict.fromkeys(queries))
+		contexts = await self._aretrieve(distinct_queries, max_workers=max_workers)
+		return self._join_contexts(batch, records, queries, distinct_queries, contexts, output_field)
@@ -17,6 +17,8 @@ class COREAPPSETTING(BaseSettings):
     resend_api_key: str
     resend_email_address: str
     crawl_depth: str
+    tgi_endpoint_url: str = ""
+    tgi_api_key: str = ""
     
 
 settings = COREAPPSETTING(_env_file='.env', _env_file_encoding='utf-8')
@@ -1,7 +1,10 @@
-from typing import ClassVar, Dict, Optional
+import asyncio
+import json
+from typing import AsyncIterator, ClassVar, Dict, List, Optional
 from uuid import UUID
 
 import pandas as pd
+from langchain.embeddings.openai import OpenAIEmbeddings
 from pydantic import BaseModel
 from supabase.client import Client, create_client
 
@@ -9,9 +12,11 @@ from ally.agents.base import Agent
 from ally.environments.base import Environment, StaticEnvironment
 from ally.runtimes.base import Runtime
 from ally.runtimes.openai import OpenAIRuntime
+from ally.runtimes.tgi import TGIRuntime
 from ally.skills.base import RetrievalSkill, Skill, TransformSkill
 from ally.skills.skillset import LinearSkillSet
 from ally.utils.internal_data import InternalDataFrame_encoder
+from ally.utils.templates import compile_template
 from ally.vector_store.base import AllyVectorStore
 from app.core.settings import settings
 from app.llm.utils.retrieval_input_template_from_a_prompt import (
@@ -72,6 +77,12 @@ class BrainAgent(BaseModel):
 		)
 		return AllyVectorStore(vector_store=vector_store)
 
+	def _get_embeddings(self) -> OpenAIEmbeddings:
+		# the vectors of the brains are embedded with OpenAI, whatever the runtime
+		if isinstance(self.runtime, OpenAIRuntime):
+			return self.runtime.get_embeddings()
+		return OpenAIEmbeddings(openai_api_key=self.brain_settings.openai_api_key)
+
 	def _get_prompt_to_use(self) -> Prompt:
 		return prompt_service.get_prompt_by_id(self.brain_details.prompt_id)
 	
@@ -90,10 +101,21 @@ class BrainAgent(BaseModel):
 				api_key=brain_runtime.openai_api_key,
 			)
 		elif brain_runtime.type == RuntimeType.HuggingFace:
-				raise NotImplementedError
+			target_runtime = TGIRuntime(
+				endpoint_url=self.brain_settings.tgi_endpoint_url,
+				api_key=self.brain_settings.tgi_api_key or None,
+				model_name=brain_runtime.model,
+				max_new_tokens=brain_runtime.max_tokens,
+				temperature=brain_runtime.temperature,
+			)
 		else:
 			raise NotImplementedError
 		return target_runtime, brain_runtime.name
+
+	def _get_brain_input_columns(self, prompt: Prompt) -> List[str]:
+		"""Columns the brain skill can read: the fields of the prompt output by the input analyzer,
+		the chat history of the verified input and the context added by the retrieval."""
+		return [template.name for template in prompt.input_template] + ["chat_history", "context"]
 		
 	def _create_brain_skill(
 			self,
@@ -101,6 +123,9 @@ class BrainAgent(BaseModel):
 			vector_store: CustomSupabaseVectorStore) -> Skill:
 		input_template = retrieval_input_template_from_a_inout_template(
 			prompt.input_template)
+		query_input_fields = [template.name for template in prompt.input_template]
+		# braces in a field description add fields no skill produces: fail when the brain is loaded, not on the first answer
+		compile_template(input_template).validate(self._get_brain_input_columns(prompt))
 		return RetrievalSkill(
 			name=self.brain_details.name,
 			description=self.brain_details.description,
@@ -108,7 +133,7 @@ class BrainAgent(BaseModel):
 			input_template=input_template,
 			output_template=[dict(template) for template in prompt.output_template],
 			vector_store=vector_store,
-			query_input_fields=[template.name for template in prompt.input_template],
+			query_input_fields=query_input_fields,
 			query_output_field="context",
 		)
 	
@@ -131,10 +156,15 @@ class BrainAgent(BaseModel):
 		this will concatenate all the output from the last skill and output the 
 		result. this is used for learning purpose only
 		"""
+		analyzer_input_template = get_input_template_from_a_prompt_inout_template(input_template)
+		# the output analyzer runs after the brain skill, on its inputs and outputs
+		compile_template(analyzer_input_template).validate(
+			self._get_brain_input_columns(self.prompt)
+			+ [template["name"] for template in self.brain_skill.output_template])
 		return TransformSkill(
 			name='output_analyzer',
 			instruction_template="your task is to concatenate all the output from the last skill and output the single result",
-			input_template=get_input_template_from_a_prompt_inout_template(input_template),
+			input_template=analyzer_input_template,
 			output_template=[
 				{
 					"name": "final_prediction",
@@ -175,34 +205,22 @@ class BrainAgent(BaseModel):
 		self.supabase_client = self._create_supabase_client()
 		self.prompt = self._get_prompt_to_use()
 		self.runtime, self.runtime_name = self._create_runtime(runtime_type='student')
-		self.vector_store = self._create_vector_store(
-			self.runtime.get_embeddings())
+		self.vector_store = self._create_vector_store(self._get_embeddings())
 		self.brain_skill = self._create_brain_skill(self.prompt, self.vector_store)
 		self.input_analyzer_skill = self._create_input_analyzer_skill(
 			output_template=[dict(template) for template in self.prompt.input_template]
 		)
 		
-	def generate_answer(
-		self, chat_id: UUID, input: BrainAgentInput
-	) -> GetChatHistoryOutput:
-		"""Generate an answer to a question"""
-		agent = Agent(
-			skills=LinearSkillSet(
-				skills=[self.brain_skill],
-				skill_sequence=[self.brain_skill.name]
-			),
-			runtimes={
-				self.runtime_name: self.runtime,
-			}
-		)
+	def _get_verified_input(self, chat_id: UUID, input: BrainAgentInput) -> Dict:
 		transformed_history = chat_service.format_chat_history(
 			chat_service.get_enrich_chat_history(chat_id))
 		verified_input = dict(input)
 		verified_input["chat_history"] = transformed_history
-		verified_input_df = pd.DataFrame([verified_input])
-		prediction = InternalDataFrame_encoder(
-			agent.run(verified_input_df, self.runtime_name)
-		)[0]
+		return verified_input
+
+	def _save_answer(
+		self, chat_id: UUID, input: BrainAgentInput, prediction: Dict
+	) -> GetChatHistoryOutput:
 		answer = " ".join([prediction[template["name"]] for template in self.brain_skill.output_template])
 		new_chat = chat_service.update_chat_history(
 			CreateChatHistory(
@@ -226,6 +244,45 @@ class BrainAgent(BaseModel):
 				"message_id": new_chat.message_id
 			}
 		)
+
+	def generate_answer(
+		self, chat_id: UUID, input: BrainAgentInput
+	) -> GetChatHistoryOutput:
+		"""Generate an answer to a question"""
+		agent = Agent(
+			skills=LinearSkillSet(
+				skills=[self.brain_skill],
+				skill_sequence=[self.brain_skill.name]
+			),
+			runtimes={
+				self.runtime_name: self.runtime,
+			}
+		)
+		verified_input_df = pd.DataFrame([self._get_verified_input(chat_id, input)])
+		prediction = InternalDataFrame_encoder(
+			agent.run(verified_input_df, self.runtime_name)
+		)[0]
+		return self._save_answer(chat_id, input, prediction)
+
+	async def generate_answer_stream(
+		self, chat_id: UUID, input: BrainAgentInput
+	) -> AsyncIterator[str]:
+		"""Generate an answer to a question, streamed as server-sent events.
+
+		Every completion token is sent as `data: {"token": ...}` as soon as the runtime produces it.
+		Once the completion is parsed and saved to the chat history, the saved message is sent
+		as the last event, in the format returned by `generate_answer`.
+		"""
+		try:
+			verified_input = await asyncio.to_thread(self._get_verified_input, chat_id, input)
+			stream = await self.brain_skill.astream(verified_input, self.runtime)
+			async for token in stream:
+				yield f"data: {json.dumps({'token': token})}\n\n"
+			answer = await asyncio.to_thread(self._save_answer, chat_id, input, stream.output)
+			yield f"data: {answer.model_dump_json()}\n\n"
+		finally:
+			# the runtime is created for this agent, close its connections once the answer is streamed
+			await self.runtime.aclose()
 	
 	# def learn(
 	# 	self,
@@ -1,12 +1,14 @@
 
 
+import asyncio
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from modal import Function
 from modal.functions import FunctionCall
 
+from app.llm.brain_agent import BrainAgent
 from app.middlewares.auth.auth_bearer import AuthBearer, get_current_user
 from app.middlewares.auth.brain_authorization import \
     validate_brain_authorization
@@ -47,6 +49,39 @@ async def create_brain_input_handler(
 		return {"call_id": call.object_id}
 	except HTTPException as e:
 		raise e
+
+def _create_brain_agent(brain_id: UUID, current_user: UserIdentity) -> BrainAgent:
+	validate_brain_authorization(
+		brain_id=brain_id,
+		user_id=current_user.id,
+		required_roles=[RoleEnum.Viewer, RoleEnum.Editor, RoleEnum.Owner],
+	)
+	brain_detail = brain_service.get_brain_details(brain_id)
+	return BrainAgent(brain_details=brain_detail)
+
+@agent_router.post(
+	"/agent/chat/{chat_id}/stream",
+	dependencies=[
+		Depends(
+			AuthBearer(),
+		),
+	]
+)
+async def create_brain_input_stream_handler(
+	chat_id: UUID,
+	input: BrainAgentInput,
+	brain_id: UUID = Query(..., description="The ID of the brain"),
+	current_user: UserIdentity = Depends(get_current_user),
+) -> StreamingResponse:
+	"""
+	Add a new question to the chat and stream the answer tokens as server-sent events.
+	"""
+	# the brain lookups and the runtime, skills and vector store setup block, they run in a worker thread
+	brain_agent = await asyncio.to_thread(_create_brain_agent, brain_id, current_user)
+	return StreamingResponse(
+		brain_agent.generate_answer_stream(chat_id, input),
+		media_type="text/event-stream",
+	)
 	
 @agent_router.get(
 	"/modal/{call_id}",
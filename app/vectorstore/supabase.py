@@ -30,11 +30,22 @@ class CustomSupabaseVectorStore(SupabaseVectorStore):
         **kwargs: Any
     ) -> List[Document]:
         vectors = self._embedding.embed_documents([query])
-        query_embedding = vectors[0]
+        return self.similarity_search_by_vector(vectors[0], k=k, table=table, threshold=threshold, **kwargs)
+
+    def similarity_search_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 2,
+        table: str = "match_vectors",
+        threshold: float = 0.5,
+        **kwargs: Any
+    ) -> List[Document]:
+        """Returns the documents of the brain matching an embedded query, so batches of queries
+        can be embedded in bulk before being matched."""
         res = self._client.rpc(
             table,
             {
-                "query_embedding": query_embedding,
+                "query_embedding": embedding,
                 "match_count": k,
                 "p_brain_id": str(self.brain_id),
             },